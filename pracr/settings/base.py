@@ -53,6 +53,7 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + PROJECT_APPS
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'reviews.middleware.ViewMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -148,6 +149,125 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'static_root')
 
+
+# Cache
+# Company page fragments are cached under per-company content versions
+# (see reviews/caching.py), so they can be kept for long.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+# content versions and rate limit counters (see reviews/caching.py) are kept
+# in the 'counters' cache: shared by workers, with atomic incr and without
+# culling (memcached in production)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'counters': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'counters',
+    },
+}
+
+# maximum number of companies returned by search
+COMPANY_SEARCH_LIMIT = 50
+# matching of LinkedIn employers: candidates per name and confidence
+# from which a Position is associated with the Company without asking
+COMPANY_MATCH_CANDIDATES = 5
+COMPANY_MATCH_CONFIDENCE = 0.9
+# autocomplete: number of options, shortest term searched (as minLength
+# in scripts.js), shared cache and browser cache timeouts
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MIN_LENGTH = 3
+AUTOCOMPLETE_CACHE_TIMEOUT = 60 * 60
+AUTOCOMPLETE_MAX_AGE = 60 * 5
+
+# company browse page: companies per page, values shown per facet
+COMPANY_BROWSE_PER_PAGE = 20
+COMPANY_BROWSE_FACET_VALUES = 20
+
+# maximum number of Reviews and Interviews returned by full-text search
+CONTENT_SEARCH_LIMIT = 20
+
+# Per-view metrics (see reviews/middleware.py)
+# maximum number of queries per url name, exceeding it is logged as warning
+# (or fails the request if QUERY_BUDGET_RAISE is set, as in tests, see
+# pracr/test_runner.py)
+QUERY_BUDGETS = {
+    'home': 5,
+    'company_page': 10,
+    'review_items': 8,
+    'salary_items': 10,
+    'interview_items': 8,
+    'company_search': 3,
+    'company_browse': 3,
+    'content_search': 5,
+    'content_search_json': 5,
+}
+QUERY_BUDGET_RAISE = False
+TEST_RUNNER = 'pracr.test_runner.TestRunner'
+# number of requests per view over which latency percentiles are logged
+VIEW_METRICS_WINDOW = 200
+
+# Slow query recorder (see reviews/slow_queries.py), off if threshold is None
+SLOW_QUERY_THRESHOLD = None  # ms
+# fraction of slow SELECTs logged with EXPLAIN (ANALYZE, BUFFERS) plan
+SLOW_QUERY_EXPLAIN_RATE = 0.1
+# log most expensive statements after every n slow queries
+SLOW_QUERY_REPORT_EVERY = 100
+
+# Buffered writer of Visits and AccessAttempts (see reviews/events.py):
+# batch size, seconds between flushes, maximum number of waiting events.
+# Events are saved synchronously in tests (see pracr/test_runner.py).
+EVENT_WRITER_SYNC = False
+EVENT_BATCH_SIZE = 100
+EVENT_FLUSH_INTERVAL = 2
+EVENT_QUEUE_SIZE = 10000
+
+# Monthly partitions of Visits and AccessAttempts (see reviews/partitions.py):
+# months partitions are created ahead, full months kept before partitions
+# are dropped (daily totals in VisitDaily and AccessAttemptDaily are kept).
+PARTITION_MONTHS_AHEAD = 3
+EVENT_RETENTION_MONTHS = 13
+
+# Signed cookie with Companies viewed by anonymous users (see reviews/free_views.py)
+FREE_VIEWS_COOKIE = 'wolne'
+FREE_VIEWS_MAX_AGE = 7905600  # 3 months
+# expired sessions deleted per transaction by purge_sessions command
+SESSION_PURGE_BATCH = 1000
+
+# Verification of Company websites (see reviews/websites.py): timeouts in seconds,
+# seconds probe results are cached per domain, days before websites which
+# didn't respond are rechecked by verify_websites command, maximum number of
+# Companies waiting. Websites are probed synchronously in tests
+# (see pracr/test_runner.py).
+WEBSITE_VERIFY_SYNC = False
+WEBSITE_CONNECT_TIMEOUT = 3
+WEBSITE_READ_TIMEOUT = 5
+WEBSITE_MAX_REDIRECTS = 5
+WEBSITE_CHECK_CACHE_TIMEOUT = 86400
+WEBSITE_RECHECK_DAYS = 7
+WEBSITE_QUEUE_SIZE = 1000
+
+# directory of the saved profanity filter automaton (see reviews/profanities.py),
+# system temporary directory if None
+PROFANITIES_CACHE_DIR = None
+
+# Rate limits (see reviews/ratelimit.py), name: (number of actions, seconds,
+# counted per 'user', 'ip' or 'session')
+RATE_LIMITS = {
+    # submissions, robo spam prevention
+    'review': (5, 90 * 86400, 'user'),
+    'salary': (5, 90 * 86400, 'user'),
+    # one Interview per Company in 90 days (ratelimit.Cooldown)
+    'interview': (1, 90 * 86400, 'user'),
+    'contact': (3, 86400, 'ip'),
+    'content_search': (30, 60, 'ip'),
+}
+# META key of the header with client addresses set by reverse proxies in front
+# of Django (e.g. 'HTTP_X_FORWARDED_FOR') and number of those proxies;
+# REMOTE_ADDR is the client address if None
+RATE_LIMIT_IP_HEADER = None
+RATE_LIMIT_TRUSTED_PROXIES = 1
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "home"
 LOGOUT_REDIRECT_URL = "logged_out"
@@ -22,6 +22,17 @@ DATABASES = {
 
 STATIC_URL = '/static/'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pracr',
+    },
+    'counters': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'counters',
+    },
+}
+
 #admin docs
 INSTALLED_APPS += [
     'django.contrib.admindocs',
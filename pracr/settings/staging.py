@@ -33,19 +33,39 @@ SENDGRID_SANDBOX_MODE_IN_DEBUG = False
 #required by debug_toolbars
 INTERNAL_IPS += ['89.73.79.21', '']
 
+# file based cache of fragments is shared by all gunicorn workers on the node
+# (unlike locmem); it culls entries when full and its incr isn't atomic, so
+# versions and rate limit counters are kept in memcached, where a version bump
+# in one worker invalidates fragments cached by the others
+CACHE_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'cache')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
-    }
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_ROOT,
+        'TIMEOUT': FRAGMENT_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+    'counters': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+        'KEY_PREFIX': 'pracr',
+    },
 }
 
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 
+# HTTPS is terminated by the proxy, REMOTE_ADDR is its address
+RATE_LIMIT_IP_HEADER = 'HTTP_X_FORWARDED_FOR'
+
 
 LOG_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'log')
 HANDLERS_LIST = ['mail_admins', 'rotating_file', 'day_rotating_file']
 LOGLEVEL = os.environ.get('PRACOR_LOGLEVEL', 'ERROR').upper()
+if os.environ.get('PRACOR_SLOW_QUERY_MS'):
+    SLOW_QUERY_THRESHOLD = float(os.environ['PRACOR_SLOW_QUERY_MS'])
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -0,0 +1,26 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Run tests with settings of the test environment, whatever settings
+    module is used.
+    """
+    settings = {
+        # views exceeding settings.QUERY_BUDGETS fail
+        'QUERY_BUDGET_RAISE': True,
+        # background threads aren't started, events and websites are saved
+        # and verified by the request
+        'EVENT_WRITER_SYNC': True,
+        'WEBSITE_VERIFY_SYNC': True,
+    }
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.overridden = override_settings(**self.settings)
+        self.overridden.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.overridden.disable()
+        super().teardown_test_environment(**kwargs)
@@ -14,3 +14,17 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pracr.settings.staging")
 
 application = get_wsgi_application()
+
+# build company autocomplete and facet indexes at worker start rather than on first request
+from reviews.autocomplete import company_index
+from reviews.browse import company_facets
+for index in (company_index, company_facets):
+    try:
+        index.refresh()
+    except Exception:
+        import logging
+        logging.getLogger('reviews').exception('Company index not built')
+
+# load (or build) the profanity filter automaton used by item forms
+from reviews import profanities
+profanities.automaton()
@@ -3,7 +3,8 @@ from django.db import models
 from django.forms import RadioSelect, Textarea, TextInput, CheckboxSelectMultiple
 from django.utils import timezone
 
-from .models import Company, Interview, Position, Review, Salary, Benefit, AccessAttempt
+from .models import (Company, Interview, Position, Review, Salary, Benefit, AccessAttempt,
+                     AccessAttemptDaily)
 
 
 admin.site.site_header = 'pracor - administracja'
@@ -52,9 +53,10 @@ class InterviewInline(ItemInline):
 @admin.register(Company)
 class CompanyAdmin(ModelAdminModified):
     readonly_fields = ('count_reviews', 'count_salaries', 'count_interviews',
-                       'reviewer', 'date', 'reviewed_date', 'get_ratings', 'slug', 'date')
+                       'reviewer', 'date', 'reviewed_date', 'get_ratings', 'slug', 'date',
+                       'website_status', 'website_redirect', 'website_checked')
     search_fields = ['name', ]
-    list_display = ['date', 'id', 'name', 'headquarters_city', 'website',
+    list_display = ['date', 'id', 'name', 'headquarters_city', 'website', 'website_status',
                     #'count_reviews', 'count_salaries', 'count_interviews',
                     'approved', #'reviewer',
     ]
@@ -64,6 +66,7 @@ class CompanyAdmin(ModelAdminModified):
     fieldsets = (
         (None, {
             'fields': ('name', ('headquarters_city', 'website'),
+                       ('website_status', 'website_redirect', 'website_checked'),
                        'slug', 'date',
                        )
         }),
@@ -85,7 +88,7 @@ class CompanyAdmin(ModelAdminModified):
         The class is inherited so defining class variable overrides the superclass parameter.
         """
         super().__init__(*args, **kwargs)
-        self.list_filter += ('date',)
+        self.list_filter += ('date', 'website_status')
     
     def count_reviews(self, obj):
         return obj.reviews.count()
@@ -204,3 +207,13 @@ class BenefitAdmin(admin.ModelAdmin):
 class AttemptAdmin(admin.ModelAdmin):
     list_display = ['timestamp', 'path', 'referer', 'ip']
     readonly_fields = [field.name for field in AccessAttempt._meta.get_fields()]
+    date_hierarchy = 'timestamp'
+    show_full_result_count = False
+
+
+@admin.register(AccessAttemptDaily)
+class AttemptDailyAdmin(admin.ModelAdmin):
+    list_display = ['day', 'path', 'attempts']
+    readonly_fields = ['path', 'day', 'attempts']
+    search_fields = ['path']
+    date_hierarchy = 'day'
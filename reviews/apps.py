@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ReviewsConfig(AppConfig):
     name = 'reviews'
     verbose_name = 'główna aplikacja'
+
+    def ready(self):
+        import reviews.signals
+
+        from django.db.backends.signals import connection_created
+        from reviews.slow_queries import install
+        connection_created.connect(install)
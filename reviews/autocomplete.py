@@ -0,0 +1,137 @@
+"""
+In-process prefix index of Company names and domains for the search bar
+autocomplete. Every worker builds its own index on first use (or at start,
+see pracr/wsgi.py) and rebuilds it when catalog version changes, i.e. after
+a Company has been saved or deleted by any worker. The rebuild is done by
+one request of the worker, others meanwhile use the old index.
+"""
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .caching import catalog_version
+from .models import Company
+
+logger = logging.getLogger(__name__)
+
+# match ranks
+NAME, WORD, DOMAIN = range(3)
+
+
+def normalize(text):
+    """
+    Unidecoded, lower-cased text without legal form endings ('sa', 'sp. z o.o.' etc.).
+    """
+    return Company.slugify_name(text).replace('-', ' ')
+
+
+def normalize_term(term):
+    """
+    Normalize term typed into search bar, which can also be a website address.
+    """
+    if term.lower().startswith(('http', 'www.')):
+        term = Company.domain(term)
+    return normalize(term)
+
+
+class CompanyIndex:
+    """
+    Sorted list of (key, rank, pk) tuples, where keys are normalized names,
+    their words (so that 'polski' finds 'Bank Polski') and domains.
+    Prefix lookup is a bisect; results of a prefix are memoized until rebuild.
+    """
+
+    # maximum number of memoized prefixes
+    MEMO_SIZE = 10000
+
+    def __init__(self):
+        # keys, companies and memo are replaced together on rebuild
+        self.state = ([], {}, {})
+        self.version = None
+        self.lock = threading.Lock()
+        # held by the thread (re)building the index
+        self.building = threading.Lock()
+
+    def build(self, version=None):
+        keys = []
+        companies = {}
+        rows = Company.objects.values_list(
+            'pk', 'name', 'website_domain', 'slug', 'stats__review_count',
+            'stats__salary_count', 'stats__interview_count')
+        for pk, name, website_domain, slug, *counts in rows.iterator():
+            companies[pk] = {
+                'id': pk,
+                'label': name,
+                'value': name,
+                'slug': slug,
+                'popularity': sum(count or 0 for count in counts),
+                }
+            normalized = normalize(name)
+            keys.append((normalized, NAME, pk))
+            for index, character in enumerate(normalized):
+                if character == ' ' and index + 1 < len(normalized):
+                    keys.append((normalized[index + 1:], WORD, pk))
+            keys.append((normalize(website_domain or ''), DOMAIN, pk))
+        keys.sort()
+        with self.lock:
+            self.state = (keys, companies, {})
+            self.version = version
+        logger.info('Company autocomplete index built: {} companies, {} keys'.format(
+            len(companies), len(keys)))
+
+    def refresh(self):
+        """
+        Rebuild the index if the list of Companies has changed since last build.
+        Only one thread rebuilds it, others keep using the old index; there's
+        nothing to use before the first build, so that one is waited for.
+        Return whether the index is up to date.
+        """
+        version = catalog_version()
+        if version == self.version:
+            return True
+        if not self.building.acquire(blocking=self.version is None):
+            return False
+        try:
+            if version != self.version:
+                self.build(version)
+        finally:
+            self.building.release()
+        return True
+
+    def search(self, term, limit=None):
+        """
+        Return up to limit Companies (as autocomplete options) with names, words of names
+        or domains starting with term. Name matches come first, then more popular
+        Companies (by number of items).
+        """
+        limit = limit or settings.AUTOCOMPLETE_LIMIT
+        prefix = normalize_term(term)
+        if not prefix:
+            return []
+        keys, companies, memo = self.state
+        key = (prefix, limit)
+        options = memo.get(key)
+        if options is not None:
+            return options
+        best = {}
+        position = bisect_left(keys, (prefix,))
+        while position < len(keys) and keys[position][0].startswith(prefix):
+            _, rank, pk = keys[position]
+            if rank < best.get(pk, DOMAIN + 1):
+                best[pk] = rank
+            position += 1
+        top = heapq.nsmallest(limit, best.items(), key=lambda item: (
+            item[1], -companies[item[0]]['popularity'], len(companies[item[0]]['label']),
+            item[0]))
+        options = [{field: value for field, value in companies[pk].items()
+                    if field != 'popularity'} for pk, rank in top]
+        if len(memo) >= self.MEMO_SIZE:
+            memo.clear()
+        memo[key] = options
+        return options
+
+
+company_index = CompanyIndex()
@@ -0,0 +1,203 @@
+"""
+In-process facet index of Companies for the browse page.
+
+Every worker keeps sets of Company pk's for each value of the facet
+attributes, so that filtered lists and facet counts are set intersections
+rather than GROUP BY queries. The index is rebuilt when catalog version
+changes (a Company has been saved or deleted, which is rare). Numbers of
+reviews and scores used for sorting change with every item, they're
+updated incrementally from CompanyStats rows changed since last refresh.
+Lists sorted by them are sorted once until they change.
+"""
+import datetime
+import logging
+import threading
+from collections import OrderedDict
+
+from django.utils import timezone
+
+from .caching import catalog_version
+from .models import Company, CompanyStats
+
+logger = logging.getLogger(__name__)
+
+# field: (url parameter, label)
+FACETS = OrderedDict([
+    ('headquarters_city', ('miasto', 'Siedziba')),
+    ('region', ('wojewodztwo', 'Województwo')),
+    ('country', ('kraj', 'Kraj')),
+    ('employment', ('zatrudnienie', 'Zatrudnienie')),
+    ('public', ('notowane', 'Notowane')),
+    ('sectors', ('sektor', 'Sektor')),
+    ])
+
+# url value: (key, reverse)
+ORDERINGS = OrderedDict([
+    ('nazwa', ('name', False)),
+    ('opinie', ('review_count', True)),
+    ('ocena', ('score', True)),
+    ])
+
+# stats saved in a transaction that commits later can carry earlier
+# timestamp than the last one seen, so some are read twice
+STATS_OVERLAP = datetime.timedelta(minutes=1)
+
+
+def facet_values(field, value):
+    """
+    Return facet values of a Company attribute; sectors are a comma separated list.
+    """
+    if field == 'sectors':
+        return [sector.strip() for sector in (value or '').split(',') if sector.strip()]
+    if field == 'public':
+        return [] if value is None else ['tak' if value else 'nie']
+    if isinstance(value, str):
+        value = value.strip()
+    return [value] if value else []
+
+
+class CompanyFacets:
+    """
+    Postings {field: {value: set of pk's}} of all Companies with their sort keys.
+    Facet counts of filter combinations are memoized until rebuild, pk's sorted
+    by sort keys until they change.
+    """
+
+    # maximum number of memoized filter combinations
+    MEMO_SIZE = 1000
+
+    def __init__(self):
+        # companies, postings, pk's in order of names, memo, sorted pk's by
+        # sort key and time of the last stats read are replaced together
+        # on rebuild and on stats refresh
+        self.state = ({}, {}, [], {}, {}, None)
+        self.version = None
+        self.lock = threading.Lock()
+        # held by the thread rebuilding the index or refreshing stats
+        self.building = threading.Lock()
+
+    def build(self, version=None):
+        companies = {}
+        postings = {field: {} for field in FACETS}
+        rows = Company.objects.values_list('pk', 'name', 'slug', *FACETS)
+        for pk, name, slug, *values in rows.iterator():
+            companies[pk] = {'id': pk, 'name': name, 'slug': slug,
+                             'review_count': 0, 'score': None}
+            for field, value in zip(FACETS, values):
+                for facet_value in facet_values(field, value):
+                    postings[field].setdefault(facet_value, set()).add(pk)
+        order = sorted(companies, key=lambda pk: companies[pk]['name'].lower())
+        companies, changed, stats_updated = self.read_stats(companies, None)
+        with self.lock:
+            self.state = (companies, postings, order, {}, {}, stats_updated)
+            self.version = version
+        logger.info('Company facet index built: {} companies'.format(len(companies)))
+
+    def read_stats(self, companies, since):
+        """
+        Return copy of companies with numbers of reviews and scores of those
+        whose stats changed since the datetime (all if None), whether any
+        changed and time of the last change read. Companies (dicts) of the
+        current state are not modified, they're replaced.
+        """
+        stats = CompanyStats.objects.all()
+        if since is not None:
+            stats = stats.filter(updated__gte=since - STATS_OVERLAP)
+        changed = {}
+        last = since
+        for pk, review_count, total, updated in stats.values_list(
+                'company', 'review_count', 'overallscore_sum', 'updated').iterator():
+            company = companies.get(pk)
+            score = CompanyStats.average(total, review_count)
+            if company is not None and (company['review_count'], company['score']) != (
+                    review_count, score):
+                changed[pk] = dict(company, review_count=review_count, score=score)
+            if last is None or updated > last:
+                last = updated
+        if changed:
+            companies = dict(companies)
+            companies.update(changed)
+        return companies, bool(changed), last or timezone.now()
+
+    def refresh_stats(self):
+        """
+        Update numbers of reviews and scores of Companies changed since last
+        refresh; sorted pk's are kept if none changed.
+        """
+        companies, postings, order, memo, orders, stats_updated = self.state
+        companies, changed, stats_updated = self.read_stats(companies, stats_updated)
+        with self.lock:
+            self.state = (companies, postings, order, memo,
+                          {} if changed else orders, stats_updated)
+
+    def refresh(self):
+        """
+        Rebuild the index if the list of Companies has changed since last build,
+        otherwise update sort keys. Only one thread does it, others keep using
+        the current state; there's nothing to use before the first build,
+        so that one is waited for.
+        """
+        if not self.building.acquire(blocking=self.version is None):
+            return
+        try:
+            version = catalog_version()
+            if version != self.version:
+                self.build(version)
+            else:
+                self.refresh_stats()
+        finally:
+            self.building.release()
+
+    def select(self, filters):
+        """
+        Return set of pk's of Companies with all the {field: value} filters.
+        """
+        companies, postings, order, memo, orders, stats_updated = self.state
+        selected = None
+        for field, value in filters.items():
+            pks = postings[field].get(value, set())
+            selected = pks if selected is None else selected & pks
+        return set(companies) if selected is None else selected
+
+    def counts(self, filters):
+        """
+        Return {field: [(value, count), ...]} for Companies matching filters,
+        values with most Companies first.
+        """
+        companies, postings, order, memo, orders, stats_updated = self.state
+        key = tuple(sorted(filters.items()))
+        counts = memo.get(key)
+        if counts is not None:
+            return counts
+        selected = self.select(filters)
+        counts = OrderedDict()
+        for field, values in postings.items():
+            field_counts = [(value, len(pks & selected) if filters else len(pks))
+                            for value, pks in values.items()]
+            counts[field] = sorted([item for item in field_counts if item[1]],
+                                   key=lambda item: (-item[1], str(item[0])))
+        if len(memo) >= self.MEMO_SIZE:
+            memo.clear()
+        memo[key] = counts
+        return counts
+
+    def companies(self, filters, ordering='nazwa'):
+        """
+        Return list of Companies (dicts) matching filters in given order.
+        """
+        companies, postings, order, memo, orders, stats_updated = self.state
+        key, reverse = ORDERINGS.get(ordering, ORDERINGS['nazwa'])
+        if key != 'name':
+            ordered = orders.get(key)
+            if ordered is None:
+                # stable, so Companies with equal keys stay in order of names
+                ordered = orders[key] = sorted(
+                    order, key=lambda pk: companies[pk][key] or 0, reverse=reverse)
+            order = ordered
+        if filters:
+            selected = self.select(filters)
+            return [companies[pk] for pk in order if pk in selected]
+        return [companies[pk] for pk in order]
+
+
+company_facets = CompanyFacets()
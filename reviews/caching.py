@@ -0,0 +1,103 @@
+"""
+Content versions of Company pages used in fragment cache keys.
+Version is bumped whenever anything displayed on the page changes,
+so old fragments are never invalidated explicitly - they're just not
+looked up anymore and expire on their own.
+
+Catalog version does the same for the list of all Companies (names,
+websites), it's used by in-process search indexes of every worker.
+
+Vocabulary version of a Company does it for the cached lists of position
+titles, departments and locations offered by item form autocomplete.
+
+Versions are kept in the 'counters' cache rather than with the fragments:
+it has to be shared by all workers, increment atomically and not evict keys
+to make room for fragments (memcached in production).
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def counters():
+    """
+    Return cache of versions and rate limit counters.
+    """
+    return caches['counters']
+
+
+def company_version_key(company_pk):
+    return 'company_version:{}'.format(company_pk)
+
+
+def vocabulary_version_key(company_pk):
+    return 'vocabulary_version:{}'.format(company_pk)
+
+
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+def _version(key):
+    cache = counters()
+    version = cache.get(key)
+    if version is None:
+        # time based start value, so that expired versions are not reused
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, settings.FRAGMENT_CACHE_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def _bump(key):
+    try:
+        counters().incr(key)
+    except ValueError:
+        # key doesn't exist, next read will start a new version
+        pass
+
+
+def company_version(company_pk):
+    """
+    Return current content version of the Company page.
+    """
+    return _version(company_version_key(company_pk))
+
+
+def bump_company_version(company_pk):
+    """
+    Invalidate cached fragments of the Company page. Bumped again after
+    commit, so that a page rendered from not yet committed data in the
+    meantime doesn't get cached under the new version.
+    """
+    if company_pk is None:
+        return
+    key = company_version_key(company_pk)
+    _bump(key)
+    transaction.on_commit(lambda: _bump(key))
+
+
+def catalog_version():
+    """
+    Return current version of the list of Companies.
+    """
+    return _version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump(CATALOG_VERSION_KEY)
+    transaction.on_commit(lambda: _bump(CATALOG_VERSION_KEY))
+
+
+def vocabulary_version(company_pk):
+    """
+    Return current version of the Vocabulary of the Company.
+    """
+    return _version(vocabulary_version_key(company_pk))
+
+
+def bump_vocabulary_version(company_pk):
+    key = vocabulary_version_key(company_pk)
+    _bump(key)
+    transaction.on_commit(lambda: _bump(key))
@@ -0,0 +1,27 @@
+"""
+Display labels of model field choices resolved without database access.
+"""
+from django.apps import apps
+
+_labels = {}
+
+
+def choice_labels(model, field):
+    """
+    Return {value: label} dictionary built from choices of the model field.
+    Model is a model class or 'app_label.ModelName' string.
+    Dictionaries are built once per process.
+    """
+    if isinstance(model, str):
+        model = apps.get_model(model)
+    key = (model._meta.label_lower, field)
+    if key not in _labels:
+        _labels[key] = dict(model._meta.get_field(field).flatchoices)
+    return _labels[key]
+
+
+def choice_label(model, field, value, default=''):
+    """
+    Return display label of the value, default if value is not one of choices.
+    """
+    return choice_labels(model, field).get(value, default)
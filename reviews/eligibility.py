@@ -0,0 +1,49 @@
+"""
+Whether a user may add a Review or Salary for a Company, resolved in one query.
+"""
+import datetime
+
+from django.db import connection
+from django.utils import timezone
+
+from .models import Position
+
+# days before another item can be added for the same Position
+RESUBMIT_DAYS = 90
+
+
+class Eligibility:
+    """
+    User's latest Position at the Company, the item (Review or Salary) of that
+    Position if there is one and the number of user's items added since a date
+    (for the submissions rate limit).
+    """
+
+    def __init__(self, model, user, company, since):
+        self.model = model
+        position = Position._meta.db_table
+        items = model._meta.db_table
+        sql = (
+            'SELECT latest.id, item.date, '
+            '       (SELECT count(*) FROM {items} recent '
+            '        JOIN {position} recent_position ON recent_position.id = recent.position_id '
+            '        WHERE recent_position.user_id = %s AND recent.date > %s) '
+            'FROM (SELECT 1) AS one '
+            'LEFT JOIN LATERAL (SELECT id FROM {position} '
+            '                   WHERE company_id = %s AND user_id = %s '
+            '                   ORDER BY id DESC LIMIT 1) latest ON true '
+            'LEFT JOIN {items} item ON item.position_id = latest.id'
+            ).format(items=items, position=position)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, since, company.pk, user.pk])
+            self.position_id, self.item_date, self.recent = cursor.fetchone()
+
+    @property
+    def days_until_next(self):
+        """
+        Days until another item can be added for the Position, 0 if it can be now.
+        """
+        if self.item_date is None:
+            return 0
+        days = timezone.now() - self.item_date - datetime.timedelta(days=RESUBMIT_DAYS)
+        return -days.days if days.days < 0 else 0
@@ -0,0 +1,150 @@
+"""
+Buffered writer of Visits and AccessAttempts.
+
+Views only enqueue unsaved instances, a background thread of every worker
+saves them with bulk_create when EVENT_BATCH_SIZE of them are waiting or
+EVENT_FLUSH_INTERVAL seconds have passed, and on worker shutdown, so that
+page latency doesn't include an INSERT. Timestamps (auto_now_add) are
+set when the batch is saved, i.e. up to the flush interval late. A batch
+that fails is saved instance by instance, so that only invalid instances
+(e.g. Visits of a Company deleted meanwhile) are lost.
+With settings.EVENT_WRITER_SYNC (tests) instances are saved right away,
+also with bulk_create, so that managers overriding it (VisitManager) see
+every event.
+"""
+import atexit
+import ipaddress
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class EventWriter:
+
+    def __init__(self):
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.dropped = 0
+
+    def record(self, instance):
+        """
+        Save the unsaved model instance soon.
+        """
+        self.clean(instance)
+        if settings.EVENT_WRITER_SYNC:
+            type(instance).objects.bulk_create([instance])
+            return
+        with self.lock:
+            if len(self.queue) >= settings.EVENT_QUEUE_SIZE:
+                # database is not keeping up, drop the oldest rather than use up memory
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(instance)
+            waiting = len(self.queue)
+            self.start()
+        if waiting >= settings.EVENT_BATCH_SIZE:
+            self.wakeup.set()
+
+    @staticmethod
+    def clean(instance):
+        """
+        Cut strings to max_length of their fields (paths, user agents come from
+        requests) and drop invalid IP addresses, such values would fail the batch.
+        """
+        for field in instance._meta.concrete_fields:
+            value = getattr(instance, field.attname)
+            if not isinstance(value, str):
+                continue
+            if isinstance(field, models.GenericIPAddressField):
+                try:
+                    setattr(instance, field.attname, str(ipaddress.ip_address(value.strip())))
+                except ValueError:
+                    setattr(instance, field.attname, None)
+            elif field.max_length and len(value) > field.max_length:
+                setattr(instance, field.attname, value[:field.max_length])
+
+    def start(self):
+        """
+        Start flushing thread, also in a process forked after it had been started.
+        """
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.run, name='event-writer', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(settings.EVENT_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                logger.exception('Flushing events failed')
+
+    def flush(self):
+        """
+        Save all waiting instances, one bulk_create per model and batch.
+        """
+        with self.lock:
+            instances = list(self.queue)
+            self.queue.clear()
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            logger.warning('Event queue full, {} events dropped'.format(dropped))
+        if not instances:
+            return
+        by_model = OrderedDict()
+        for instance in instances:
+            by_model.setdefault(type(instance), []).append(instance)
+        for model, objects in by_model.items():
+            for start in range(0, len(objects), settings.EVENT_BATCH_SIZE):
+                self.save(model, objects[start:start + settings.EVENT_BATCH_SIZE])
+
+    @staticmethod
+    def save(model, objects):
+        """
+        Save a batch in one transaction, if it fails save instances one by one.
+        """
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(objects)
+            return
+        except Exception:
+            logger.warning('Saving {} {} failed, saving one by one'.format(
+                len(objects), model._meta.verbose_name_plural), exc_info=True)
+        lost = 0
+        for instance in objects:
+            # ids are set if the batch failed on commit (deferred constraints)
+            instance.pk = None
+            try:
+                with transaction.atomic():
+                    model.objects.bulk_create([instance])
+            except Exception:
+                lost += 1
+        if lost:
+            logger.error('{} of {} {} not saved'.format(
+                lost, len(objects), model._meta.verbose_name_plural))
+
+    def drain(self):
+        """
+        Save waiting instances on worker shutdown.
+        """
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Draining events failed')
+
+
+event_writer = EventWriter()
+atexit.register(event_writer.drain)
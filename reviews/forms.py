@@ -320,6 +320,11 @@ class InterviewForm(forms.ModelForm):
             'rating': 'Jak oceniasz całość doświadczenia rekrutacyjnego w firmie.',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['position'].widget.attrs['class'] = 'auto-position'
+        self.fields['department'].widget.attrs['class'] = 'auto-position'
+
     def clean_position(self):
         return self.cleaned_data['position'].title()
 
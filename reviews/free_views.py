@@ -0,0 +1,43 @@
+"""
+Company profiles viewed by anonymous users before they have to register.
+
+The pk's are kept in a signed cookie rather than in the session, so that
+browsing anonymously (mostly crawlers) neither creates nor rewrites rows
+of django_session. The cookie is set only when a new Company is viewed.
+"""
+from django.conf import settings
+
+SALT = 'reviews.free_views'
+
+
+class FreeViews:
+    """
+    Set of pk's of Companies viewed by an anonymous user.
+    """
+
+    def __init__(self, request):
+        value = request.get_signed_cookie(settings.FREE_VIEWS_COOKIE, default='', salt=SALT)
+        try:
+            self.companies = [int(pk) for pk in value.split('.') if pk]
+        except ValueError:
+            self.companies = []
+        self.changed = False
+
+    def __len__(self):
+        return len(self.companies)
+
+    def add(self, company_pk, limit):
+        """
+        Record viewed Company; no more than limit + 1 are needed by the gate.
+        """
+        if company_pk not in self.companies and len(self.companies) <= limit:
+            self.companies.append(company_pk)
+            self.changed = True
+
+    def save(self, response):
+        if self.changed:
+            response.set_signed_cookie(
+                settings.FREE_VIEWS_COOKIE, '.'.join(str(pk) for pk in self.companies),
+                salt=SALT, max_age=settings.FREE_VIEWS_MAX_AGE, httponly=True,
+                secure=settings.SESSION_COOKIE_SECURE)
+            self.changed = False
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from reviews.models import Company
+from reviews.percentiles import calculate_percentiles
+
+
+class Command(BaseCommand):
+    help = ('Compare latency of the old unaccent icontains company search '
+            'with the trigram indexed search.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*',
+                            help='search terms (default: fragments of company names)')
+        parser.add_argument('--samples', type=int, default=30,
+                            help='number of terms taken from company names')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='number of runs of every term')
+
+    def handle(self, *args, **options):
+        terms = options['terms'] or self.sample_terms(options['samples'])
+        searches = [
+            ('icontains', lambda term: list(Company.objects.filter(
+                Q(name__unaccent__icontains=term) | Q(website__unaccent__icontains=term)))),
+            ('trigram', lambda term: list(Company.objects.search(term))),
+            ]
+        self.stdout.write('{} companies, {} terms, {} runs each'.format(
+            Company.objects.count(), len(terms), options['repeat']))
+        for name, search in searches:
+            timings = []
+            for term in terms:
+                for i in range(options['repeat']):
+                    start = time.perf_counter()
+                    search(term)
+                    timings.append(int((time.perf_counter() - start) * 1000000))
+            result = calculate_percentiles(sorted(timings))
+            self.stdout.write('{:10} {}'.format(name, ' '.join(
+                '{}: {:.2f}ms'.format(key, value / 1000) for key, value in result.items())))
+
+    def sample_terms(self, number):
+        """
+        Return fragments of company names as users type them: prefixes
+        of first word and whole second words.
+        """
+        terms = []
+        for name in Company.objects.order_by('?').values_list('name', flat=True)[:number]:
+            words = name.split()
+            terms.append(words[0][:4])
+            if len(words) > 1:
+                terms.append(words[1])
+        return terms
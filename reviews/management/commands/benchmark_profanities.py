@@ -0,0 +1,97 @@
+import csv
+import os
+import random
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from reviews import profanities
+from reviews.percentiles import calculate_percentiles
+from reviews.models import Review
+
+# filler of generated texts when there are not enough Reviews
+FILLER = ('praca atmosfera zespół kierownik wynagrodzenie premia urlop szkolenia '
+          'rozwój awans biuro dojazd projekt klient nadgodziny umowa benefity '
+          'elastyczne godziny dobra firma słaba organizacja').split()
+
+
+class RegexFilter:
+    """
+    Previous implementation of validators.ProfanitiesFilter: one alternation
+    of all words, then words of the text searched for every match.
+    """
+
+    def __init__(self):
+        words = ''
+        with open(os.path.join(profanities.DIRECTORY, 'prof_fil_broad.txt'), encoding='utf-8') as f:
+            for item in csv.reader(f, delimiter='\n'):
+                words += item[0] + '|'
+        with open(os.path.join(profanities.DIRECTORY, 'prof_fil.txt'), encoding='utf-8') as f:
+            for item in csv.reader(f, delimiter='\n'):
+                words += '\\b{}\\b|'.format(item[0])
+        self.pattern = re.compile(words, re.IGNORECASE)
+
+    def find(self, value):
+        matches = [match for match in self.pattern.findall(value) if match != '']
+        found = set()
+        for word in value.split(' '):
+            for match in matches:
+                if match in word:
+                    found.add(word.lower().rstrip(',!?:;.'))
+        return found
+
+
+class Command(BaseCommand):
+    help = ('Compare latency of the regex profanity filter with the automaton '
+            'on texts of given sizes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000, 100000],
+                            help='text sizes in characters')
+        parser.add_argument('--rate', type=float, default=0.01,
+                            help='fraction of words replaced with profanities')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='number of runs of every text')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        automaton = profanities.Automaton(profanities.load_words())
+        self.stdout.write('automaton built in {:.2f}ms, {} states'.format(
+            (time.perf_counter() - start) * 1000, len(automaton.goto)))
+        start = time.perf_counter()
+        profanities.automaton()
+        self.stdout.write('automaton loaded in {:.2f}ms'.format(
+            (time.perf_counter() - start) * 1000))
+
+        regex = RegexFilter()
+        vocabulary = self.vocabulary()
+        bad = [word for word, whole in profanities.load_words()]
+        for size in options['sizes']:
+            text = self.text(size, vocabulary, bad, options['rate'])
+            self.stdout.write('{} characters'.format(len(text)))
+            for name, search in [('regex', regex.find), ('automaton', automaton.find)]:
+                timings = []
+                for i in range(options['repeat']):
+                    start = time.perf_counter()
+                    found = search(text)
+                    timings.append(int((time.perf_counter() - start) * 1000000))
+                result = calculate_percentiles(sorted(timings))
+                self.stdout.write('  {:10} {} words found, {}'.format(name, len(found), ' '.join(
+                    '{}: {:.2f}ms'.format(key, value / 1000) for key, value in result.items())))
+
+    def vocabulary(self):
+        words = []
+        for pros, cons in Review.objects.values_list('pros', 'cons')[:1000]:
+            words.extend(pros.split())
+            words.extend(cons.split())
+        return words if len(words) > 100 else FILLER
+
+    def text(self, size, vocabulary, bad, rate):
+        words = []
+        length = 0
+        while length < size:
+            word = random.choice(bad if random.random() < rate else vocabulary)
+            words.append(word)
+            length += len(word) + 1
+        return ' '.join(words)
@@ -0,0 +1,41 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reviews.models import AccessAttemptDaily
+from reviews.partitions import drop_partitions, ensure_partitions, expired_partitions
+from users.models import VisitDaily
+
+
+class Command(BaseCommand):
+    help = ('Create partitions of Visits and AccessAttempts for coming months, '
+            'roll up finished days into daily totals and drop partitions '
+            'older than EVENT_RETENTION_MONTHS. Run daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', action='store_true',
+                            help="don't drop expired partitions")
+
+    def handle(self, *args, **options):
+        for name in ensure_partitions(settings.PARTITION_MONTHS_AHEAD):
+            self.stdout.write('Created partition {}.'.format(name))
+
+        yesterday = timezone.localdate() - datetime.timedelta(days=1)
+        for model in (VisitDaily, AccessAttemptDaily):
+            days = model.objects.pending_days(yesterday)
+            if days:
+                rows = model.objects.rollup(*days)
+                self.stdout.write('{}: rolled up {:%Y-%m-%d} - {:%Y-%m-%d}, {} rows.'.format(
+                    model._meta.verbose_name_plural, days[0], days[1], rows))
+
+        # totals of expired months have been rolled up above
+        expired = expired_partitions(settings.EVENT_RETENTION_MONTHS)
+        if options['keep']:
+            for name in expired:
+                self.stdout.write('Expired partition {} kept.'.format(name))
+        else:
+            drop_partitions(expired)
+            for name in expired:
+                self.stdout.write('Dropped partition {}.'.format(name))
@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = ('Delete expired sessions in small batches, each in its own short '
+            'transaction, skipping rows locked by requests. Unlike clearsessions '
+            "it doesn't hold locks on the whole set of expired sessions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=settings.SESSION_PURGE_BATCH,
+                            help='sessions deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        table = Session._meta.db_table
+        sql = ('DELETE FROM {0} WHERE session_key IN ('
+               'SELECT session_key FROM {0} WHERE expire_date < now() '
+               'LIMIT %s FOR UPDATE SKIP LOCKED)').format(table)
+        deleted = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [options['batch']])
+                batch = cursor.rowcount
+            deleted += batch
+            if batch < options['batch']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write('Deleted {} expired sessions.'.format(deleted))
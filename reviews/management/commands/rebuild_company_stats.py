@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reviews.models import CompanyStats
+
+
+class Command(BaseCommand):
+    help = 'Recalculate CompanyStats from Reviews, Salaries and Interviews.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('companies', nargs='*', type=int,
+                            help='pk of Company to rebuild (default: all)')
+
+    def handle(self, *args, **options):
+        stats = CompanyStats.objects.rebuild(options['companies'] or None)
+        self.stdout.write('Rebuilt statistics for {} companies.'.format(len(stats)))
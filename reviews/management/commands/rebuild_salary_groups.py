@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from reviews.models import SalaryGroup
+
+
+class Command(BaseCommand):
+    help = 'Recalculate SalaryGroups from selected Salaries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('companies', nargs='*', type=int,
+                            help='pk of Company to rebuild (default: all)')
+
+    def handle(self, *args, **options):
+        groups = SalaryGroup.objects.rebuild(options['companies'] or None)
+        self.stdout.write('Rebuilt {} salary groups.'.format(len(groups)))
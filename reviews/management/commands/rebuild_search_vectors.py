@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from reviews.models import Interview, Review
+
+
+class Command(BaseCommand):
+    help = 'Index content of Reviews and Interviews for full-text search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='reindex all items (default: only not indexed yet)')
+        parser.add_argument('--batch', type=int, default=1000,
+                            help='number of items updated by one statement')
+
+    def handle(self, *args, **options):
+        for model in (Review, Interview):
+            items = model.objects.all()
+            if not options['all']:
+                items = items.filter(search_vector__isnull=True)
+            pks = list(items.order_by('pk').values_list('pk', flat=True))
+            updated = 0
+            for start in range(0, len(pks), options['batch']):
+                batch = pks[start:start + options['batch']]
+                updated += model.objects.update_search_vectors(pk__in=batch)
+            self.stdout.write('Indexed {} {}.'.format(
+                updated, model._meta.verbose_name_plural.lower()))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from reviews.models import Vocabulary
+
+
+class Command(BaseCommand):
+    help = ('Recalculate position, department and location vocabularies '
+            'of Companies from Positions and Interviews.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('companies', nargs='*', type=int,
+                            help='pk of Company to rebuild (default: all)')
+
+    def handle(self, *args, **options):
+        entries = Vocabulary.objects.rebuild(options['companies'] or None)
+        self.stdout.write('Rebuilt vocabularies: {} terms.'.format(len(entries)))
@@ -0,0 +1,40 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from reviews import websites
+from reviews.models import Company
+
+
+class Command(BaseCommand):
+    help = ('Verify websites of Companies not verified yet and recheck those, '
+            'which didn\'t respond WEBSITE_RECHECK_DAYS ago. Run daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='recheck websites of all Companies')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='number of websites probed at once')
+
+    def handle(self, *args, **options):
+        companies = Company.objects.all()
+        if not options['all']:
+            recheck = timezone.now() - datetime.timedelta(days=settings.WEBSITE_RECHECK_DAYS)
+            companies = companies.filter(
+                Q(website_status=Company.WEBSITE_UNVERIFIED) |
+                Q(website_status=Company.WEBSITE_FAILED, website_checked__lt=recheck))
+        companies = list(companies.only('website', 'website_domain').order_by('pk'))
+        # websites are probed in threads (results cached per domain), saved here
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            probed = executor.map(lambda company: websites.check(company.website), companies)
+            statuses = {}
+            for company, _ in zip(companies, probed):
+                status = websites.verify(company)
+                statuses[status] = statuses.get(status, 0) + 1
+        self.stdout.write('Verified {} websites: {}.'.format(len(companies), ', '.join(
+            '{} {}'.format(count, dict(Company.WEBSITE_STATUS)[status])
+            for status, count in sorted(statuses.items()))))
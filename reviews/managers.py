@@ -1,6 +1,18 @@
-from django.db import models
-from django.db.models import Avg, Max, Min, Count, Sum, Aggregate, F, Q
+import datetime
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import (Avg, Max, Min, Count, Sum, Aggregate, F, Q, Case, When,
+                              Func, Value)
 from django.contrib.postgres.aggregates.general import StringAgg
+from django.contrib.postgres.search import SearchRank
+from django.core.cache import cache
+from django.utils import timezone
+
+from .caching import bump_vocabulary_version, vocabulary_version
+from .search import (Headline, PrefixSearchQuery, search_document, search_terms,
+                     search_vector)
 
 class ArrayAgg(Aggregate):
     """
@@ -18,6 +30,17 @@ class ArrayAgg(Aggregate):
         return value
 
 
+class SearchNormalize(Func):
+    """
+    Unaccented, lower-cased text (IMMUTABLE function created in migration 0085,
+    Company name and website are trigram-indexed on it).
+    """
+    function = 'search_normalize'
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, output_field=models.TextField(), **extra)
+
+
 class SelectedManager(models.Manager):
     """
     Modify standard manager to exclude items that have been 'censored'
@@ -28,6 +51,32 @@ class SelectedManager(models.Manager):
     def selected(self, **kwargs):
         return self.filter(**kwargs).exclude(approved=False)
 
+
+class ContentManager(SelectedManager):
+    """
+    Full-text search of Reviews and Interviews (see search.py).
+    """
+    use_for_related_fields = True
+
+    def update_search_vectors(self, **kwargs):
+        """
+        Recalculate search documents of items matching kwargs.
+        """
+        return self.filter(**kwargs).update(search_vector=search_vector(self.model))
+
+    def search(self, text):
+        """
+        Selected items containing all words of the text, best matches first,
+        annotated with rank and headline (matched fragments).
+        """
+        if not search_terms(text):
+            return self.none()
+        query = PrefixSearchQuery(text)
+        return self.selected(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=Headline(search_document(self.model), query),
+            ).order_by('-rank', '-date', '-id')
+
     
 class SalaryManager(SelectedManager):
     """
@@ -39,38 +88,21 @@ class SalaryManager(SelectedManager):
         """
         This is what is presented for Company.salaries.
 
-        Groups lack benefits - many to many field
-        (they are fetched separately in a template filter),
-        because adding this annotation screws up Count to include 
-        the number of m2m fields in salary_count.
-        """
-        return self.selected(**kwargs).values(
-            'position__position',
-            'position__location',
-            'position__department',
-            'position__employment_status',
-            'contract_type',
-            'currency',
-            'period',
-            ).annotate(
-                salary_min = Min('salary_gross_input_period'),
-                salary_avg = Avg('salary_gross_input_period', output_field=models.IntegerField()),
-                salary_max = Max('salary_gross_input_period'),
-                salary_count = Count('salary_gross_input_period'),
-                bonus_min = Min('bonus_gross_input_period'),
-                bonus_avg = Avg('bonus_gross_input_period', output_field=models.IntegerField()),
-                bonus_max = Max('bonus_gross_input_period'),
-                bonus_count = Count('bonus_gross_input_period'),
-                bonus_annual_min = Min('bonus_gross_annual'),
-                bonus_annual_avg = Avg('bonus_gross_annual', output_field=models.IntegerField()),
-                bonus_annual_max = Max('bonus_gross_annual'),
-                bonus_annual_count = Count('bonus_gross_annual'),
-                #distinct=True available only in Django2.0, that's why ArrayAgg is overriden
-                bonus_periods = ArrayAgg('bonus_period', distinct=True),
-                salary_object_list = ArrayAgg('id', distinct=True)
-        )
+        Groups are read from SalaryGroup table (maintained on every Salary change)
+        with the same keys the grouping query used to return.
+        Benefits come as a list of distinct names.
+        """
+        SalaryGroup = self.model._meta.apps.get_model('reviews', 'SalaryGroup')
+        aliases = {lookup: F(dimension)
+                   for dimension, lookup in SalaryGroup.DIMENSIONS.items()
+                   if dimension != lookup}
+        fields = ['id'] + [dimension for dimension, lookup in SalaryGroup.DIMENSIONS.items()
+                            if dimension == lookup]
+        for metric in SalaryGroup.METRICS:
+            fields += [metric + suffix for suffix in ('_min', '_avg', '_max', '_count')]
+        fields += ['bonus_periods', 'benefits', 'percentiles']
+        return SalaryGroup.objects.filter(**kwargs).values(*fields, **aliases)
 
-    
     def sums(self, **kwargs):
         """
         Return average, min and max of all monthly salaries in the company.
@@ -82,3 +114,486 @@ class SalaryManager(SelectedManager):
             sum_count = Count('salary_input'),
             )
 
+
+class CompanyStatsManager(models.Manager):
+    """
+    Maintain CompanyStats: incrementally on every change of a Review, Salary
+    or Interview and in bulk on request.
+    """
+
+    def record_change(self, old, new):
+        """
+        Move contribution of an item from its old to its new state, which
+        can be of another Company. Either state can be None (item created
+        or deleted). Items rejected by moderators don't count.
+        """
+        if old is not None and not old.selected:
+            old = None
+        if new is not None and not new.selected:
+            new = None
+        if old is None and new is None:
+            return
+        companies = {item.company_id for item in (old, new) if item is not None}
+        with transaction.atomic():
+            # rows of two Companies are locked in pk order, so that opposite
+            # moves don't deadlock; missing rows are created on first read
+            # (see for_company)
+            stats = {row.company_id: row for row in self.select_for_update().filter(
+                company_id__in=companies).order_by('company_id')}
+            if old is not None and old.company_id in stats:
+                stats[old.company_id].remove(old)
+            if new is not None and new.company_id in stats:
+                stats[new.company_id].add(new)
+            for row in stats.values():
+                row.save()
+
+    def for_company(self, company):
+        """
+        Return CompanyStats of the company, building it if it doesn't exist yet.
+        """
+        try:
+            return company.stats
+        except self.model.DoesNotExist:
+            company.stats = self.rebuild(companies=[company.pk])[0]
+            return company.stats
+
+    def rebuild(self, companies=None):
+        """
+        Recalculate statistics from scratch for all Companies or only for
+        Companies with given pk's. Uses one grouped query per item type.
+        """
+        from .models import Company, Review, Salary, Interview
+
+        filters = {}
+        company_pks = Company.objects.values_list('pk', flat=True)
+        if companies is not None:
+            filters['company__in'] = companies
+            company_pks = company_pks.filter(pk__in=companies)
+
+        scores = {score + '_sum': Sum(score) for score in self.model.SCORES}
+        groups = [
+            Review.objects.selected(**filters).values('company').annotate(
+                review_count=Count('id'), **scores),
+            Salary.objects.selected(**filters).values('company').annotate(
+                salary_count=Count('id'),
+                salary_annual_sum=Sum('salary_gross_annual'),
+                salary_annual_values=ArrayAgg('salary_gross_annual'),
+                bonus_annual_values=ArrayAgg('bonus_gross_annual')),
+            Interview.objects.selected(**filters).values('company').annotate(
+                interview_count=Count('id'),
+                interview_rating_sum=Sum('rating')),
+            ]
+        totals = {}
+        for group in groups:
+            for row in group:
+                totals.setdefault(row.pop('company'), {}).update(row)
+
+        stats = [self.model(company_id=pk, **totals.get(pk, {})) for pk in company_pks]
+        for item in stats:
+            for name in self.model.DISTRIBUTIONS:
+                values = getattr(item, name + '_values')
+                setattr(item, name + '_values',
+                        sorted(value for value in values if value is not None))
+            item.refresh_percentiles()
+        with transaction.atomic():
+            if companies is None:
+                self.all().delete()
+            else:
+                self.filter(company__in=companies).delete()
+            self.bulk_create(stats, batch_size=1000)
+        return stats
+
+
+class SalaryGroupManager(models.Manager):
+    """
+    Maintain SalaryGroup: incrementally on every change of a Salary
+    and in bulk on request.
+    """
+
+    def record_change(self, old, new):
+        """
+        Move Salary from the group of its old state to the group of its new state.
+        Either state can be None (Salary created or deleted). Salaries rejected
+        by moderators don't count. Adding is incremental, removal recalculates
+        the group, because min/max can't be reverted.
+        """
+        if old is not None and not old.selected:
+            old = None
+        if new is not None and not new.selected:
+            new = None
+        if old is None and new is None:
+            return
+        if old is not None and new is not None and old.position_id == new.position_id:
+            old.position = new.position
+        with transaction.atomic():
+            if old is not None:
+                self.refresh_group(self.model.key(old))
+            if new is not None:
+                self.add_salaries(self.model.key(new), [new])
+
+    def move_position(self, previous, position):
+        """
+        Move selected Salaries of the Position from groups of its previous state
+        to groups of its current state.
+        """
+        from .models import Salary
+
+        salaries = list(Salary.objects.selected().filter(position=position))
+        if not salaries:
+            return
+        old_keys = {}
+        new_keys = OrderedDict()
+        for salary in salaries:
+            key = self.model.key(salary)
+            new_keys.setdefault(tuple(sorted(key.items())), (key, []))[1].append(salary)
+            salary.position = previous
+            # Salaries are normally moved together with the Position
+            for company in (salary.company_id, previous.company_id):
+                key = dict(self.model.key(salary), company_id=company)
+                old_keys[tuple(sorted(key.items()))] = key
+            salary.position = position
+        with transaction.atomic():
+            for key in old_keys.values():
+                self.refresh_group(key)
+            for key, added in new_keys.values():
+                self.add_salaries(key, added)
+
+    def refresh_group(self, key):
+        """
+        Recalculate the group of the key, deleted if it has no Salaries left.
+        Removal recalculates the group, because min/max can't be reverted.
+        """
+        group = self.select_for_update().filter(**key).first()
+        if group is not None:
+            group.refresh()
+            if group.salary_count:
+                group.save()
+            else:
+                group.delete()
+
+    def add_salaries(self, key, salaries):
+        """
+        Add Salaries not in the group of the key yet to it.
+        """
+        group = self.locked_group(key)
+        grouped = set(group.salary_object_list)
+        added = [salary for salary in salaries if salary.pk not in grouped]
+        if added:
+            for salary in added:
+                group.add(salary)
+            group.finish()
+            group.refresh_benefits()
+            group.save()
+
+    def locked_group(self, key):
+        """
+        Return the group of the key locked for update, created if there isn't one.
+        When another transaction creates it at the same time, creation fails
+        in a savepoint and the group created by the other one is returned.
+        """
+        group = self.select_for_update().filter(**key).first()
+        if group is None:
+            try:
+                with transaction.atomic():
+                    group = self.create(**key)
+            except IntegrityError:
+                group = self.select_for_update().get(**key)
+        return group
+
+    def refresh_benefits(self, salaries):
+        """
+        Recalculate benefits of groups containing Salaries with given pk's.
+        """
+        with transaction.atomic():
+            for group in self.select_for_update().filter(salary_object_list__overlap=list(salaries)):
+                group.refresh_benefits()
+                group.save(update_fields=['benefits'])
+
+    def rebuild(self, companies=None):
+        """
+        Recalculate all SalaryGroups (or only for Companies with given pk's)
+        with one pass over selected Salaries.
+        """
+        from .models import Salary
+
+        salaries = Salary.objects.selected().select_related('position').order_by('pk')
+        groups = self.all()
+        if companies is not None:
+            salaries = salaries.filter(company__in=companies)
+            groups = groups.filter(company__in=companies)
+        rebuilt = {}
+        for salary in salaries.iterator():
+            key = self.model.key(salary)
+            group_key = tuple(sorted(key.items()))
+            if group_key not in rebuilt:
+                rebuilt[group_key] = self.model(**key)
+            rebuilt[group_key].add(salary)
+        for group in rebuilt.values():
+            group.finish()
+        benefits = {}
+        for salary, name in Salary.benefits.through.objects.filter(
+                salary__in=salaries).values_list('salary', 'benefit__name'):
+            benefits.setdefault(salary, set()).add(name)
+        for group in rebuilt.values():
+            group.benefits = sorted(set().union(
+                *[benefits.get(salary, set()) for salary in group.salary_object_list]))
+        with transaction.atomic():
+            groups.delete()
+            self.bulk_create(rebuilt.values(), batch_size=1000)
+        return list(rebuilt.values())
+
+
+class CompanyManager(SelectedManager):
+
+    def search(self, searchterm, limit=None):
+        """
+        Return Companies whose name or website contains searchterm, or whose name
+        is similar to it (pg_trgm), ignoring case and Polish characters.
+        Exact matches come first, then prefix matches, then by similarity.
+        Both conditions are served by trigram indexes.
+        """
+        term = SearchNormalize(Value(searchterm))
+        results = self.annotate(
+            name_search=SearchNormalize('name'),
+            website_search=SearchNormalize('website'),
+        ).filter(
+            Q(name_search__contains=term) |
+            Q(website_search__contains=term) |
+            Q(name_search__trigram_similar=term)
+        ).annotate(
+            match=Case(When(name_search=term, then=Value(0)),
+                       When(name_search__startswith=term, then=Value(1)),
+                       default=Value(2), output_field=models.IntegerField()),
+            similarity=Func(F('name_search'), term, function='SIMILARITY',
+                            output_field=models.FloatField()),
+        ).order_by('match', '-similarity', 'name')
+        return results[:limit or settings.COMPANY_SEARCH_LIMIT]
+
+    def match(self, names, limit=None):
+        """
+        Return {name: [(company, confidence), ...]} of Companies most likely
+        meant by each of the names (e.g. employers from LinkedIn profile),
+        best first. All names are matched in one query: by trigram similarity
+        of names and by domain of website, ignoring case, Polish characters
+        and legal form endings.
+        Confidence is 1 for equal names, 0.9 if the name is the domain
+        and similarity of names otherwise.
+        """
+        from .autocomplete import normalize
+
+        names = list(OrderedDict.fromkeys(names))
+        terms = [normalize(name) for name in names]
+        # website has to contain the name without spaces, short names match too much
+        domains = [term.replace(' ', '') if len(term) > 3 else None for term in terms]
+        companies = self.raw(
+            """
+            SELECT company.*, term.position AS match_position, found.score AS match_score
+            FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY
+                AS term(name, domain, position)
+            CROSS JOIN LATERAL (
+                SELECT id, GREATEST(similarity(search_normalize(name), term.name),
+                                    word_similarity(term.name, search_normalize(name))) AS score
+                FROM reviews_company
+                WHERE search_normalize(name) %% term.name
+                    OR term.name <%% search_normalize(name)
+                    OR search_normalize(website) LIKE '%%' || term.domain || '%%'
+                ORDER BY score DESC, id
+                LIMIT %s
+            ) AS found
+            JOIN reviews_company AS company ON company.id = found.id
+            """, [terms, domains, limit or settings.COMPANY_MATCH_CANDIDATES])
+
+        matches = {name: [] for name in names}
+        for company in companies:
+            term = terms[company.match_position - 1]
+            if normalize(company.name) == term:
+                confidence = 1.0
+            elif normalize((company.website_domain or '').split('.')[0]) == term:
+                confidence = 0.9
+            else:
+                confidence = round(min(company.match_score, 0.89), 2)
+            matches[names[company.match_position - 1]].append((company, confidence))
+        for candidates in matches.values():
+            candidates.sort(key=lambda candidate: (-candidate[1], candidate[0].name))
+        return matches
+
+
+class VocabularyManager(models.Manager):
+    """
+    Maintain Vocabulary: incrementally on every change of a Position or
+    Interview and in bulk on request. Serve autocomplete suggestions
+    from the cache.
+    """
+
+    def counted(self, item):
+        """
+        Return set of (company_id, field, normalized, term) the item counts for.
+        Items not associated with a Company yet and Interviews rejected
+        by moderators don't count.
+        """
+        if item is None or item.company_id is None:
+            return set()
+        if not getattr(item, 'selected', True):
+            return set()
+        values = {field: getattr(item, field, None) for field, label in self.model.FIELDS}
+        return {(item.company_id,) + term for term in self.model.terms(values)}
+
+    def record_change(self, old, new):
+        """
+        Move terms of a Position or Interview from its old to its new state.
+        Either state can be None (item created or deleted).
+        """
+        # compared without spelling, so that changes of spelling alone don't count
+        old_keys = {term[:3] for term in self.counted(old)}
+        new_terms = self.counted(new)
+        removed = old_keys - {term[:3] for term in new_terms}
+        added = [term for term in new_terms if term[:3] not in old_keys]
+        if not removed and not added:
+            return
+        with transaction.atomic():
+            for company_id, field, normalized in removed:
+                self.filter(company_id=company_id, field=field,
+                            normalized=normalized).update(count=F('count') - 1)
+            if removed:
+                self.filter(company_id__in={term[0] for term in removed},
+                            count__lte=0).delete()
+            for company_id, field, normalized, term in added:
+                entry, created = self.get_or_create(
+                    company_id=company_id, field=field, normalized=normalized,
+                    defaults={'term': term, 'count': 1})
+                if not created:
+                    self.filter(pk=entry.pk).update(count=F('count') + 1)
+        for company_id in {term[0] for term in removed} | {term[0] for term in added}:
+            bump_vocabulary_version(company_id)
+
+    def rebuild(self, companies=None):
+        """
+        Recalculate vocabularies from scratch for all Companies or only for
+        Companies with given pk's. The most frequent spelling of a term is kept.
+        """
+        from .models import Position, Interview
+
+        positions = Position.objects.filter(company__isnull=False)
+        interviews = Interview.objects.selected()
+        if companies is not None:
+            positions = positions.filter(company__in=companies)
+            interviews = interviews.filter(company__in=companies)
+        sources = [
+            positions.values('company', 'position', 'department', 'location'),
+            interviews.values('company', 'position', 'department'),
+            ]
+        spellings = {}
+        for rows in sources:
+            for row in rows.annotate(items=Count('id')):
+                company_id = row.pop('company')
+                items = row.pop('items')
+                for field, normalized, term in self.model.terms(row):
+                    counts = spellings.setdefault((company_id, field, normalized), {})
+                    counts[term] = counts.get(term, 0) + items
+        entries = [
+            self.model(company_id=company_id, field=field, normalized=normalized,
+                       term=max(sorted(counts), key=counts.get),
+                       count=sum(counts.values()))
+            for (company_id, field, normalized), counts in spellings.items()]
+        with transaction.atomic():
+            if companies is None:
+                self.all().delete()
+            else:
+                self.filter(company__in=companies).delete()
+            self.bulk_create(entries, batch_size=1000)
+        for company_id in companies or {entry.company_id for entry in entries}:
+            bump_vocabulary_version(company_id)
+        return entries
+
+    def for_company(self, company_id):
+        """
+        Return {field: [(normalized, term, count), ...]} of the Company,
+        most used terms first, from the cache.
+        """
+        key = 'vocabulary:{}:{}'.format(company_id, vocabulary_version(company_id))
+        vocabulary = cache.get(key)
+        if vocabulary is None:
+            vocabulary = {}
+            entries = self.filter(company_id=company_id).order_by(
+                '-count', 'normalized').values_list('field', 'normalized', 'term', 'count')
+            for field, normalized, term, count in entries:
+                vocabulary.setdefault(field, []).append((normalized, term, count))
+            cache.set(key, vocabulary, settings.FRAGMENT_CACHE_TIMEOUT)
+        return vocabulary
+
+    def suggest(self, company_id, field, term, limit=None):
+        """
+        Return up to limit terms of the field used at the Company containing
+        term. Terms starting with it come first, then terms with a word
+        starting with it, then the rest, each by number of uses.
+        """
+        normalized = self.model.normalize(term)
+        if not normalized:
+            return []
+        matches = []
+        for entry, display, count in self.for_company(company_id).get(field, []):
+            if entry.startswith(normalized):
+                rank = 0
+            elif ' ' + normalized in entry:
+                rank = 1
+            elif normalized in entry:
+                rank = 2
+            else:
+                continue
+            matches.append((rank, -count, entry, display))
+        matches.sort()
+        return [display for rank, count, entry, display
+                in matches[:limit or settings.AUTOCOMPLETE_LIMIT]]
+
+
+class DailyRollupManager(models.Manager):
+    """
+    Maintain daily totals of an event table, which outlive its partitions
+    (see partitions.py). The model defines ROLLUP_SOURCE (event model),
+    ROLLUP_KEYS {column: SQL expression} grouping the events besides the day
+    and ROLLUP_TOTALS {column: SQL aggregate}.
+    """
+
+    def rollup(self, first, last):
+        """
+        Recalculate totals of days first to last (local dates), replacing
+        existing rows, so days can be rolled up again. Return number of rows.
+        """
+        model = self.model
+        keys = list(model.ROLLUP_KEYS)
+        totals = list(model.ROLLUP_TOTALS)
+        sql = (
+            'INSERT INTO {table} ({keys}, day, {totals}) '
+            'SELECT {key_expressions}, (timestamp AT TIME ZONE %s)::date, {aggregates} '
+            'FROM {source} WHERE timestamp >= %s AND timestamp < %s '
+            'GROUP BY 1, 2 '
+            'ON CONFLICT ({keys}, day) DO UPDATE SET {updates}'
+            ).format(
+                table=model._meta.db_table,
+                source=model.ROLLUP_SOURCE._meta.db_table,
+                keys=', '.join(keys),
+                totals=', '.join(totals),
+                key_expressions=', '.join(model.ROLLUP_KEYS.values()),
+                aggregates=', '.join(model.ROLLUP_TOTALS.values()),
+                updates=', '.join('{0} = EXCLUDED.{0}'.format(total) for total in totals))
+        start = timezone.make_aware(datetime.datetime.combine(first, datetime.time.min))
+        end = timezone.make_aware(datetime.datetime.combine(
+            last + datetime.timedelta(days=1), datetime.time.min))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [settings.TIME_ZONE, start, end])
+            return cursor.rowcount
+
+    def pending_days(self, until):
+        """
+        Return (first, last) days to roll up to bring totals up to date until
+        the day (inclusive), or None if there is nothing to do. The last day
+        rolled up before is recalculated, it may have been incomplete.
+        """
+        first = self.aggregate(last=Max('day'))['last']
+        if first is None:
+            oldest = self.model.ROLLUP_SOURCE.objects.aggregate(
+                oldest=Min('timestamp'))['oldest']
+            if oldest is None:
+                return None
+            first = timezone.localtime(oldest).date()
+        return (first, until) if first <= until else None
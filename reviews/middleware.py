@@ -0,0 +1,107 @@
+"""
+Per-view performance metrics: number of queries, database time, template
+render time and total latency, logged to the 'reviews' logger.
+"""
+import logging
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+from .percentiles import calculate_percentiles
+from .slow_queries import set_request, start_counting, stop_counting
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class ViewLatencies:
+    """
+    Rolling window of latencies of one view in milliseconds (kept per process).
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.latencies = deque(maxlen=size)
+        self.requests = 0
+
+    def add(self, latency):
+        self.latencies.append(latency)
+        self.requests += 1
+
+    @property
+    def window_full(self):
+        return self.requests % self.size == 0
+
+    def percentiles(self):
+        return calculate_percentiles(sorted(self.latencies))
+
+
+class ViewMetricsMiddleware:
+    """
+    Record query count, database time, template render time and latency
+    of every request per resolved url name. Queries above budget set in
+    settings.QUERY_BUDGETS are logged as warnings, or raise
+    QueryBudgetExceeded if settings.QUERY_BUDGET_RAISE is set (tests).
+    Queries are counted by the cursor wrapper of slow_queries.py, their
+    SQL isn't kept.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.latencies = defaultdict(lambda: ViewLatencies(settings.VIEW_METRICS_WINDOW))
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        set_request(request)
+        start_counting()
+        try:
+            response = self.get_response(request)
+        finally:
+            queries, db_time = stop_counting()
+            set_request(None)
+        latency = time.perf_counter() - start
+        self.record(request, queries, db_time, latency)
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Template responses are rendered after all middleware had a chance
+        to process them, so render time is taken in a post render callback.
+        """
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.template_time = time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, request, queries, db_time, latency):
+        match = getattr(request, 'resolver_match', None)
+        if match is None or not match.url_name:
+            return
+        view = match.url_name
+        template_time = getattr(request, 'template_time', None)
+        logger.info('view: {} queries: {} db: {:.1f}ms template: {} total: {:.1f}ms'.format(
+            view, queries, db_time * 1000,
+            '{:.1f}ms'.format(template_time * 1000) if template_time is not None else '-',
+            latency * 1000))
+
+        latencies = self.latencies[view]
+        latencies.add(latency * 1000)
+        if latencies.window_full:
+            logger.info('view: {} last {} requests: {}'.format(
+                view, latencies.size, ' '.join(
+                    '{}: {}ms'.format(name, value)
+                    for name, value in latencies.percentiles().items())))
+
+        budget = settings.QUERY_BUDGETS.get(view)
+        if budget is not None and queries > budget:
+            message = 'view: {} ran {} queries, budget is {}'.format(view, queries, budget)
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
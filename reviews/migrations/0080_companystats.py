@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 15:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0079_auto_20180417_1433'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyStats',
+            fields=[
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='reviews.Company')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('overallscore_sum', models.PositiveIntegerField(default=0)),
+                ('advancement_sum', models.PositiveIntegerField(default=0)),
+                ('worklife_sum', models.PositiveIntegerField(default=0)),
+                ('compensation_sum', models.PositiveIntegerField(default=0)),
+                ('environment_sum', models.PositiveIntegerField(default=0)),
+                ('salary_count', models.PositiveIntegerField(default=0)),
+                ('salary_annual_sum', models.BigIntegerField(default=0)),
+                ('salary_annual_min', models.PositiveIntegerField(blank=True, null=True)),
+                ('salary_annual_max', models.PositiveIntegerField(blank=True, null=True)),
+                ('interview_count', models.PositiveIntegerField(default=0)),
+                ('interview_rating_sum', models.PositiveIntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Statystyki firmy',
+                'verbose_name_plural': 'Statystyki firm',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 15:08
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0080_companystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalaryGroup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.CharField(max_length=100)),
+                ('location', models.CharField(blank=True, max_length=50)),
+                ('department', models.CharField(blank=True, max_length=100)),
+                ('employment_status', models.CharField(max_length=1)),
+                ('contract_type', models.CharField(max_length=1)),
+                ('currency', models.CharField(max_length=3)),
+                ('period', models.CharField(max_length=1)),
+                ('salary_count', models.PositiveIntegerField(default=0)),
+                ('salary_sum', models.BigIntegerField(default=0)),
+                ('salary_min', models.PositiveIntegerField(null=True)),
+                ('salary_avg', models.PositiveIntegerField(null=True)),
+                ('salary_max', models.PositiveIntegerField(null=True)),
+                ('bonus_count', models.PositiveIntegerField(default=0)),
+                ('bonus_sum', models.BigIntegerField(default=0)),
+                ('bonus_min', models.PositiveIntegerField(null=True)),
+                ('bonus_avg', models.PositiveIntegerField(null=True)),
+                ('bonus_max', models.PositiveIntegerField(null=True)),
+                ('bonus_annual_count', models.PositiveIntegerField(default=0)),
+                ('bonus_annual_sum', models.BigIntegerField(default=0)),
+                ('bonus_annual_min', models.PositiveIntegerField(null=True)),
+                ('bonus_annual_avg', models.PositiveIntegerField(null=True)),
+                ('bonus_annual_max', models.PositiveIntegerField(null=True)),
+                ('bonus_periods', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=1, null=True), default=list, size=None)),
+                ('salary_object_list', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reviews.Company')),
+            ],
+            options={
+                'verbose_name': 'Grupa zarobków',
+                'verbose_name_plural': 'Grupy zarobków',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='salarygroup',
+            unique_together=set([('company', 'position', 'location', 'department', 'employment_status', 'contract_type', 'currency', 'period')]),
+        ),
+    ]
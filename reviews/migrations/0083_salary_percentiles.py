@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 15:14
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0082_salarygroup_benefits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companystats',
+            name='bonus_annual_values',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='companystats',
+            name='percentiles',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='companystats',
+            name='salary_annual_values',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='salarygroup',
+            name='bonus_annual_values',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='salarygroup',
+            name='percentiles',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='salarygroup',
+            name='salary_annual_values',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='salarygroup',
+            name='salary_values',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=list, size=None),
+        ),
+    ]
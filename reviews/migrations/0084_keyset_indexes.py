@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 15:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0083_salary_percentiles'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='interview',
+            index=models.Index(fields=['company', '-date', '-id'], name='interview_company_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['company', '-date', '-id'], name='review_company_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salarygroup',
+            index=models.Index(fields=['company', '-salary_count', '-id'], name='salarygroup_company_count_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    unaccent() is only STABLE, so it can't be used in an index expression.
+    search_normalize() wraps it (with explicit dictionary) as IMMUTABLE.
+    """
+
+    dependencies = [
+        ('reviews', '0084_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION search_normalize(text) RETURNS text AS $$
+                SELECT lower(public.unaccent('public.unaccent'::regdictionary, $1))
+            $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE;
+            CREATE INDEX reviews_company_name_trgm
+                ON reviews_company USING gin (search_normalize(name) gin_trgm_ops);
+            CREATE INDEX reviews_company_website_trgm
+                ON reviews_company USING gin (search_normalize(website) gin_trgm_ops);
+            """,
+            """
+            DROP INDEX reviews_company_website_trgm;
+            DROP INDEX reviews_company_name_trgm;
+            DROP FUNCTION search_normalize(text);
+            """),
+    ]
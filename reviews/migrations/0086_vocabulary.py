@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 15:42
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0085_company_search_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vocabulary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('position', 'stanowisko'), ('department', 'departament'), ('location', 'lokalizacja')], max_length=10)),
+                ('normalized', models.CharField(max_length=100)),
+                ('term', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vocabulary', to='reviews.Company')),
+            ],
+            options={
+                'verbose_name': 'Słownik firmy',
+                'verbose_name_plural': 'Słowniki firm',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='vocabulary',
+            unique_together=set([('company', 'field', 'normalized')]),
+        ),
+    ]
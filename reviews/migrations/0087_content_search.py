@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 15:46
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    There is no Polish text search configuration in stock PostgreSQL.
+    'pracor' configuration indexes unaccented, lower-cased words
+    (see reviews/search.py). Existing rows are indexed by
+    'rebuild_search_vectors' management command.
+    """
+
+    dependencies = [
+        ('reviews', '0086_vocabulary'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            CREATE TEXT SEARCH CONFIGURATION pracor (COPY = simple);
+            ALTER TEXT SEARCH CONFIGURATION pracor
+                ALTER MAPPING FOR asciiword, asciihword, hword_asciipart,
+                                  word, hword, hword_part
+                WITH public.unaccent, simple;
+            """,
+            "DROP TEXT SEARCH CONFIGURATION pracor;",
+        ),
+        migrations.AddField(
+            model_name='interview',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='interview',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='interview_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='review_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 16:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from reviews.partitions import partition_table, unpartition_table
+
+
+def partition(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        partition_table(cursor, 'reviews_accessattempt', 'timestamp')
+
+
+def unpartition(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        unpartition_table(cursor, 'reviews_accessattempt')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0088_companystats_updated_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccessAttemptDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=200)),
+                ('day', models.DateField(db_index=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Próby dostępu dziennie',
+                'verbose_name_plural': 'Próby dostępu dziennie',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='accessattemptdaily',
+            unique_together=set([('path', 'day')]),
+        ),
+        # monthly partitions by timestamp, requires PostgreSQL 11+
+        migrations.RunPython(partition, unpartition),
+    ]
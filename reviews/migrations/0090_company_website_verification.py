@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 16:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0089_accessattempt_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='website_checked',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='sprawdzono www'),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='website_domain',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200, verbose_name='domena'),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='website_redirect',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200, null=True, verbose_name='przekierowuje do'),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='website_status',
+            field=models.CharField(choices=[('U', 'niesprawdzona'), ('V', 'działa'), ('F', 'nie odpowiada'), ('D', 'przekierowuje do innej firmy')], default='U', editable=False, max_length=1, verbose_name='status www'),
+        ),
+        # same as Company.domain()
+        migrations.RunSQL(
+            "UPDATE reviews_company SET website_domain = regexp_replace("
+            "lower(split_part(regexp_replace(website, '^[a-zA-Z]+://', ''), '/', 1)), "
+            "'^(.*@)?(www\\.)?', '')",
+            migrations.RunSQL.noop),
+    ]
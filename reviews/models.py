@@ -1,20 +1,68 @@
 import datetime
 import logging
 
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
 from django.conf import settings
+from django.contrib.postgres.fields import ArrayField, JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from django.db.models import Avg, Max, Min, Count, Func
+from django.db.models import Avg, Max, Min, Count, Func, Q
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.text import slugify
 from unidecode import unidecode
 
-from .managers import SelectedManager, SalaryManager, ArrayAgg #modified version of ArrayAgg
+from .managers import (SelectedManager, ContentManager, SalaryManager, SalaryGroupManager,
+                       CompanyStatsManager, CompanyManager, VocabularyManager,
+                       DailyRollupManager,
+                       ArrayAgg) #modified version of ArrayAgg
+from .percentiles import PERCENTILES, calculate_percentiles, insert_value, remove_value
 
 
 logger = logging.getLogger(__name__)
 
-class ApprovableModel(models.Model):
+class TrackedModel(models.Model):
+    """
+    Abstract model remembering its stored state, so that signal receivers
+    can tell what changed on save.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember values loaded from the database.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._stored_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Keep the state from before saving in self.previous (None for new instances)
+        for the benefit of post_save receivers.
+        """
+        self.previous = self.stored_copy()
+        super().save(*args, **kwargs)
+        self._stored_values = {field.attname: getattr(self, field.attname)
+                               for field in self._meta.concrete_fields}
+
+    def stored_copy(self):
+        """
+        Return unsaved copy of the instance as it is stored in the database
+        or None if the instance hasn't been saved yet.
+        """
+        values = getattr(self, '_stored_values', None)
+        if values is not None:
+            return self.__class__(**values)
+
+
+class ApprovableModel(TrackedModel):
     """
     Abstract model providing features for instance approval in the admin module.
     """
@@ -31,12 +79,28 @@ class ApprovableModel(models.Model):
     class Meta:
         abstract = True
 
+    @property
+    def selected(self):
+        """
+        Instance equivalent of SelectedManager.selected().
+        """
+        return self.approved is not False
+
 
 class Company(ApprovableModel):
 
     EMPLOYMENT = [('A', '<100'), ('B', '101-500'), ('C', '501-1000'),
                   ('D', '1001-5000'), ('E', '5001-10000'), ('F', '>10000')]
 
+    # website verification (see reviews/websites.py)
+    WEBSITE_UNVERIFIED = 'U'
+    WEBSITE_VERIFIED = 'V'
+    WEBSITE_FAILED = 'F'
+    WEBSITE_DUPLICATE = 'D'
+    WEBSITE_STATUS = [(WEBSITE_UNVERIFIED, 'niesprawdzona'), (WEBSITE_VERIFIED, 'działa'),
+                      (WEBSITE_FAILED, 'nie odpowiada'),
+                      (WEBSITE_DUPLICATE, 'przekierowuje do innej firmy')]
+
     # only three values are required - to make company creation easy for users
     name = models.CharField('nazwa', max_length=200, unique=True, db_index=True)
     headquarters_city = models.CharField('siedziba centrali', max_length=60)
@@ -58,6 +122,18 @@ class Company(ApprovableModel):
     # slug created automatically by save()
     slug = models.SlugField(null=True, max_length=200, editable=False)
 
+    # domain of website set by save(), the rest by website verification
+    website_domain = models.CharField('domena', max_length=200, blank=True,
+                                      db_index=True, editable=False)
+    website_status = models.CharField('status www', max_length=1, choices=WEBSITE_STATUS,
+                                      default=WEBSITE_UNVERIFIED, editable=False)
+    website_redirect = models.CharField('przekierowuje do', max_length=200, blank=True,
+                                        null=True, db_index=True, editable=False)
+    website_checked = models.DateTimeField('sprawdzono www', blank=True, null=True,
+                                           editable=False)
+
+    objects = CompanyManager()
+
     class Meta:
         verbose_name = "Firma"
         verbose_name_plural = "Firmy"
@@ -67,7 +143,25 @@ class Company(ApprovableModel):
         return self.name
 
     def save(self, *args, **kwargs):
-        self.slug = slugify(unidecode(self.name))
+        self.slug = self.slugify_name(self.name)
+        self.website_domain = self.domain(self.website)
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def domain(url):
+        """
+        Return lower-cased host (and port) of the url without 'www.'.
+        """
+        netloc = urlsplit(url if '://' in url else 'http://' + url).netloc
+        netloc = netloc.rpartition('@')[2].lower()
+        return netloc[4:] if netloc.startswith('www.') else netloc
+
+    @staticmethod
+    def slugify_name(name):
+        """
+        Return slug of the name without legal form endings.
+        """
+        slug = slugify(unidecode(name))
         # get rid of '-sa', '-sp-z-oo' and '-sp-z-oo-sp-k' etc. endings
         endings = ['-sa',
                    '-sp-z-oo',
@@ -81,9 +175,9 @@ class Company(ApprovableModel):
                    '-spolka-z-oo',
                    ]
         for e in endings:
-            if self.slug.endswith(e):
-                self.slug = self.slug.replace(e, '')
-        super().save(*args, **kwargs)
+            if slug.endswith(e):
+                slug = slug.replace(e, '')
+        return slug
 
     def get_absolute_url(self):
         return reverse('company_page',
@@ -172,7 +266,7 @@ class Company(ApprovableModel):
         return string
 
 
-class Position(models.Model):
+class Position(TrackedModel):
 
     STATUS_ZATRUDNIENIA = [
         ('A', 'pełen etat'),
@@ -261,9 +355,22 @@ class Review(ApprovableModel):
     environment = models.PositiveIntegerField('atmosfera w pracy',
                                               choices=RATINGS, default=None)
 
+    # full-text search document (see search.py), kept current by signals
+    search_vector = SearchVectorField(null=True, editable=False)
+    # field: weight, first field is the heading of search results
+    SEARCH_FIELDS = [('title', 'A'), ('pros', 'B'), ('cons', 'B'), ('comment', 'C')]
+
+    objects = ContentManager()
+
     class Meta:
         verbose_name = "Opinia"
         verbose_name_plural = "Opinie"
+        indexes = [
+            # keyset pagination of company reviews
+            models.Index(fields=['company', '-date', '-id'],
+                         name='review_company_date_id_idx'),
+            GinIndex(fields=['search_vector'], name='review_search_vector_idx'),
+            ]
 
     def __str__(self):
         return 'id_{}-{}-{}'.format(str(self.id), self.company.name, self.title)
@@ -445,27 +552,28 @@ class Salary(ApprovableModel):
 
         salary_annual = period_devisor[self.period] * self.salary_input
 
-        #net to gross conversion
+        #net to gross conversion, rounded to whole numbers stored in the database
+        #(and added up in CompanyStats and SalaryGroup before it's saved)
         if self.gross_net == 'N':
-            self.salary_gross_annual = net_to_gross(salary_annual)
+            self.salary_gross_annual = round(net_to_gross(salary_annual))
         else:
             self.salary_gross_annual = salary_annual
             
         self.salary_gross_input_period = round(self.salary_gross_annual /
-                                               period_devisor[self.period], 0)
+                                               period_devisor[self.period])
 
         if self.bonus_input:
             bonus_annual = period_devisor[self.bonus_period] * self.bonus_input
             if self.bonus_gross_net == 'N':
                 salary_net_annual = gross_to_net(self.salary_gross_annual)
                 total_comp_net_annual = bonus_annual + salary_net_annual
-                total_comp_gross_annual = net_to_gross(total_comp_net_annual)
+                total_comp_gross_annual = round(net_to_gross(total_comp_net_annual))
                 self.bonus_gross_annual = total_comp_gross_annual - self.salary_gross_annual
             else:
                 self.bonus_gross_annual = bonus_annual
 
             self.bonus_gross_input_period = round(self.bonus_gross_annual /
-                                                  period_devisor[self.bonus_period], 0)
+                                                  period_devisor[self.bonus_period])
 
 
     def get_absolute_url(self):
@@ -473,6 +581,184 @@ class Salary(ApprovableModel):
                        kwargs={'pk': self.company.id})
 
 
+class SalaryGroup(models.Model):
+    """
+    Persisted equivalent of SalaryManager.groups() aggregation: selected Salaries
+    grouped by position, location, department, employment status, contract type,
+    currency and period. Kept current by SalaryGroupManager.record_change
+    (called from signals.py), rebuilt by 'rebuild_salary_groups' management command.
+    Missing location and department are stored as empty strings to make
+    the group key unique.
+    """
+    # group field: Salary lookup
+    DIMENSIONS = OrderedDict([
+        ('position', 'position__position'),
+        ('location', 'position__location'),
+        ('department', 'position__department'),
+        ('employment_status', 'position__employment_status'),
+        ('contract_type', 'contract_type'),
+        ('currency', 'currency'),
+        ('period', 'period'),
+        ])
+    # aggregate prefix: Salary field
+    METRICS = OrderedDict([
+        ('salary', 'salary_gross_input_period'),
+        ('bonus', 'bonus_gross_input_period'),
+        ('bonus_annual', 'bonus_gross_annual'),
+        ])
+    # percentiles key: Salary field
+    DISTRIBUTIONS = OrderedDict([
+        ('salary', 'salary_gross_input_period'),
+        ('salary_annual', 'salary_gross_annual'),
+        ('bonus_annual', 'bonus_gross_annual'),
+        ])
+    # fields of Position, change of which moves its Salaries to other groups
+    POSITION_FIELDS = ('position', 'location', 'department', 'employment_status', 'company_id')
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+    position = models.CharField(max_length=100)
+    location = models.CharField(max_length=50, blank=True)
+    department = models.CharField(max_length=100, blank=True)
+    employment_status = models.CharField(max_length=1)
+    contract_type = models.CharField(max_length=1)
+    currency = models.CharField(max_length=3)
+    period = models.CharField(max_length=1)
+
+    salary_count = models.PositiveIntegerField(default=0)
+    salary_sum = models.BigIntegerField(default=0)
+    salary_min = models.PositiveIntegerField(null=True)
+    salary_avg = models.PositiveIntegerField(null=True)
+    salary_max = models.PositiveIntegerField(null=True)
+    bonus_count = models.PositiveIntegerField(default=0)
+    bonus_sum = models.BigIntegerField(default=0)
+    bonus_min = models.PositiveIntegerField(null=True)
+    bonus_avg = models.PositiveIntegerField(null=True)
+    bonus_max = models.PositiveIntegerField(null=True)
+    bonus_annual_count = models.PositiveIntegerField(default=0)
+    bonus_annual_sum = models.BigIntegerField(default=0)
+    bonus_annual_min = models.PositiveIntegerField(null=True)
+    bonus_annual_avg = models.PositiveIntegerField(null=True)
+    bonus_annual_max = models.PositiveIntegerField(null=True)
+    bonus_periods = ArrayField(models.CharField(max_length=1, null=True), default=list)
+    benefits = ArrayField(models.CharField(max_length=100), default=list)
+    # sorted, for percentiles
+    salary_values = ArrayField(models.PositiveIntegerField(), default=list)
+    salary_annual_values = ArrayField(models.PositiveIntegerField(), default=list)
+    bonus_annual_values = ArrayField(models.PositiveIntegerField(), default=list)
+    percentiles = JSONField(default=dict)
+    salary_object_list = ArrayField(models.IntegerField(), default=list)
+
+    objects = SalaryGroupManager()
+
+    class Meta:
+        verbose_name = 'Grupa zarobków'
+        verbose_name_plural = 'Grupy zarobków'
+        unique_together = [['company', 'position', 'location', 'department',
+                            'employment_status', 'contract_type', 'currency', 'period']]
+        # keyset pagination of company salaries
+        indexes = [models.Index(fields=['company', '-salary_count', '-id'],
+                                name='salarygroup_company_count_idx')]
+
+    def __str__(self):
+        return '{}_{}_{}'.format(self.company_id, self.position, self.location)
+
+    @classmethod
+    def key(cls, salary):
+        """
+        Return lookup of the group the salary belongs to.
+        """
+        position = salary.position
+        return {
+            'company_id': salary.company_id,
+            'position': position.position,
+            'location': position.location or '',
+            'department': position.department or '',
+            'employment_status': position.employment_status,
+            'contract_type': salary.contract_type,
+            'currency': salary.currency,
+            'period': salary.period,
+            }
+
+    def salaries(self):
+        """
+        Return selected Salaries that belong to the group.
+        """
+        salaries = Salary.objects.selected(company=self.company_id)
+        for dimension, lookup in self.DIMENSIONS.items():
+            value = getattr(self, dimension)
+            if dimension in ('location', 'department') and not value:
+                salaries = salaries.filter(Q(**{lookup: ''}) | Q(**{lookup + '__isnull': True}))
+            else:
+                salaries = salaries.filter(**{lookup: value})
+        return salaries
+
+    def add(self, salary):
+        """
+        Add salary to the aggregates. Its values are appended to distributions,
+        finish() sorts them and calculates percentiles.
+        """
+        for metric, field in self.METRICS.items():
+            value = getattr(salary, field)
+            if value is None:
+                continue
+            count = getattr(self, metric + '_count') + 1
+            total = getattr(self, metric + '_sum') + value
+            minimum = getattr(self, metric + '_min')
+            maximum = getattr(self, metric + '_max')
+            setattr(self, metric + '_count', count)
+            setattr(self, metric + '_sum', total)
+            setattr(self, metric + '_avg', round(total / count))
+            if minimum is None or value < minimum:
+                setattr(self, metric + '_min', value)
+            if maximum is None or value > maximum:
+                setattr(self, metric + '_max', value)
+        if salary.bonus_period not in self.bonus_periods:
+            # same order as ARRAY_AGG(DISTINCT ...) - nulls last
+            self.bonus_periods = sorted(self.bonus_periods + [salary.bonus_period],
+                                        key=lambda period: (period is None, period or ''))
+        for name, field in self.DISTRIBUTIONS.items():
+            value = getattr(salary, field)
+            if value is not None:
+                getattr(self, name + '_values').append(value)
+        self.salary_object_list.append(salary.pk)
+
+    def finish(self):
+        """
+        Sort distributions and Salary pk's after adding Salaries, calculate percentiles.
+        """
+        for name in self.DISTRIBUTIONS:
+            getattr(self, name + '_values').sort()
+        self.salary_object_list.sort()
+        self.percentiles = {name: calculate_percentiles(getattr(self, name + '_values'))
+                            for name in self.DISTRIBUTIONS}
+
+    def refresh(self):
+        """
+        Recalculate aggregates from Salaries in the group.
+        """
+        for metric in self.METRICS:
+            setattr(self, metric + '_count', 0)
+            setattr(self, metric + '_sum', 0)
+            for suffix in ('_min', '_avg', '_max'):
+                setattr(self, metric + suffix, None)
+        self.bonus_periods = []
+        self.salary_object_list = []
+        for name in self.DISTRIBUTIONS:
+            setattr(self, name + '_values', [])
+        self.percentiles = {}
+        for salary in self.salaries():
+            self.add(salary)
+        self.finish()
+        self.refresh_benefits()
+
+    def refresh_benefits(self):
+        """
+        Recalculate names of all Benefits reported for Salaries in the group.
+        """
+        self.benefits = sorted(set(Benefit.objects.filter(
+            salary__in=self.salary_object_list).values_list('name', flat=True)))
+
+
 class Interview(ApprovableModel):
     HOW_GOT = [
         ('A', 'Ogłoszenie'),
@@ -513,10 +799,22 @@ class Interview(ApprovableModel):
     impressions = models.TextField('wrażenia')
     rating = models.PositiveIntegerField('ocena', choices=RATINGS, default=None)
 
+    # full-text search document (see search.py), kept current by signals
+    search_vector = SearchVectorField(null=True, editable=False)
+    # field: weight, first field is the heading of search results
+    SEARCH_FIELDS = [('position', 'A'), ('questions', 'B'), ('impressions', 'B')]
+
+    objects = ContentManager()
     
     class Meta:
         verbose_name = "Rozmowa"
         verbose_name_plural = "Rozmowy"
+        indexes = [
+            # keyset pagination of company interviews
+            models.Index(fields=['company', '-date', '-id'],
+                         name='interview_company_date_id_idx'),
+            GinIndex(fields=['search_vector'], name='interview_search_vector_idx'),
+            ]
 
     def __str__(self):
         return 'id_' + str(self.id) + '_' + str(self.company)
@@ -531,6 +829,182 @@ class Interview(ApprovableModel):
         return {'rating': self.rating,}
     
 
+class CompanyStats(models.Model):
+    """
+    Denormalized summary of selected Reviews, Salaries and Interviews of a Company,
+    so that company pages read one row instead of running aggregates.
+    Kept current by receivers in signals.py, rebuilt by 'rebuild_company_stats'
+    management command. Sums rather than averages are stored, so that incremental
+    updates don't accumulate rounding errors.
+    """
+    SCORES = ['overallscore', 'advancement', 'worklife', 'compensation', 'environment']
+    # percentiles key: Salary field
+    DISTRIBUTIONS = OrderedDict([
+        ('salary_annual', 'salary_gross_annual'),
+        ('bonus_annual', 'bonus_gross_annual'),
+        ])
+
+    company = models.OneToOneField(Company, on_delete=models.CASCADE,
+                                   primary_key=True, related_name='stats')
+    review_count = models.PositiveIntegerField(default=0)
+    overallscore_sum = models.PositiveIntegerField(default=0)
+    advancement_sum = models.PositiveIntegerField(default=0)
+    worklife_sum = models.PositiveIntegerField(default=0)
+    compensation_sum = models.PositiveIntegerField(default=0)
+    environment_sum = models.PositiveIntegerField(default=0)
+    salary_count = models.PositiveIntegerField(default=0)
+    salary_annual_sum = models.BigIntegerField(default=0)
+    salary_annual_min = models.PositiveIntegerField(null=True, blank=True)
+    salary_annual_max = models.PositiveIntegerField(null=True, blank=True)
+    # sorted, for percentiles
+    salary_annual_values = ArrayField(models.PositiveIntegerField(), default=list)
+    bonus_annual_values = ArrayField(models.PositiveIntegerField(), default=list)
+    percentiles = JSONField(default=dict)
+    interview_count = models.PositiveIntegerField(default=0)
+    interview_rating_sum = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CompanyStatsManager()
+
+    class Meta:
+        verbose_name = 'Statystyki firmy'
+        verbose_name_plural = 'Statystyki firm'
+
+    def __str__(self):
+        return str(self.company_id)
+
+    @staticmethod
+    def average(total, count):
+        if count:
+            return total / count
+
+    @property
+    def scores(self):
+        """
+        Same as Company.scores. Overallscore has to be first (see _rating_table.html).
+        """
+        return OrderedDict(
+            (score, self.average(getattr(self, score + '_sum'), self.review_count))
+            for score in self.SCORES)
+
+    @property
+    def sum_salaries(self):
+        """
+        Same as Company.sum_salaries: monthly average, min and max of annual salaries.
+        """
+        average = self.average(self.salary_annual_sum, self.salary_count)
+        return {
+            'sum_avg': average / 12 if average is not None else None,
+            'sum_min': self.salary_annual_min // 12 if self.salary_count else None,
+            'sum_max': self.salary_annual_max // 12 if self.salary_count else None,
+            'sum_count': self.salary_count,
+            }
+
+    @property
+    def salary_percentiles(self):
+        """
+        Percentiles of annual salaries converted to monthly values (as in sum_salaries).
+        """
+        annual = self.percentiles.get('salary_annual')
+        if annual:
+            return OrderedDict((name, annual[name] // 12) for name in PERCENTILES)
+
+    @property
+    def sum_interviews(self):
+        """
+        Same as Company.sum_interviews.
+        """
+        return {'sum_avg': self.average(self.interview_rating_sum, self.interview_count)}
+
+    def add(self, item, sign=1):
+        """
+        Add contribution of a Review, Salary or Interview to the totals
+        (or take it away if sign is -1).
+        """
+        if isinstance(item, Review):
+            self.review_count += sign
+            for score in self.SCORES:
+                total = score + '_sum'
+                setattr(self, total, getattr(self, total) + sign * getattr(item, score))
+        elif isinstance(item, Salary):
+            self.salary_count += sign
+            self.salary_annual_sum += sign * item.salary_gross_annual
+            update = insert_value if sign > 0 else remove_value
+            for name, field in self.DISTRIBUTIONS.items():
+                update(getattr(self, name + '_values'), getattr(item, field))
+            self.refresh_percentiles()
+        elif isinstance(item, Interview):
+            self.interview_count += sign
+            self.interview_rating_sum += sign * item.rating
+
+    def remove(self, item):
+        self.add(item, sign=-1)
+
+    def refresh_percentiles(self):
+        """
+        Recalculate salary extremes and percentiles from sorted values.
+        """
+        values = self.salary_annual_values
+        self.salary_annual_min = values[0] if values else None
+        self.salary_annual_max = values[-1] if values else None
+        self.percentiles = {name: calculate_percentiles(getattr(self, name + '_values'))
+                            for name in self.DISTRIBUTIONS}
+
+
+class Vocabulary(models.Model):
+    """
+    Position titles, departments and locations used at a Company with number
+    of Positions and Interviews using them, for autocomplete in item forms.
+    Kept current by receivers in signals.py, rebuilt by 'rebuild_vocabulary'
+    management command.
+    """
+    FIELDS = [
+        ('position', 'stanowisko'),
+        ('department', 'departament'),
+        ('location', 'lokalizacja'),
+        ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='vocabulary')
+    field = models.CharField(max_length=10, choices=FIELDS)
+    # lookup key, see normalize()
+    normalized = models.CharField(max_length=100)
+    # spelling presented to users
+    term = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    objects = VocabularyManager()
+
+    class Meta:
+        verbose_name = 'Słownik firmy'
+        verbose_name_plural = 'Słowniki firm'
+        unique_together = ('company', 'field', 'normalized')
+
+    def __str__(self):
+        return '{} - {}: {} ({})'.format(self.company_id, self.field, self.term, self.count)
+
+    @staticmethod
+    def normalize(term):
+        """
+        Unidecoded, lower-cased term with single spaces.
+        """
+        return ' '.join(unidecode(term).lower().split())[:100]
+
+    @classmethod
+    def terms(cls, values):
+        """
+        Return list of (field, normalized, term) from {field: value} of a Position
+        or Interview, i.e. what it contributes to the vocabulary of its Company.
+        """
+        terms = []
+        for field, label in cls.FIELDS:
+            term = (values.get(field) or '').strip()
+            normalized = cls.normalize(term)
+            if normalized:
+                terms.append((field, normalized, term[:100]))
+        return terms
+
+
 class AccessAttempt(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True, editable=False)
     referer = models.CharField(max_length=200, editable=False, null=True)
@@ -545,3 +1019,27 @@ class AccessAttempt(models.Model):
     
     def __str__(self):
         return self.path
+
+
+class AccessAttemptDaily(models.Model):
+    """
+    Number of AccessAttempts per path and day, kept after partitions
+    of AccessAttempt are dropped (see partitions.py).
+    """
+    path = models.CharField(max_length=200)
+    day = models.DateField(db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    ROLLUP_SOURCE = AccessAttempt
+    ROLLUP_KEYS = OrderedDict([('path', "coalesce(path, '')")])
+    ROLLUP_TOTALS = OrderedDict([('attempts', 'count(*)')])
+
+    objects = DailyRollupManager()
+
+    class Meta:
+        verbose_name = 'Próby dostępu dziennie'
+        verbose_name_plural = 'Próby dostępu dziennie'
+        unique_together = ('path', 'day')
+
+    def __str__(self):
+        return '{:%Y-%m-%d} {}: {}'.format(self.day, self.path, self.attempts)
@@ -0,0 +1,67 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.functional import cached_property
+
+from .caching import company_version
+from .models import CompanyStats, Salary
+
+
+Section = namedtuple('Section', ['name', 'object', 'count'])
+
+
+class CompanyPage:
+    """
+    Everything displayed by company_view.html, built once per request.
+    Counts are read from CompanyStats, every section costs at most one query
+    for its first item and nothing is queried until a template asks for it
+    (sections served from fragment cache don't query at all).
+    """
+    cache_timeout = settings.FRAGMENT_CACHE_TIMEOUT
+
+    def __init__(self, company):
+        self.company = company
+        self.stats = CompanyStats.objects.for_company(company)
+
+    @cached_property
+    def version(self):
+        """
+        Content version used in fragment cache keys.
+        """
+        return company_version(self.company.pk)
+
+    @cached_property
+    def review_count(self):
+        return self.stats.review_count
+
+    @cached_property
+    def salary_count(self):
+        """
+        Number of salary groups (this is what salary list paginates), not Salaries.
+        """
+        if not self.stats.salary_count:
+            return 0
+        return Salary.objects.groups(company=self.company.pk).count()
+
+    @cached_property
+    def interview_count(self):
+        return self.stats.interview_count
+
+    @cached_property
+    def has_items(self):
+        return bool(self.stats.review_count or self.stats.salary_count or
+                    self.stats.interview_count)
+
+    @cached_property
+    def sections(self):
+        """
+        Newest Review, most popular salary group and newest Interview
+        with the number of items in each list.
+        """
+        querysets = [
+            ('review', self.company.reviews, self.review_count),
+            ('salary', self.company.salaries, self.salary_count),
+            ('interview', self.company.interviews, self.interview_count),
+        ]
+        return [Section(name, queryset.first() if count else None, count)
+                for name, queryset, count in querysets]
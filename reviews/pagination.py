@@ -0,0 +1,55 @@
+from django.db.models import Q, Subquery
+
+
+class KeysetPage:
+    """
+    Page of a queryset ordered descending by (key, id), located by id of the
+    item the page starts after or ends before. Unlike Paginator it doesn't
+    run COUNT and doesn't OFFSET-scan, so every page costs the same as the first.
+    Total count, if needed, has to be provided by the caller.
+    """
+    after_param = 'po'
+    before_param = 'przed'
+
+    def __init__(self, queryset, key, per_page, after=None, before=None, count=None):
+        self.key = key
+        self.per_page = per_page
+        self.count = count
+        self.has_next = self.has_previous = False
+        items = queryset
+        if after is not None:
+            items = items.filter(self.seek(queryset, after, 'lt'))
+        elif before is not None:
+            items = items.filter(self.seek(queryset, before, 'gt'))
+        if before is None:
+            items = list(items.order_by('-' + key, '-id')[:per_page + 1])
+            self.has_next = len(items) > per_page
+            self.has_previous = after is not None
+            self.object_list = items[:per_page]
+        else:
+            items = list(items.order_by(key, 'id')[:per_page + 1])
+            self.has_previous = len(items) > per_page
+            self.has_next = True
+            self.object_list = items[:per_page][::-1]
+
+    def seek(self, queryset, pk, lookup):
+        """
+        Return condition selecting items before ('gt') or after ('lt')
+        the item with given pk in (key, id) order.
+        """
+        anchor = Subquery(queryset.model._base_manager.filter(pk=pk).values(self.key)[:1])
+        return (Q(**{'{}__{}'.format(self.key, lookup): anchor}) |
+                Q(**{self.key: anchor, 'id__' + lookup: pk}))
+
+    @staticmethod
+    def item_id(item):
+        return item['id'] if isinstance(item, dict) else item.pk
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def next_query(self):
+        return '?{}={}'.format(self.after_param, self.item_id(self.object_list[-1]))
+
+    def previous_query(self):
+        return '?{}={}'.format(self.before_param, self.item_id(self.object_list[0]))
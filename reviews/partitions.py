@@ -0,0 +1,201 @@
+"""
+Monthly range partitions of append-only event tables (Visits, AccessAttempts).
+
+The tables are partitioned by timestamp (migrations reviews 0089, users 0023,
+which need PostgreSQL 11 or newer), one partition per calendar month (UTC)
+plus a default partition catching rows no monthly partition exists for.
+maintain_partitions command creates partitions of coming months, rolls up
+finished days into VisitDaily and AccessAttemptDaily, and drops whole
+partitions older than settings.EVENT_RETENTION_MONTHS instead of DELETE.
+"""
+import datetime
+import logging
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# partitioned table: partition key
+TABLES = {
+    'users_visit': 'timestamp',
+    'reviews_accessattempt': 'timestamp',
+    }
+
+PARTITION_SUFFIX = '_p{:%Y%m}'
+DEFAULT_SUFFIX = '_default'
+
+
+def month_start(value):
+    """
+    Return first day of month of the date (or datetime).
+    """
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month, months):
+    """
+    Return first day of month given number of months after (before) month.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def current_month():
+    return month_start(timezone.now().astimezone(datetime.timezone.utc))
+
+
+def partition_name(table, month):
+    return table + PARTITION_SUFFIX.format(month)
+
+
+def bound(month):
+    return '{:%Y-%m-%d} 00:00:00+00'.format(month)
+
+
+def partitions(cursor, table):
+    """
+    Return {month: partition name} of monthly partitions of the table.
+    """
+    cursor.execute(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = %s', [table])
+    months = {}
+    prefix = table + '_p'
+    for name, in cursor.fetchall():
+        if name.startswith(prefix):
+            try:
+                stamp = datetime.datetime.strptime(name[len(prefix):], '%Y%m')
+            except ValueError:
+                continue
+            months[stamp.date()] = name
+    return months
+
+
+def create_partition(cursor, table, month):
+    """
+    Create partition of the table for the month if it doesn't exist.
+    Fails if the default partition holds rows of that month.
+    """
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS "{}" PARTITION OF "{}" '
+        "FOR VALUES FROM ('{}') TO ('{}')".format(
+            partition_name(table, month), table, bound(month), bound(add_months(month, 1))))
+
+
+def create_partitions(cursor, table, first, last):
+    """
+    Create partitions of the table for months first to last.
+    """
+    month = month_start(first)
+    while month <= last:
+        create_partition(cursor, table, month)
+        month = add_months(month, 1)
+
+
+def add_constraints(cursor, table, foreign_keys, indexes):
+    """
+    Create foreign keys (column, referenced table) and indexes (column lists)
+    of a table made with CREATE TABLE ... LIKE, which doesn't copy them.
+    """
+    for column, referenced in foreign_keys:
+        cursor.execute(
+            'ALTER TABLE "{0}" ADD CONSTRAINT "{0}_{1}_fk" FOREIGN KEY ("{1}") '
+            'REFERENCES "{2}" (id) DEFERRABLE INITIALLY DEFERRED'.format(
+                table, column, referenced))
+    for columns in indexes:
+        cursor.execute('CREATE INDEX "{}_{}_idx" ON "{}" ({})'.format(
+            table, '_'.join(columns), table, ', '.join('"{}"'.format(c) for c in columns)))
+
+
+def partition_table(cursor, table, column, foreign_keys=(), indexes=(), months_ahead=3):
+    """
+    Replace the table with a table partitioned by month of the column, with
+    the same columns, defaults and rows. Primary key becomes (id, column).
+    foreign_keys are (column, referenced table) pairs, indexes column lists.
+    """
+    old = table + '_unpartitioned'
+    cursor.execute('ALTER TABLE "{}" RENAME TO "{}"'.format(table, old))
+    cursor.execute('ALTER TABLE "{0}" RENAME CONSTRAINT "{1}_pkey" TO "{0}_pkey"'.format(
+        old, table))
+    cursor.execute(
+        'CREATE TABLE "{}" (LIKE "{}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        'PARTITION BY RANGE ("{}")'.format(table, old, column))
+    cursor.execute('ALTER TABLE "{}" ADD PRIMARY KEY (id, "{}")'.format(table, column))
+    cursor.execute('ALTER SEQUENCE "{0}_id_seq" OWNED BY "{0}".id'.format(table))
+
+    cursor.execute('SELECT min("{}") FROM "{}"'.format(column, old))
+    oldest = cursor.fetchone()[0]
+    last = add_months(current_month(), months_ahead)
+    create_partitions(cursor, table, month_start(oldest.astimezone(datetime.timezone.utc))
+                      if oldest else current_month(), last)
+    cursor.execute('CREATE TABLE "{0}{1}" PARTITION OF "{0}" DEFAULT'.format(
+        table, DEFAULT_SUFFIX))
+    cursor.execute('INSERT INTO "{}" SELECT * FROM "{}"'.format(table, old))
+    cursor.execute('DROP TABLE "{}"'.format(old))
+    add_constraints(cursor, table, foreign_keys, [(column,)] + list(indexes))
+
+
+def unpartition_table(cursor, table, foreign_keys=(), indexes=()):
+    """
+    Reverse of partition_table.
+    """
+    old = table + '_partitioned'
+    cursor.execute('ALTER TABLE "{}" RENAME TO "{}"'.format(table, old))
+    cursor.execute('ALTER TABLE "{0}" RENAME CONSTRAINT "{1}_pkey" TO "{0}_pkey"'.format(
+        old, table))
+    cursor.execute('CREATE TABLE "{}" (LIKE "{}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                   .format(table, old))
+    cursor.execute('ALTER TABLE "{}" ADD PRIMARY KEY (id)'.format(table))
+    cursor.execute('ALTER SEQUENCE "{0}_id_seq" OWNED BY "{0}".id'.format(table))
+    cursor.execute('INSERT INTO "{}" SELECT * FROM "{}"'.format(table, old))
+    cursor.execute('DROP TABLE "{}"'.format(old))
+    add_constraints(cursor, table, foreign_keys, indexes)
+
+
+def ensure_partitions(months_ahead):
+    """
+    Create partitions of all event tables up to months_ahead months from now.
+    Return names of the partitions created.
+    """
+    created = []
+    first = current_month()
+    last = add_months(first, months_ahead)
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            existing = partitions(cursor, table)
+            month = first
+            while month <= last:
+                if month not in existing:
+                    try:
+                        with transaction.atomic():
+                            create_partition(cursor, table, month)
+                    except Exception:
+                        # rows of the month in the default partition
+                        logger.exception('Creating partition {} failed'.format(
+                            partition_name(table, month)))
+                    else:
+                        created.append(partition_name(table, month))
+                month = add_months(month, 1)
+    return created
+
+
+def expired_partitions(retention_months):
+    """
+    Return names of partitions wholly older than retention_months full months.
+    """
+    oldest_kept = add_months(current_month(), -retention_months)
+    expired = []
+    with connection.cursor() as cursor:
+        for table in TABLES:
+            expired.extend(name for month, name in sorted(partitions(cursor, table).items())
+                           if month < oldest_kept)
+    return expired
+
+
+def drop_partitions(names):
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute('DROP TABLE "{}"'.format(name))
@@ -0,0 +1,50 @@
+"""
+Percentiles of values kept in sorted lists, so that they can be updated
+incrementally and read without scanning Salary rows.
+"""
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+PERCENTILES = OrderedDict([
+    ('p10', 0.1),
+    ('p25', 0.25),
+    ('median', 0.5),
+    ('p75', 0.75),
+    ('p90', 0.9),
+    ])
+
+
+def insert_value(values, value):
+    """
+    Insert value into sorted list, None is ignored.
+    """
+    if value is not None:
+        insort(values, value)
+
+
+def remove_value(values, value):
+    """
+    Remove one occurrence of value from sorted list, if present.
+    """
+    if value is None:
+        return
+    index = bisect_left(values, value)
+    if index < len(values) and values[index] == value:
+        del values[index]
+
+
+def calculate_percentiles(values):
+    """
+    Return OrderedDict of percentiles of sorted values interpolated
+    the same way as PostgreSQL percentile_cont, None for empty list.
+    """
+    if not values:
+        return None
+    result = OrderedDict()
+    last = len(values) - 1
+    for name, fraction in PERCENTILES.items():
+        position = fraction * last
+        lower = int(position)
+        upper = min(lower + 1, last)
+        result[name] = round(values[lower] + (values[upper] - values[lower]) * (position - lower))
+    return result
@@ -0,0 +1,272 @@
+"""
+Profanity filter engine used by validators.ProfanitiesFilter.
+
+Words of profanities_filter/*.txt are compiled into an Aho-Corasick automaton,
+which finds all of them in a single pass over the text, however many words
+there are. Words and text are normalized the same way: unidecoded,
+case-folded and with leetspeak digits read as letters ('j3b4ny' is 'jebany').
+Words of prof_fil_broad.txt are found inside other words, words of
+prof_fil.txt only as whole words.
+
+The automaton's tables are saved as JSON to PROFANITIES_CACHE_DIR under a name
+derived from the word files, so that workers load it instead of building it,
+and a changed list is picked up by the next worker started. JSON rather than
+pickle, and only files owned by the user of the process and not writable by
+others are loaded: the directory may be shared (system temporary directory)
+and the name is predictable.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import deque
+
+from django.conf import settings
+from unidecode import unidecode
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = os.path.join(settings.BASE_DIR, 'reviews', 'profanities_filter')
+# word file: whether its words are matched only as whole words
+WORD_FILES = [
+    ('prof_fil_broad.txt', False),
+    ('prof_fil.txt', True),
+    ]
+# bump when the saved structure or normalization changes
+ENGINE_VERSION = 2
+
+LEET = {'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b',
+        '@': 'a', '$': 's'}
+# punctuation stripped from the end of reported words
+TRAILING = ',!?:;.'
+
+_folded = {}
+
+
+def fold(char):
+    """
+    Return normalized form of a character, possibly empty or longer than one.
+    """
+    folded = _folded.get(char)
+    if folded is None:
+        folded = ''.join(LEET.get(c, c) for c in unidecode(char).casefold())
+        _folded[char] = folded
+    return folded
+
+
+def normalize(text):
+    """
+    Return normalized text and index of the original character of every
+    character of it.
+    """
+    chars = []
+    origin = []
+    for index, char in enumerate(text):
+        folded = _folded.get(char)
+        if folded is None:
+            folded = fold(char)
+        if len(folded) == 1:
+            chars.append(folded)
+            origin.append(index)
+        else:
+            chars.extend(folded)
+            origin.extend([index] * len(folded))
+    return ''.join(chars), origin
+
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton of normalized words. States are numbered, state 0
+    is the root; goto[state] maps characters to next states, fail[state] is
+    the state of the longest proper suffix, outputs[state] lists (length,
+    whole word only) of words ending in the state, including suffixes.
+    """
+
+    def __init__(self, words=()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [()]
+        for word, whole in words:
+            self.add(word, whole)
+        self.link()
+
+    def tables(self):
+        return {'goto': self.goto, 'fail': self.fail, 'outputs': self.outputs}
+
+    @classmethod
+    def from_tables(cls, tables):
+        """
+        Return automaton of tables() read back from JSON.
+        """
+        automaton = cls()
+        automaton.goto = [{char: int(state) for char, state in goto.items()}
+                          for goto in tables['goto']]
+        automaton.fail = [int(state) for state in tables['fail']]
+        automaton.outputs = [tuple((int(length), bool(whole)) for length, whole in outputs)
+                             for outputs in tables['outputs']]
+        if not len(automaton.goto) == len(automaton.fail) == len(automaton.outputs):
+            raise ValueError('Inconsistent automaton tables')
+        return automaton
+
+    def add(self, word, whole):
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            state = next_state
+        if (len(word), whole) not in self.outputs[state]:
+            self.outputs[state] += ((len(word), whole),)
+
+    def link(self):
+        """
+        Set failure links breadth first and merge outputs of suffixes.
+        """
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail if fail != next_state else 0
+                self.outputs[next_state] += tuple(
+                    output for output in self.outputs[self.fail[next_state]]
+                    if output not in self.outputs[next_state])
+
+    def spans(self, text):
+        """
+        Yield (start, end) of words found in the normalized text.
+        """
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        state = 0
+        last = len(text) - 1
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, whole in outputs[state]:
+                start = index - length + 1
+                if whole and ((start > 0 and is_word_char(text[start - 1])) or
+                              (index < last and is_word_char(text[index + 1]))):
+                    continue
+                yield start, index + 1
+
+    def find(self, text):
+        """
+        Return whole words of the original text containing profanities,
+        lower-cased and without trailing punctuation, in order of appearance.
+        """
+        normalized, origin = normalize(text)
+        found = []
+        seen = set()
+        for start, end in self.spans(normalized):
+            # expand to the whitespace delimited word of the original text
+            first = origin[start]
+            while first > 0 and not text[first - 1].isspace():
+                first -= 1
+            if first in seen:
+                continue
+            seen.add(first)
+            stop = origin[end - 1] + 1
+            while stop < len(text) and not text[stop].isspace():
+                stop += 1
+            word = text[first:stop].lower().rstrip(TRAILING)
+            if word not in found:
+                found.append(word)
+        return found
+
+
+def load_words():
+    """
+    Return list of (normalized word, whole word only) from the word files.
+    """
+    words = []
+    for name, whole in WORD_FILES:
+        with open(os.path.join(DIRECTORY, name), encoding='utf-8') as f:
+            for line in f:
+                word = normalize(line.strip())[0]
+                if word and (word, whole) not in words:
+                    words.append((word, whole))
+    return words
+
+
+def digest():
+    """
+    Return fingerprint of word files and engine version.
+    """
+    sha = hashlib.sha1(str(ENGINE_VERSION).encode())
+    for name, whole in WORD_FILES:
+        with open(os.path.join(DIRECTORY, name), 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:12]
+
+
+def artifact_path():
+    return os.path.join(settings.PROFANITIES_CACHE_DIR or tempfile.gettempdir(),
+                        'pracr-profanities-{}.json'.format(digest()))
+
+
+def build(path=None):
+    """
+    Build the automaton and save it; the file is replaced atomically,
+    workers never read a partial one.
+    """
+    path = path or artifact_path()
+    automaton = Automaton(load_words())
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # created readable and writable only by the owner
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory,
+                                         delete=False) as f:
+            json.dump(automaton.tables(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(f.name, path)
+    except OSError:
+        logger.exception('Profanities filter not saved to {}'.format(path))
+    return automaton
+
+
+def load(path):
+    """
+    Return the automaton saved to path; ValueError if the file isn't owned
+    by the user of the process or is writable by others.
+    """
+    with open(path, encoding='utf-8') as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+            raise ValueError('{} not owned by the process user or writable by others'.format(path))
+        return Automaton.from_tables(json.load(f))
+
+
+_automaton = None
+
+
+def automaton():
+    """
+    Return the automaton: built once per process, loaded from the file
+    saved for current word files if there is a valid one.
+    """
+    global _automaton
+    if _automaton is None:
+        path = artifact_path()
+        try:
+            _automaton = load(path)
+        except FileNotFoundError:
+            _automaton = build(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning('Profanities filter not loaded from {}, rebuilt'.format(path),
+                           exc_info=True)
+            _automaton = build(path)
+    return _automaton
@@ -0,0 +1,187 @@
+"""
+Rate limits of submissions, contact messages and expensive views.
+
+Limits are configured in settings.RATE_LIMITS as name: (number, seconds, key),
+where key says whose actions are counted: 'user' (falling back to IP address
+for anonymous users), 'ip' or 'session'. A limit may be scoped, e.g. to a
+Company, counting actions per user and Company. Actions are counted in the
+counters cache (see caching.py; its add and incr are atomic and keep the
+timeout) with sliding window counters: counts of the current and the previous
+fixed window, the latter weighted by the part of it still inside the sliding
+window. A check is one get_many, counting an action one incr.
+
+Sliding windows only estimate the count, too loosely for one action per period
+(e.g. one Interview per Company in 90 days). Cooldown keeps the time of the
+last action instead, for exactly the period.
+
+When both windows are missing from the cache (evicted, or no action for two
+periods), the count can be recovered from the database by a fallback function
+of the limit, e.g. counting user's Reviews of last period. Its result is
+stored as the count of the current window, so the database is asked once.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .caching import counters
+
+
+def client_ip(request):
+    """
+    Return address of the client. Behind reverse proxies (RATE_LIMIT_IP_HEADER
+    set) it's the address appended to the header by the outermost of
+    RATE_LIMIT_TRUSTED_PROXIES proxies, addresses before it come from the client
+    and can't be trusted. REMOTE_ADDR otherwise, or if the header is missing.
+    """
+    if settings.RATE_LIMIT_IP_HEADER:
+        forwarded = [ip.strip() for ip in
+                     request.META.get(settings.RATE_LIMIT_IP_HEADER, '').split(',')]
+        forwarded = [ip for ip in forwarded if ip]
+        if len(forwarded) >= settings.RATE_LIMIT_TRUSTED_PROXIES:
+            return forwarded[-settings.RATE_LIMIT_TRUSTED_PROXIES]
+    return request.META.get('REMOTE_ADDR')
+
+
+class RateLimit:
+    """
+    Limit named in settings.RATE_LIMITS; fallback(request, since) returns number
+    of actions since the datetime, counted in the database. Actions are counted
+    separately for every scope (e.g. pk of a Company), if given.
+    """
+
+    def __init__(self, name, fallback=None, scope=None):
+        self.name = name
+        self.limit, self.period, self.key = settings.RATE_LIMITS[name]
+        self.fallback = fallback
+        self.scope = scope
+
+    @property
+    def days(self):
+        return self.period // 86400
+
+    def ident(self, request):
+        if self.key == 'user' and request.user.is_authenticated:
+            return 'u{}'.format(request.user.pk)
+        if self.key == 'session' and request.session.session_key:
+            return 's{}'.format(request.session.session_key)
+        return 'i{}'.format(client_ip(request))
+
+    def subject(self, request):
+        if self.scope is None:
+            return self.ident(request)
+        return '{}:{}'.format(self.ident(request), self.scope)
+
+    def since(self):
+        return timezone.now() - datetime.timedelta(seconds=self.period)
+
+    def window_key(self, request, window):
+        return 'ratelimit:{}:{}:{}'.format(self.name, self.subject(request), window)
+
+    def windows(self, request, now):
+        window = int(now // self.period)
+        return self.window_key(request, window), self.window_key(request, window - 1)
+
+    def usage(self, request):
+        """
+        Return estimated number of actions within the last period.
+        """
+        now = time.time()
+        current, previous = self.windows(request, now)
+        cache = counters()
+        counts = cache.get_many([current, previous])
+        if not counts and self.fallback is not None:
+            count = self.fallback(request, self.since())
+            cache.add(current, count, self.period * 2)
+            return count
+        elapsed = (now % self.period) / self.period
+        return counts.get(current, 0) + counts.get(previous, 0) * (1 - elapsed)
+
+    def exceeded(self, request):
+        return self.usage(request) >= self.limit
+
+    def hit(self, request):
+        """
+        Count an action. Limits with a fallback count actions after they're
+        saved in the database.
+        """
+        cache = counters()
+        current, previous = self.windows(request, time.time())
+        if cache.add(current, 1, self.period * 2):
+            if self.fallback is not None and cache.get(previous) is None:
+                # nothing counted yet, the database has all actions including this one
+                cache.set(current, self.fallback(request, self.since()), self.period * 2)
+        else:
+            try:
+                cache.incr(current)
+            except ValueError:
+                # expired in the meantime
+                cache.add(current, 1, self.period * 2)
+
+
+class Cooldown(RateLimit):
+    """
+    Limit of one action per period, named in settings.RATE_LIMITS (its number
+    is 1). Time of the last action is kept in the cache for the period;
+    fallback(request, since) returns datetime of the last action since the
+    datetime found in the database, or None.
+    """
+
+    def cooldown_key(self, request):
+        return 'cooldown:{}:{}'.format(self.name, self.subject(request))
+
+    def last(self, request):
+        """
+        Return timestamp of the last action within the period, None if there's none.
+        """
+        cache = counters()
+        key = self.cooldown_key(request)
+        last = cache.get(key)
+        if last is None and self.fallback is not None:
+            found = self.fallback(request, self.since())
+            # 0 for no action, so that the database is asked once per period
+            last = found.timestamp() if found is not None else 0
+            cache.add(key, last, self.period)
+        return last or None
+
+    def remaining(self, request):
+        """
+        Return number of seconds until the next action is allowed, 0 if it is.
+        """
+        last = self.last(request)
+        if last is None:
+            return 0
+        return max(0, last + self.period - time.time())
+
+    def usage(self, request):
+        return 1 if self.remaining(request) else 0
+
+    def hit(self, request):
+        counters().set(self.cooldown_key(request), time.time(), self.period)
+
+
+class RateLimitMixin:
+    """
+    Mixin of views limiting an action (e.g. posting a form) with rate_limit,
+    name of a limit in settings.RATE_LIMITS. Views decide what is counted
+    by calling count_rate_limit(). Views may define method
+    rate_limit_fallback(request, since) counting the actions in the database,
+    and get_rate_limit_scope() if the actions are limited per e.g. Company.
+    """
+    rate_limit = None
+    rate_limit_class = RateLimit
+    rate_limit_fallback = None
+
+    def get_rate_limit_scope(self):
+        return None
+
+    def get_rate_limit(self):
+        return self.rate_limit_class(self.rate_limit, self.rate_limit_fallback,
+                                     self.get_rate_limit_scope())
+
+    def rate_limit_exceeded(self):
+        return self.get_rate_limit().exceeded(self.request)
+
+    def count_rate_limit(self):
+        self.get_rate_limit().hit(self.request)
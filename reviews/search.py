@@ -0,0 +1,109 @@
+"""
+Full-text search of what users wrote in Reviews and Interviews.
+
+Stock PostgreSQL has no Polish dictionary, so documents are indexed with
+'pracor' text search configuration (created in migration 0087): words are
+unaccented and lower-cased, but not stemmed. Inflection is handled on the
+query side instead: common Polish endings are cut off the searched words,
+which are then matched as prefixes ('rozmowy' finds 'rozmowa', 'rozmowie').
+"""
+import re
+from functools import reduce
+
+from django.contrib.postgres.search import SearchQueryField, SearchVector
+from django.db.models import Func, TextField, Value
+from django.db.models.functions import Concat
+from django.utils.html import escape
+from unidecode import unidecode
+
+CONFIG = 'pracor'
+
+# inflectional endings, longest first
+ENDINGS = sorted([
+    'a', 'e', 'i', 'o', 'u', 'y',
+    'ach', 'ami', 'em', 'ie', 'om', 'ow', 'mi',
+    'ego', 'emu', 'ej', 'ich', 'im', 'ym', 'ymi', 'ych', 'imi',
+    'anie', 'enie', 'ania', 'enia', 'aniu', 'eniu',
+    ], key=len, reverse=True)
+# shortest stem an ending is cut from
+MIN_STEM = 4
+
+WORDS = re.compile(r'\w+')
+
+# ts_headline markers, replaced with <mark> after the text is escaped
+START, STOP = '\x02', '\x03'
+HEADLINE_OPTIONS = ('StartSel={}, StopSel={}, MaxWords=30, MinWords=10, '
+                    'MaxFragments=2, FragmentDelimiter=" ... "').format(START, STOP)
+
+
+def stem(word):
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def search_terms(text):
+    """
+    Return unaccented, lower-cased stems of words of the text.
+    """
+    return [stem(word) for word in WORDS.findall(unidecode(text).lower())]
+
+
+class SearchConfig(Func):
+    """
+    Text search configuration, as the first argument of text search functions.
+    """
+    template = '%(expressions)s::regconfig'
+
+    def __init__(self, config=CONFIG, **extra):
+        super().__init__(Value(config), output_field=TextField(), **extra)
+
+
+class PrefixSearchQuery(Func):
+    """
+    Query (tsquery) matching documents containing all the terms as prefixes.
+    """
+    function = 'to_tsquery'
+
+    def __init__(self, text, **extra):
+        query = ' & '.join("'{}':*".format(term) for term in search_terms(text))
+        super().__init__(SearchConfig(), Value(query), output_field=SearchQueryField(),
+                         **extra)
+
+
+class Headline(Func):
+    """
+    Fragments of the document with matched words between START and STOP.
+    """
+    function = 'ts_headline'
+
+    def __init__(self, document, query, **extra):
+        super().__init__(SearchConfig(), document, query, Value(HEADLINE_OPTIONS),
+                         output_field=TextField(), **extra)
+
+
+def search_vector(model):
+    """
+    Weighted document of model's SEARCH_FIELDS.
+    """
+    return reduce(lambda vector, other: vector + other, [
+        SearchVector(field, weight=weight, config=CONFIG)
+        for field, weight in model.SEARCH_FIELDS])
+
+
+def search_document(model):
+    """
+    Text of model's SEARCH_FIELDS the headline is cut from.
+    """
+    fields = []
+    for field, weight in model.SEARCH_FIELDS:
+        fields.extend([field, Value('. ')])
+    return Concat(*fields[:-1], output_field=TextField())
+
+
+def snippet(headline):
+    """
+    Escape the headline and mark matched words.
+    """
+    return escape(headline).replace(START, '<mark>').replace(STOP, '</mark>')
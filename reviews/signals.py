@@ -0,0 +1,151 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from reviews.caching import bump_catalog_version, bump_company_version
+from reviews.models import (Company, CompanyStats, Interview, Position, Review,
+                            Salary, SalaryGroup, Vocabulary)
+
+
+ITEMS = (Review, Salary, Interview)
+
+
+@receiver(post_save, sender=Company)
+def create_company_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CompanyStats.objects.create(company=instance)
+
+
+def update_company_stats(sender, instance, created, raw=False, **kwargs):
+    """
+    Covers creation, approval, rejection and moderator edits of the item.
+    """
+    if raw:
+        return
+    CompanyStats.objects.record_change(instance.previous, instance)
+
+
+def remove_from_company_stats(sender, instance, **kwargs):
+    CompanyStats.objects.record_change(instance.stored_copy() or instance, None)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_catalog(sender, instance, raw=False, **kwargs):
+    """
+    Company search indexes of all workers have to be rebuilt.
+    """
+    if not raw:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Salary)
+def update_salary_groups(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    SalaryGroup.objects.record_change(instance.previous, instance)
+
+
+@receiver(post_delete, sender=Salary)
+def remove_from_salary_groups(sender, instance, **kwargs):
+    SalaryGroup.objects.record_change(instance.stored_copy() or instance, None)
+
+
+@receiver(post_save, sender=Position)
+def regroup_position_salaries(sender, instance, created, raw=False, **kwargs):
+    """
+    Salary is grouped by fields of its Position, its Salaries are moved
+    to other groups only if any of them changed.
+    """
+    if created or raw:
+        return
+    previous = instance.previous
+    if previous is None:
+        # state before saving unknown
+        if Salary.objects.filter(position=instance).exists():
+            SalaryGroup.objects.rebuild(companies=[instance.company_id])
+        return
+    if all(getattr(previous, field) == getattr(instance, field)
+           for field in SalaryGroup.POSITION_FIELDS):
+        return
+    SalaryGroup.objects.move_position(previous, instance)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_save, sender=Interview)
+def update_search_vector(sender, instance, created, raw=False, **kwargs):
+    """
+    Index the item unless none of its searched fields changed.
+    """
+    if raw:
+        return
+    previous = instance.previous
+    if previous is not None and all(
+            getattr(previous, field) == getattr(instance, field)
+            for field, weight in sender.SEARCH_FIELDS):
+        return
+    sender.objects.update_search_vectors(pk=instance.pk)
+
+
+@receiver(post_save, sender=Position)
+@receiver(post_save, sender=Interview)
+def update_vocabulary(sender, instance, created, raw=False, **kwargs):
+    """
+    Covers creation, association with a Company, edits and moderation.
+    """
+    if raw:
+        return
+    Vocabulary.objects.record_change(instance.previous, instance)
+
+
+@receiver(post_delete, sender=Position)
+@receiver(post_delete, sender=Interview)
+def remove_from_vocabulary(sender, instance, **kwargs):
+    Vocabulary.objects.record_change(instance.stored_copy() or instance, None)
+
+
+def invalidate_company_page(sender, instance, **kwargs):
+    """
+    Bump version of the page of the Company the instance is displayed on,
+    and of the Company it was displayed on if it has been moved.
+    """
+    if isinstance(instance, Company):
+        bump_company_version(instance.pk)
+    else:
+        bump_company_version(instance.company_id)
+        previous = getattr(instance, 'previous', None)
+        if previous is not None and previous.company_id != instance.company_id:
+            bump_company_version(previous.company_id)
+
+
+for item in ITEMS:
+    post_save.connect(update_company_stats, sender=item)
+    post_delete.connect(remove_from_company_stats, sender=item)
+
+for model in ITEMS + (Company, Position):
+    post_save.connect(invalidate_company_page, sender=model)
+    post_delete.connect(invalidate_company_page, sender=model)
+
+
+@receiver(m2m_changed, sender=Salary.benefits.through)
+def update_salary_group_benefits(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        SalaryGroup.objects.refresh_benefits([instance.pk])
+    elif pk_set:
+        SalaryGroup.objects.refresh_benefits(pk_set)
+
+
+@receiver(m2m_changed, sender=Salary.benefits.through)
+def invalidate_salary_benefits(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Benefits are displayed with salary groups.
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_company_version(instance.company_id)
+    elif pk_set:
+        companies = Salary.objects.filter(pk__in=pk_set).values_list('company', flat=True)
+        for company_pk in set(companies):
+            bump_company_version(company_pk)
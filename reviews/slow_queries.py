@@ -0,0 +1,235 @@
+"""
+Counter of SQL statements and opt-in recorder of slow ones
+(settings.SLOW_QUERY_THRESHOLD in ms).
+
+Cursors of every database connection are wrapped. Statements and their time
+are counted per thread for ViewMetricsMiddleware, statements slower than
+the threshold are logged with normalized SQL, fingerprint, url name of the
+view and the project function that issued them. A sample of slow SELECTs
+is logged with EXPLAIN (ANALYZE, BUFFERS) plan. Statements are aggregated
+by fingerprint and the most expensive ones are logged periodically.
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_local = threading.local()
+_statistics = {}
+_lock = threading.Lock()
+
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+# statements are recorded before parameters are interpolated
+PLACEHOLDERS = re.compile(r'%s')
+NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+LISTS = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+SPACES = re.compile(r'\s+')
+
+
+def set_request(request):
+    """
+    Remember request handled by the current thread (called by middleware).
+    """
+    _local.request = request
+
+
+def start_counting():
+    """
+    Start counting statements run by the current thread (called by middleware).
+    """
+    _local.counts = [0, 0.0]
+
+
+def stop_counting():
+    """
+    Stop counting and return number of statements and their time in seconds.
+    """
+    counts = getattr(_local, 'counts', None) or [0, 0.0]
+    _local.counts = None
+    return tuple(counts)
+
+
+def current_view():
+    request = getattr(_local, 'request', None)
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return match.url_name
+    if request is not None:
+        return request.path
+
+
+def normalize(sql):
+    """
+    Replace literals and parameter placeholders with '?' and lists of them
+    with '(...)', so that the same statement with different parameters
+    (or numbers of them) has the same text.
+    """
+    sql = STRINGS.sub('?', sql)
+    sql = PLACEHOLDERS.sub('?', sql)
+    sql = NUMBERS.sub('?', sql)
+    sql = LISTS.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def origin():
+    """
+    Return 'Class.method' (or 'module.function') of the innermost project
+    function on the stack.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(PROJECT_ROOT) and filename != __file__
+                and 'site-packages' not in filename):
+            instance = frame.f_locals.get('self')
+            if instance is not None:
+                owner = type(instance).__name__
+            else:
+                owner = frame.f_globals.get('__name__', '')
+            return '{}.{} ({}:{})'.format(owner, frame.f_code.co_name,
+                                          os.path.relpath(filename, PROJECT_ROOT),
+                                          frame.f_lineno)
+        frame = frame.f_back
+    return '-'
+
+
+def explain(connection, sql, params):
+    """
+    Return EXPLAIN (ANALYZE, BUFFERS) plan of a SELECT statement. ANALYZE
+    runs the statement again, so nothing else is explained. Inside a
+    transaction it's run in a savepoint, a failed EXPLAIN mustn't abort
+    the transaction of the request.
+    """
+    if not sql.lstrip().upper().startswith('SELECT') or connection.needs_rollback:
+        return
+    savepoint = connection.in_atomic_block
+    try:
+        with connection.connection.cursor() as cursor:
+            if savepoint:
+                cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            except Exception:
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                raise
+            if savepoint:
+                cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            return plan
+    except Exception:
+        logger.exception('EXPLAIN failed')
+
+
+def record(connection, sql, params, duration):
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    view = current_view()
+    source = origin()
+    milliseconds = duration * 1000
+    with _lock:
+        entry = _statistics.setdefault(key, {'sql': normalized, 'count': 0,
+                                             'total': 0, 'max': 0, 'origins': set()})
+        entry['count'] += 1
+        entry['total'] += milliseconds
+        entry['max'] = max(entry['max'], milliseconds)
+        entry['origins'].add(source)
+        recorded = sum(item['count'] for item in _statistics.values())
+    logger.warning('slow query {} {:.1f}ms view: {} origin: {} sql: {}'.format(
+        key, milliseconds, view, source, normalized))
+    if random.random() < settings.SLOW_QUERY_EXPLAIN_RATE:
+        plan = explain(connection, sql, params)
+        if plan:
+            logger.warning('slow query {} plan:\n{}'.format(key, plan))
+    if recorded % settings.SLOW_QUERY_REPORT_EVERY == 0:
+        report()
+
+
+def report(limit=10):
+    """
+    Log fingerprints which took most of database time in this process.
+    """
+    with _lock:
+        top = sorted(_statistics.items(), key=lambda item: item[1]['total'],
+                     reverse=True)[:limit]
+        lines = ['{} total: {:.0f}ms count: {} max: {:.1f}ms origin: {} sql: {}'.format(
+            key, entry['total'], entry['count'], entry['max'],
+            ', '.join(sorted(entry['origins'])), entry['sql'])
+                 for key, entry in top]
+    logger.warning('slow queries by total time:\n' + '\n'.join(lines))
+
+
+def statistics():
+    with _lock:
+        return {key: dict(entry, origins=set(entry['origins']))
+                for key, entry in _statistics.items()}
+
+
+class TimedCursor:
+    """
+    Proxy of DB-API cursor, which times execute and executemany.
+    """
+
+    def __init__(self, cursor, connection):
+        self.cursor = cursor
+        self.connection = connection
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def timed(self, method, sql, params):
+        start = time.perf_counter()
+        result = method(sql, params)
+        duration = time.perf_counter() - start
+        counts = getattr(_local, 'counts', None)
+        if counts is not None:
+            counts[0] += 1
+            counts[1] += duration
+        threshold = settings.SLOW_QUERY_THRESHOLD
+        if threshold is not None and duration * 1000 >= threshold:
+            record(self.connection, sql, params, duration)
+        return result
+
+    def execute(self, sql, params=None):
+        return self.timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self.timed(self.cursor.executemany, sql, param_list)
+
+
+def install(sender, connection, **kwargs):
+    """
+    Wrap cursors of the connection (connection_created receiver).
+    """
+    if getattr(connection, 'slow_queries_installed', False):
+        return
+    create_cursor = connection.create_cursor
+
+    def create_timed_cursor(*args, **kwargs):
+        return TimedCursor(create_cursor(*args, **kwargs), connection)
+
+    connection.create_cursor = create_timed_cursor
+    connection.slow_queries_installed = True
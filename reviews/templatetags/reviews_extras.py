@@ -1,6 +1,6 @@
 from django import template
+from reviews.choices import choice_label
 from reviews.models import Review, Salary
-from django.contrib.postgres.aggregates.general import StringAgg
 
 register = template.Library()
 
@@ -117,25 +117,17 @@ def translate_item(item):
 @register.filter('period')
 def translate_period(item):
     """
-    Rosolve salary.period database choices into display values.
+    Resolve salary.period database choices into display values.
     """
-    try:
-        obj = Salary.objects.filter(period=item).last()
-        return obj.get_period_display()
-    except AttributeError:
-        return ''
+    return choice_label(Salary, 'period', item)
+
 
-    
 @register.filter('contract')
-def translate_period(item):
+def translate_contract(item):
     """
-    Rosolve salary.contract_type database choices into display values.
+    Resolve salary.contract_type database choices into display values.
     """
-    try:
-        obj = Salary.objects.filter(contract_type=item).last()
-        return obj.get_contract_type_display()
-    except AttributeError:
-        return ''
+    return choice_label(Salary, 'contract_type', item)
 
 @register.filter('bonus_period_count')
 def bonus_period_count(items):
@@ -143,24 +135,17 @@ def bonus_period_count(items):
     
 @register.filter('bonus_period')
 def translate_bonus_period(items):
-    output = []
-    for item in items:
-        if item is None:
-            continue
-        try:
-            obj = Salary.objects.filter(bonus_period=item).last()
-            output.append(obj.get_bonus_period_display())
-        except AttributeError:
-            output += ''
-    return ', '.join(output)
+    """
+    Resolve salary.bonus_period choices (single value or list) into display values.
+    """
+    if isinstance(items, str):
+        items = [items]
+    return ', '.join(choice_label(Salary, 'bonus_period', item)
+                     for item in items if item is not None)
 
 @register.filter('gross_net')
 def translate_gross_net(item):
-    try:
-        obj = Salary.objects.filter(gross_net=item).last()
-    except:
-        return
-    return obj.get_gross_net_display()
+    return choice_label(Salary, 'gross_net', item, default=None)
 
 
 @register.filter('item_name_singular')
@@ -210,18 +195,6 @@ def count_slider(obj, item):
     return obj[item+'_count']
 
 
-@register.filter('benefits')
-def benefits(obj_list):
-    """
-    Return string of all Benefit names related to the Salaries, 
-    whose id's are passed in obj_list.
-    """
-    return(Salary.objects.filter(
-        id__in=obj_list).aggregate(list=StringAgg(
-            'benefits__name', distinct=True, delimiter = ', '))['list'])
-
-
-
 @register.filter('social_auth')
 def social(obj):
     dictionary = {
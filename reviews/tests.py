@@ -1,3 +1,1589 @@
-from django.test import TestCase
+import datetime
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Profile, User, Visit, VisitDaily
+
+from .middleware import QueryBudgetExceeded
+from .models import (AccessAttempt, AccessAttemptDaily, Benefit, Company, CompanyStats, Interview, Position,
+                     Review, Salary, SalaryGroup, Vocabulary)
+from . import partitions, profanities, slow_queries, websites
+from .eligibility import Eligibility
+from .ratelimit import Cooldown, RateLimit, client_ip
+from .autocomplete import company_index
+from .browse import company_facets
+from .caching import bump_company_version, company_version
+from .events import event_writer
+from .forms import CompanyCreateForm
+from .percentiles import PERCENTILES
+from .templatetags.reviews_extras import register
+from .validators import ProfanitiesFilter
+
+
+def clear_caches():
+    cache.clear()
+    caches['counters'].clear()
+
+
+class CompanyDataMixin:
+    """
+    Helpers creating Companies with Reviews, Salaries and Interviews.
+    """
+
+    def create_user(self):
+        number = User.objects.count() + 1
+        return User.objects.create_user(email='user{}@pracor.pl'.format(number),
+                                        password='password123')
+
+    def login_contributor(self):
+        user = self.create_user()
+        user.profile.contributed = True
+        user.profile.save()
+        self.client.force_login(user)
+
+    def create_company(self, name='Firma'):
+        return Company.objects.create(name=name, headquarters_city='Warszawa',
+                                      website='http://www.{}.pl'.format(name.lower()))
+
+    def create_position(self, company, position='Analityk'):
+        return Position.objects.create(user=self.create_user(), company=company,
+                                       position=position, location='Warszawa',
+                                       start_date_month=1, start_date_year=2015)
+
+    def create_items(self, company, number):
+        for i in range(number):
+            Review.objects.create(company=company, position=self.create_position(company),
+                                  title='Opinia', pros='zalety', cons='wady',
+                                  overallscore=4, advancement=3, worklife=5,
+                                  compensation=2, environment=4)
+            Salary.objects.create(company=company, salary_input=5000 + i, period='M',
+                                  bonus_input=1000, bonus_period='K',
+                                  position=self.create_position(company))
+            Interview.objects.create(company=company, user=self.create_user(),
+                                     position='Analityk', how_got='A', difficulty=3,
+                                     got_offer=True, impressions='wrażenia', rating=4)
+
+    def count_page_queries(self, company, cached=False):
+        """
+        Return number of queries run by a company page view of an anonymous user.
+        """
+        url = company.get_absolute_url()
+        # first visit sets the free views cookie
+        self.client.get(url)
+        if not cached:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+class CompanyPageQueryBudgetTest(CompanyDataMixin, TestCase):
+    """
+    Company page has to be rendered with a fixed number of queries,
+    independent of the number of items the company has.
+    """
+    # company with stats, salary groups count, first review,
+    # first salary group, first interview (anonymous users have no session)
+    QUERY_BUDGET = 5
+
+    def test_query_budget(self):
+        small = self.create_company('Mala')
+        self.create_items(small, 1)
+        big = self.create_company('Duza')
+        self.create_items(big, 8)
+        queries = self.count_page_queries(small)
+        self.assertLessEqual(queries, self.QUERY_BUDGET)
+        self.assertEqual(self.count_page_queries(big), queries)
+
+    def test_company_without_items(self):
+        company = self.create_company()
+        self.assertLessEqual(self.count_page_queries(company), self.QUERY_BUDGET)
+
+
+class CompanyPageCacheTest(CompanyDataMixin, TestCase):
+    """
+    Company page fragments are served from cache until company data changes.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.company = self.create_company()
+        self.create_items(self.company, 2)
+
+    def test_cached_page_skips_section_queries(self):
+        uncached = self.count_page_queries(self.company)
+        cached = self.count_page_queries(self.company, cached=True)
+        # only company with stats is queried
+        self.assertLess(cached, uncached)
+        self.assertLessEqual(cached, 1)
+
+    def test_new_item_invalidates_page(self):
+        url = self.company.get_absolute_url()
+        self.assertContains(self.client.get(url), '<div class="counter-link">2</div>')
+        self.create_items(self.company, 1)
+        self.assertContains(self.client.get(url), '<div class="counter-link">3</div>')
+
+    def test_rejected_item_invalidates_page(self):
+        url = self.company.get_absolute_url()
+        self.client.get(url)
+        for review in Review.objects.all():
+            review.approved = False
+            review.save()
+        self.assertContains(self.client.get(url), 'Firma nie ma jeszcze opinii.')
+
+    def test_versions_kept_apart_from_fragments(self):
+        version = company_version(self.company.pk)
+        cache.clear()
+        self.assertEqual(company_version(self.company.pk), version)
+        bump_company_version(self.company.pk)
+        self.assertEqual(company_version(self.company.pk), version + 1)
+
+
+class SalaryGroupBenefitsTest(CompanyDataMixin, TestCase):
+    """
+    Benefits of salary groups are rendered without per-group queries.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.company = self.create_company()
+        self.login_contributor()
+
+    def add_salary(self, position, *benefits):
+        salary = Salary.objects.create(company=self.company, salary_input=5000, period='M',
+                                       position=self.create_position(self.company, position))
+        salary.benefits.add(*[Benefit.objects.get_or_create(name=name)[0] for name in benefits])
+
+    def list_queries(self):
+        url = reverse('salary_items', kwargs={'pk': self.company.pk, 'slug': self.company.slug})
+        clear_caches()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in context.captured_queries], response
+
+    def test_benefits_of_group(self):
+        self.add_salary('Analityk', 'Samochód', 'Laptop')
+        self.add_salary('Analityk', 'Laptop')
+        queries, response = self.list_queries()
+        self.assertContains(response, 'Laptop, Samochód')
+
+    def test_benefits_not_queried(self):
+        for position in ('Analityk', 'Kierownik', 'Dyrektor'):
+            self.add_salary(position, 'Samochód')
+        queries, response = self.list_queries()
+        self.assertContains(response, 'Samochód', count=3)
+        self.assertFalse([sql for sql in queries if 'reviews_benefit' in sql])
+
+    def test_queries_independent_of_groups(self):
+        self.add_salary('Analityk', 'Laptop')
+        queries, response = self.list_queries()
+        for position in ('Kierownik', 'Dyrektor', 'Prezes'):
+            self.add_salary(position, 'Samochód')
+        self.assertEqual(len(self.list_queries()[0]), len(queries))
+
+
+class TemplateFiltersTest(TestCase):
+    """
+    Template filters must not access the database.
+    """
+    # filter name: arguments
+    SAMPLES = {
+        'klass': [object()],
+        'class': [{}],
+        'thermometer': [3],
+        'difficulty': [3],
+        'stars': [3.5],
+        'rating_name': ['worklife'],
+        'file': ['review'],
+        'file_header': ['review'],
+        'translate': ['review'],
+        'period': ['M'],
+        'contract': ['B'],
+        'bonus_period_count': [['K', None]],
+        'bonus_period': [['K', 'M', None]],
+        'gross_net': ['N'],
+        'item_name_singular': ['review'],
+        'item_list_title': ['review'],
+        'trans_item': ['review'],
+        'width': [{'salary_min': 1, 'salary_avg': 2, 'salary_max': 4}, 'salary'],
+        'min_slider': [{'salary_min': 1}, 'salary'],
+        'max_slider': [{'salary_max': 4}, 'salary'],
+        'count_slider': [{'salary_count': 2}, 'salary'],
+        'social_auth': ['facebook'],
+        'social_auth_fontello': ['facebook'],
+        'username': ['jan@pracor.pl'],
+    }
+
+    def test_filters_without_queries(self):
+        self.assertEqual(set(register.filters), set(self.SAMPLES),
+                         'Add sample arguments of new filters to SAMPLES.')
+        for name, arguments in self.SAMPLES.items():
+            with self.subTest(filter=name), self.assertNumQueries(0):
+                register.filters[name](*arguments)
+
+    def test_choice_labels(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(register.filters['period']('M'), 'miesięcznie')
+            self.assertEqual(register.filters['contract']('C'), 'samozatrudnienie')
+            self.assertEqual(register.filters['bonus_period'](['K', 'R', None]),
+                             'kwartalnie, rocznie')
+            self.assertEqual(register.filters['bonus_period']('K'), 'kwartalnie')
+            self.assertEqual(register.filters['gross_net']('G'), 'brutto')
+            self.assertEqual(register.filters['period']('X'), '')
+
+
+class SalaryPercentilesTest(CompanyDataMixin, TestCase):
+    """
+    Incrementally maintained percentiles match percentile_cont over Salary rows.
+    """
+
+    def setUp(self):
+        self.company = self.create_company()
+        self.salaries = [
+            Salary.objects.create(company=self.company, salary_input=value, period='M',
+                                  bonus_input=value // 10, bonus_period='R',
+                                  position=self.create_position(self.company))
+            for value in (3000, 4500, 5200, 6100, 9000, 25000)]
+
+    def database_percentiles(self, field):
+        fractions = ', '.join(str(fraction) for fraction in PERCENTILES.values())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT percentile_cont(ARRAY[{}]) WITHIN GROUP (ORDER BY {}) '
+                'FROM reviews_salary WHERE company_id = %s '
+                'AND approved IS DISTINCT FROM false'.format(fractions, field),
+                [self.company.pk])
+            values = cursor.fetchone()[0]
+        return dict(zip(PERCENTILES, [round(value) for value in values]))
+
+    def assertPercentiles(self):
+        stats = CompanyStats.objects.get(company=self.company)
+        group = SalaryGroup.objects.get(company=self.company)
+        for name, field in CompanyStats.DISTRIBUTIONS.items():
+            self.assertEqual(stats.percentiles[name], self.database_percentiles(field))
+        for name, field in SalaryGroup.DISTRIBUTIONS.items():
+            self.assertEqual(group.percentiles[name], self.database_percentiles(field))
+
+    def test_incremental_percentiles(self):
+        self.assertPercentiles()
+        self.salaries[-1].approved = False
+        self.salaries[-1].save()
+        self.assertPercentiles()
+        self.salaries[0].delete()
+        self.assertPercentiles()
+        self.assertEqual(CompanyStats.objects.get(company=self.company).salary_percentiles['median'],
+                         self.database_percentiles('salary_gross_annual')['median'] // 12)
+
+    def test_net_salary(self):
+        salary = Salary.objects.create(company=self.company, salary_input=4321, period='M',
+                                       gross_net='N', bonus_input=777, bonus_period='M',
+                                       bonus_gross_net='N',
+                                       position=self.create_position(self.company))
+        for field in ('salary_gross_annual', 'salary_gross_input_period',
+                      'bonus_gross_annual', 'bonus_gross_input_period'):
+            self.assertIsInstance(getattr(salary, field), int)
+        self.assertPercentiles()
+        stats = CompanyStats.objects.get(company=self.company)
+        self.assertEqual(stats.salary_annual_sum, Salary.objects.filter(
+            company=self.company).aggregate(total=Sum('salary_gross_annual'))['total'])
+
+    def test_position_moved(self):
+        other = self.create_company('Druga')
+        salary = self.salaries[0]
+        Salary.objects.filter(pk=salary.pk).update(company=other)
+        position = Position.objects.get(pk=salary.position_id)
+        position.company = other
+        position.save()
+        self.assertNotIn(salary.pk, SalaryGroup.objects.get(company=self.company).salary_object_list)
+        self.assertEqual(SalaryGroup.objects.get(company=other).salary_object_list, [salary.pk])
+
+    def test_position_changed(self):
+        position = Position.objects.get(pk=self.salaries[0].position_id)
+        position.end_date_month = 1
+        with CaptureQueriesContext(connection) as context:
+            position.save()
+        self.assertFalse([query for query in context.captured_queries
+                          if 'reviews_salary' in query['sql']])
+        position.location = 'Kraków'
+        position.save()
+        self.assertEqual(SalaryGroup.objects.get(company=self.company, location='Kraków')
+                         .salary_object_list, [self.salaries[0].pk])
+        group = SalaryGroup.objects.get(company=self.company, location='Warszawa')
+        self.assertEqual(group.salary_object_list, sorted(salary.pk for salary in self.salaries[1:]))
+        self.assertEqual(group.salary_count, 5)
+        self.assertEqual(group.salary_min, 4500)
+        SalaryGroup.objects.rebuild()
+        self.assertEqual(SalaryGroup.objects.get(company=self.company, location='Warszawa')
+                         .percentiles, group.percentiles)
+
+    def test_group_created_concurrently(self):
+        group = SalaryGroup.objects.get(company=self.company)
+        key = SalaryGroup.key(self.salaries[0])
+        # the group didn't exist when looked up, but exists when created
+        with mock.patch('django.db.models.query.QuerySet.first', return_value=None):
+            self.assertEqual(SalaryGroup.objects.locked_group(key), group)
+        self.assertEqual(SalaryGroup.objects.filter(company=self.company).count(), 1)
+
+    def test_rebuild(self):
+        stats = CompanyStats.objects.get(company=self.company)
+        group = SalaryGroup.objects.get(company=self.company)
+        CompanyStats.objects.rebuild()
+        SalaryGroup.objects.rebuild()
+        self.assertEqual(CompanyStats.objects.get(company=self.company).percentiles,
+                         stats.percentiles)
+        self.assertEqual(SalaryGroup.objects.get(company=self.company).percentiles,
+                         group.percentiles)
+
+
+class CompanyStatsTest(CompanyDataMixin, TestCase):
+    """
+    Incrementally maintained CompanyStats match live aggregates of items
+    and the result of rebuild().
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.company = self.create_company()
+        self.other = self.create_company('Druga')
+        self.create_items(self.company, 3)
+
+    def review(self, company, score):
+        return Review.objects.create(company=company, position=self.create_position(company),
+                                     title='Opinia', pros='zalety', cons='wady',
+                                     overallscore=score, advancement=score, worklife=2,
+                                     compensation=1, environment=score)
+
+    def interview(self, company, rating):
+        return Interview.objects.create(company=company, user=self.create_user(),
+                                        position='Analityk', how_got='A', difficulty=3,
+                                        got_offer=True, impressions='wrażenia', rating=rating)
+
+    def assertStats(self, *companies):
+        for company in companies:
+            stats = CompanyStats.objects.get(company=company)
+            self.assertEqual(stats.review_count, company.reviews.count())
+            self.assertEqual(stats.interview_count, company.interviews.count())
+            for score, value in company.scores.items():
+                if value is None:
+                    self.assertIsNone(stats.scores[score])
+                else:
+                    self.assertAlmostEqual(stats.scores[score], value)
+            if company.sum_reviews['overallscore__avg'] is not None:
+                self.assertAlmostEqual(stats.scores['overallscore'],
+                                       company.sum_reviews['overallscore__avg'])
+            expected = company.sum_interviews['sum_avg']
+            if expected is None:
+                self.assertIsNone(stats.sum_interviews['sum_avg'])
+            else:
+                self.assertAlmostEqual(stats.sum_interviews['sum_avg'], expected)
+        incremental = {stats.company_id: stats for stats in CompanyStats.objects.filter(
+            company__in=companies)}
+        for rebuilt in CompanyStats.objects.rebuild(companies=[c.pk for c in companies]):
+            stats = incremental[rebuilt.company_id]
+            for field in ['review_count', 'interview_count', 'interview_rating_sum',
+                          'salary_count', 'salary_annual_sum'] + [
+                              score + '_sum' for score in CompanyStats.SCORES]:
+                self.assertEqual(getattr(stats, field), getattr(rebuilt, field), field)
+
+    def test_create_approve_reject_delete(self):
+        review = self.review(self.company, 1)
+        interview = self.interview(self.company, 1)
+        self.assertStats(self.company)
+        review.approved = True
+        review.save()
+        self.assertStats(self.company)
+        review.approved = False
+        review.save()
+        interview.approved = False
+        interview.save()
+        self.assertStats(self.company)
+        Review.objects.filter(company=self.company).first().delete()
+        Interview.objects.filter(company=self.company, approved=None).first().delete()
+        self.assertStats(self.company)
+
+    def test_company_changed(self):
+        review = self.review(self.company, 5)
+        interview = self.interview(self.company, 5)
+        version = company_version(self.company.pk)
+        review.company = self.other
+        review.save()
+        interview.company = self.other
+        interview.save()
+        self.assertStats(self.company, self.other)
+        self.assertEqual(CompanyStats.objects.get(company=self.other).review_count, 1)
+        # page of the Company the items were moved from is invalidated too
+        self.assertNotEqual(company_version(self.company.pk), version)
+
+
+class KeysetPaginationTest(CompanyDataMixin, TestCase):
+    """
+    Item lists are paginated by (date, id) cursors without COUNT and OFFSET.
+    """
+
+    def setUp(self):
+        self.company = self.create_company()
+        self.create_items(self.company, 12)
+        self.login_contributor()
+        self.url = reverse('review_items', kwargs={'pk': self.company.pk,
+                                                   'slug': self.company.slug})
+
+    def get_page(self, query=''):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj'], context.captured_queries
+
+    def test_walk_pages(self):
+        expected = list(Review.objects.order_by('-date', '-id').values_list('id', flat=True))
+        page, first_queries = self.get_page()
+        self.assertEqual(page.count, 12)
+        seen = [review.pk for review in page.object_list]
+        pages = [page]
+        while page.has_next:
+            page, queries = self.get_page(page.next_query())
+            seen += [review.pk for review in page.object_list]
+            pages.append(page)
+            self.assertEqual(len(queries), len(first_queries))
+            self.assertFalse([query for query in queries
+                              if 'COUNT(' in query['sql'] or 'OFFSET' in query['sql']])
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+        previous, queries = self.get_page(pages[-1].previous_query())
+        self.assertEqual(previous.object_list, pages[-2].object_list)
+        self.assertTrue(previous.has_next)
+        self.assertTrue(previous.has_previous)
+
+    def test_salary_groups_pages(self):
+        for i in range(6):
+            Salary.objects.create(company=self.company, salary_input=4000, period='M',
+                                  position=self.create_position(self.company,
+                                                                'Stanowisko {}'.format(i)))
+        url = reverse('salary_items', kwargs={'pk': self.company.pk, 'slug': self.company.slug})
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(url + first.next_query()).context['page_obj']
+        self.assertEqual(first.count, 7)
+        # group of 12 salaries first, then groups of one by descending id
+        self.assertEqual(first.object_list[0]['salary_count'], 12)
+        groups = [group['id'] for group in first.object_list + second.object_list]
+        self.assertEqual(groups, [groups[0]] + sorted(groups[1:], reverse=True))
+        self.assertFalse(second.has_next)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url + '?po=abc').status_code, 404)
+        self.assertEqual(self.client.get(self.url + '?po=999999').status_code, 404)
+
+
+class ViewMetricsMiddlewareTest(CompanyDataMixin, TestCase):
+    """
+    Main views have to stay within query budgets set in settings.QUERY_BUDGETS.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.company = self.create_company()
+        self.create_items(self.company, 6)
+
+    def test_views_within_budget(self):
+        kwargs = {'pk': self.company.pk, 'slug': self.company.slug}
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)
+        self.assertEqual(self.client.get(self.company.get_absolute_url()).status_code, 200)
+        self.login_contributor()
+        for name in ('company_page', 'review_items', 'salary_items', 'interview_items'):
+            with self.subTest(view=name):
+                self.assertEqual(self.client.get(reverse(name, kwargs=kwargs)).status_code, 200)
+        response = self.client.get(reverse('company_search', kwargs={'searchterm': 'fir'}),
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+
+    def test_budget_exceeded(self):
+        with self.settings(QUERY_BUDGETS={'company_page': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(self.company.get_absolute_url())
+
+    def test_metrics_logged(self):
+        with self.assertLogs('reviews.middleware', 'INFO') as logs:
+            self.client.get(self.company.get_absolute_url())
+        self.assertIn('view: company_page queries:', logs.output[0])
+
+    def test_queries_counted_without_debug_cursor(self):
+        with mock.patch.object(connection, 'queries_log') as queries_log, \
+                self.assertLogs('reviews.middleware', 'INFO') as logs:
+            self.client.get(self.company.get_absolute_url())
+        self.assertFalse(queries_log.append.called)
+        self.assertNotIn('queries: 0 ', logs.output[0])
+
+
+@override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_EXPLAIN_RATE=1)
+class SlowQueriesTest(CompanyDataMixin, TestCase):
+    """
+    Slow statements are logged with view, origin, fingerprint and plan.
+    """
+
+    def setUp(self):
+        slow_queries.install(None, connection)
+        self.company = self.create_company()
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    def test_normalize(self):
+        with mock.patch.object(slow_queries, 'record') as record:
+            list(Company.objects.filter(pk__in=[1, 2], name='x'))
+            list(Company.objects.filter(pk__in=[1, 2, 3, 4], name='y'))
+        first, second = [slow_queries.normalize(call[0][1]) for call in record.call_args_list]
+        self.assertEqual(first, second)
+        self.assertIn('IN (...)', first)
+        self.assertNotIn('%s', first)
+
+    def test_failed_explain_keeps_transaction(self):
+        with self.assertLogs('reviews.slow_queries', 'ERROR'):
+            self.assertIsNone(slow_queries.explain(connection, 'SELECT * FROM missing', None))
+        self.assertEqual(Company.objects.count(), 1)
+
+    def test_slow_query_logged(self):
+        with self.assertLogs('reviews.slow_queries', 'WARNING') as logs:
+            self.client.get(self.company.get_absolute_url())
+        output = '\n'.join(logs.output)
+        self.assertIn('view: company_page', output)
+        self.assertIn('CompanyDetailView.get_object', output)
+        self.assertIn('actual time=', output)
+        origins = set().union(*[entry['origins']
+                                for entry in slow_queries.statistics().values()])
+        self.assertTrue([origin for origin in origins
+                         if origin.startswith('CompanyDetailView.get_object')])
+
+
+class CompanySearchTest(CompanyDataMixin, TestCase):
+    """
+    Trigram search ignores case and Polish characters and ranks matches.
+    """
+
+    def setUp(self):
+        for name in ('Bank Polski', 'Polskie Łożyska', 'Polska', 'Orlen', 'Pollena'):
+            self.create_company(name)
+
+    def names(self, searchterm):
+        return [company.name for company in Company.objects.search(searchterm)]
+
+    def test_exact_and_prefix_first(self):
+        self.assertEqual(self.names('polska')[:2], ['Polska', 'Polskie Łożyska'])
+        self.assertIn('Bank Polski', self.names('polska'))
+
+    def test_accents_and_case(self):
+        self.assertEqual(self.names('LOZYSKA'), ['Polskie Łożyska'])
+
+    def test_typo(self):
+        self.assertIn('Orlen', self.names('orlenn'))
+
+    def test_pattern_characters_escaped(self):
+        self.assertEqual(self.names('%'), [])
+
+    def test_limit(self):
+        self.assertEqual(len(Company.objects.search('pol', limit=2)), 2)
+
+    def test_sitemap(self):
+        hidden = Company.objects.get(name='Orlen')
+        hidden.approved = False
+        hidden.save()
+        response = self.client.get('/sitemap.xml')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, Company.objects.get(name='Polska').get_absolute_url())
+        self.assertNotContains(response, hidden.get_absolute_url())
+
+
+class AutocompleteTest(CompanyDataMixin, TestCase):
+    """
+    Search bar autocomplete is answered from in-process index.
+    """
+
+    def setUp(self):
+        clear_caches()
+        for name in ('Bank Polski SA', 'Polskie Łożyska', 'Orlen'):
+            self.create_company(name)
+        self.create_items(Company.objects.get(name='Polskie Łożyska'), 1)
+
+    def options(self, term):
+        response = self.client.get(reverse('company_search', kwargs={'searchterm': ''}),
+                                   {'term': term}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return [option['label'] for option in response.json()]
+
+    def test_prefixes(self):
+        self.assertEqual(self.options('pol'), ['Polskie Łożyska', 'Bank Polski SA'])
+        self.assertEqual(self.options('łoży'), ['Polskie Łożyska'])
+        self.assertEqual(self.options('www.orlen'), ['Orlen'])
+        self.assertEqual(self.options('orlen.pl'), ['Orlen'])
+        self.assertEqual(self.options('https://WWW.Orlen.pl/kariera'), ['Orlen'])
+        self.assertEqual(self.options('bank polski s.a.'), ['Bank Polski SA'])
+
+    def test_no_queries(self):
+        self.options('ban')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.options('bank'), ['Bank Polski SA'])
+
+    def test_new_company(self):
+        self.assertEqual(self.options('pge'), [])
+        self.create_company('PGE')
+        self.assertEqual(self.options('pge'), ['PGE'])
+
+    def test_rebuilt_by_one_request(self):
+        self.assertEqual(self.options('orl'), ['Orlen'])
+        self.create_company('Orlen Lietuva')
+        # another request is rebuilding the index, the old one is used meanwhile
+        with company_index.building, mock.patch.object(company_index, 'build') as build:
+            self.assertEqual(self.options('orl'), ['Orlen'])
+        self.assertFalse(build.called)
+        self.assertEqual(self.options('orl'), ['Orlen', 'Orlen Lietuva'])
+
+    def test_short_term(self):
+        self.assertEqual(self.options('po'), [])
+
+    def test_limit(self):
+        for i in range(12):
+            self.create_company('Orlen {}'.format(i))
+        with self.settings(AUTOCOMPLETE_LIMIT=5):
+            self.assertEqual(len(self.options('orl')), 5)
+
+    def test_http_validators(self):
+        url = reverse('company_search', kwargs={'searchterm': ''})
+        response = self.client.get(url, {'term': 'orlen'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.client.get(url, {'term': 'orlen'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_login_required_view_private(self):
+        self.login_contributor()
+        url = reverse('create_item_search', kwargs={'item': 'review', 'searchterm': ''})
+        response = self.client.get(url, {'term': 'orlen'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+
+
+class VocabularyTest(CompanyDataMixin, TestCase):
+    """
+    Position form autocomplete is answered from the Company vocabulary,
+    which follows changes of Positions and Interviews.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.company = self.create_company()
+        for position in ('Analityk', 'analityk', 'Starszy Analityk', 'Księgowa'):
+            self.create_position(self.company, position)
+
+    def vocabulary(self, field='position'):
+        return dict(self.company.vocabulary.filter(field=field).values_list(
+            'normalized', 'count'))
+
+    def options(self, term, field='position', view='review'):
+        self.login_contributor()
+        url = reverse(view, kwargs={'id': self.company.pk, 'slug': self.company.slug})
+        response = self.client.get(url, {'term': term, 'field': 'id_' + field},
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return [option['label'] for option in response.json()]
+
+    def test_counts(self):
+        self.assertEqual(self.vocabulary(), {'analityk': 2, 'starszy analityk': 1,
+                                             'ksiegowa': 1})
+        self.assertEqual(self.vocabulary('location'), {'warszawa': 4})
+
+    def test_changes(self):
+        position = Position.objects.get(position='Księgowa')
+        position.position = 'Analityk'
+        position.save()
+        self.assertEqual(self.vocabulary(), {'analityk': 3, 'starszy analityk': 1})
+        other = self.create_company('Inna')
+        position.company = other
+        position.save()
+        self.assertEqual(self.vocabulary(), {'analityk': 2, 'starszy analityk': 1})
+        position.delete()
+        self.assertEqual(self.vocabulary(), {'analityk': 2, 'starszy analityk': 1})
+        self.assertFalse(other.vocabulary.exists())
+
+    def test_interviews(self):
+        interview = Interview.objects.create(
+            company=self.company, user=self.create_user(), position='Kasjer',
+            department='Sprzedaż', how_got='A', difficulty=3, got_offer=False,
+            impressions='wrażenia', rating=3)
+        self.assertEqual(self.vocabulary('department'), {'sprzedaz': 1})
+        self.assertEqual(self.options('kas', view='interview'), ['Kasjer'])
+        interview.approved = False
+        interview.save()
+        self.assertNotIn('kasjer', self.vocabulary())
+
+    def test_rebuild(self):
+        expected = {field: self.vocabulary(field) for field, label in Vocabulary.FIELDS}
+        Vocabulary.objects.all().delete()
+        Vocabulary.objects.rebuild()
+        self.assertEqual(
+            {field: self.vocabulary(field) for field, label in Vocabulary.FIELDS}, expected)
+
+    def test_ranking(self):
+        self.assertEqual(self.options('anal'), ['Analityk', 'Starszy Analityk'])
+        self.assertEqual(self.options('ksieg'), ['Księgowa'])
+        self.assertEqual(self.options('wars', 'location'), ['Warszawa'])
+        self.assertEqual(self.options('wars', 'user'), [])
+
+    def test_cached(self):
+        self.options('anal')
+        with self.assertNumQueries(0):
+            self.assertEqual(Vocabulary.objects.suggest(self.company.pk, 'position', 'star'),
+                             ['Starszy Analityk'])
+        self.create_position(self.company, 'Starszy Księgowy')
+        self.assertEqual(Vocabulary.objects.suggest(self.company.pk, 'position', 'star'),
+                         ['Starszy Analityk', 'Starszy Księgowy'])
+
+
+class ContentSearchTest(CompanyDataMixin, TestCase):
+    """
+    Full-text search finds inflected, unaccented words in selected items.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.company = self.create_company()
+        self.review = Review.objects.create(
+            company=self.company, position=self.create_position(self.company),
+            title='Dobra atmosfera', pros='Miła atmosfera w zespole, elastyczne godziny pracy.',
+            cons='Niskie zarobki < oczekiwania, brak podwyżek.', overallscore=4, advancement=3,
+            worklife=5, compensation=2, environment=4)
+        self.interview = Interview.objects.create(
+            company=self.company, user=self.create_user(), position='Księgowa', how_got='A',
+            difficulty=3, got_offer=True, questions='Pytania o podwyżki i zarobki.',
+            impressions='Rozmowa w miłej atmosferze.', rating=4)
+
+    def search(self, text, **params):
+        self.login_contributor()
+        response = self.client.get(reverse('content_search_json'), dict(params, q=text))
+        return [(result['type'], result['id']) for result in response.json()['results']]
+
+    def test_inflection_and_accents(self):
+        self.assertEqual(Review.objects.search('atmosferą').count(), 1)
+        self.assertEqual(Interview.objects.search('rozmowy').count(), 1)
+        self.assertEqual(Interview.objects.search('podwyzka zarobkow').count(), 1)
+        self.assertEqual(Review.objects.search('premia').count(), 0)
+
+    def test_sql(self):
+        sql, params = Review.objects.search('atmosfera').query.sql_with_params()
+        self.assertIn('to_tsquery(%s::regconfig, %s)', sql)
+        self.assertIn('ts_headline(%s::regconfig, ', sql)
+        self.assertNotIn('plainto_tsquery', sql)
+        self.assertIn("'atmosfer':*", params)
+
+    def test_ranking(self):
+        # title weighs more than pros and cons
+        self.assertEqual(self.search('atmosfera'), [('review', self.review.pk),
+                                                    ('interview', self.interview.pk)])
+        self.assertEqual(self.search('atmosfera', firma=self.create_company('Inna').pk), [])
+
+    def test_snippet(self):
+        self.login_contributor()
+        response = self.client.get(reverse('content_search_json'), {'q': 'zarobki'})
+        snippets = [result['snippet'] for result in response.json()['results']]
+        self.assertIn('<mark>zarobki</mark>', snippets[0])
+        self.assertIn('&lt; oczekiwania', ''.join(snippets))
+        response = self.client.get(reverse('content_search'), {'q': 'zarobki'})
+        self.assertContains(response, '<mark>zarobki</mark>')
+
+    def test_moderation(self):
+        self.interview.approved = False
+        self.interview.save()
+        self.assertEqual(self.search('atmosfera'), [('review', self.review.pk)])
+
+    def test_incremental(self):
+        self.review.cons = 'Premia tylko raz w roku.'
+        self.review.save()
+        self.assertEqual(self.search('premie'), [('review', self.review.pk)])
+        Review.objects.update(search_vector=None)
+        call_command('rebuild_search_vectors', stdout=StringIO())
+        self.assertEqual(self.search('premie'), [('review', self.review.pk)])
+
+
+class CompanyMatchTest(CompanyDataMixin, TestCase):
+    """
+    Employers from LinkedIn are matched with Companies in one query.
+    """
+
+    def setUp(self):
+        for name, website in (('PKN Orlen SA', 'http://www.orlen.pl'),
+                              ('Orlen Oil', 'http://www.orlenoil.pl'),
+                              ('Bank Polski SA', 'http://www.bankpolski.pl'),
+                              ('Polskie Łożyska sp. z o.o.', 'http://www.lozyska.pl')):
+            Company.objects.create(name=name, headquarters_city='Warszawa', website=website)
+
+    def test_match(self):
+        with self.assertNumQueries(1):
+            matches = Company.objects.match(
+                ['Orlen', 'bank polski s.a.', 'Polskie Lozyska', 'Nieznana firma'])
+        self.assertEqual([(company.name, confidence) for company, confidence
+                          in matches['Orlen']][0], ('PKN Orlen SA', 0.9))
+        self.assertIn('Orlen Oil', [company.name for company, confidence in matches['Orlen']])
+        self.assertEqual(matches['bank polski s.a.'][0][0].name, 'Bank Polski SA')
+        self.assertEqual(matches['bank polski s.a.'][0][1], 1.0)
+        self.assertEqual(matches['Polskie Lozyska'][0][1], 1.0)
+        self.assertEqual(matches['Nieznana firma'], [])
+
+    def test_linkedin_associate(self):
+        self.login_contributor()
+        user = User.objects.last()
+        positions = [Position.objects.create(user=user, company_name=name, position='Analityk',
+                                             start_date_month=1, start_date_year=2015)
+                     for name in ('Bank Polski', 'Orlen S.A.', 'Łożyska Polskie', 'Nieznana firma')]
+        session = self.client.session
+        session['companies'] = [(position.pk, position.company_name) for position in positions]
+        session.save()
+        response = self.client.get(reverse('linkedin_associate'))
+        self.assertEqual(Position.objects.get(pk=positions[0].pk).company.name, 'Bank Polski SA')
+        self.assertEqual(Position.objects.get(pk=positions[1].pk).company.name, 'PKN Orlen SA')
+        self.assertEqual(list(response.context['candidates']), ['Łożyska Polskie'])
+        self.assertEqual(response.context['new_names'], [[positions[3].pk, 'Nieznana firma']])
+
+
+class CompanyBrowseTest(CompanyDataMixin, TestCase):
+    """
+    Companies are filtered and counted by attributes from in-process facet index.
+    """
+
+    def setUp(self):
+        clear_caches()
+        for name, city, employment, public, sectors in (
+                ('Alfa', 'Warszawa', 'A', True, 'bankowość, IT'),
+                ('Beta', 'Kraków', 'B', False, 'IT'),
+                ('Gamma', 'Warszawa', 'B', None, ''),
+                ('Delta', 'Warszawa ', 'F', True, 'energetyka')):
+            Company.objects.create(name=name, headquarters_city=city, employment=employment,
+                                   public=public, sectors=sectors,
+                                   website='http://www.{}.pl'.format(name.lower()))
+
+    def browse(self, **params):
+        response = self.client.get(reverse('company_browse'), params)
+        self.assertEqual(response.status_code, 200)
+        facets = {facet['label']: {value['label']: value['count'] for value in facet['values']}
+                  for facet in response.context['facets']}
+        names = [company['name'] for company in response.context['page_obj'].object_list]
+        return names, facets
+
+    def test_facets(self):
+        names, facets = self.browse()
+        self.assertEqual(names, ['Alfa', 'Beta', 'Delta', 'Gamma'])
+        self.assertEqual(facets['Siedziba'], {'Warszawa': 3, 'Kraków': 1})
+        self.assertEqual(facets['Sektor'], {'IT': 2, 'bankowość': 1, 'energetyka': 1})
+        self.assertEqual(facets['Notowane'], {'tak': 2, 'nie': 1})
+        names, facets = self.browse(miasto='Warszawa', sektor='IT')
+        self.assertEqual(names, ['Alfa'])
+        self.assertEqual(facets['Zatrudnienie'], {'<100': 1})
+
+    def test_ordering(self):
+        self.create_items(Company.objects.get(name='Gamma'), 2)
+        self.create_items(Company.objects.get(name='Beta'), 1)
+        self.assertEqual(self.browse(sortuj='opinie')[0], ['Gamma', 'Beta', 'Alfa', 'Delta'])
+        # stats are updated without rebuilding the index
+        version = company_facets.version
+        self.create_items(Company.objects.get(name='Delta'), 3)
+        self.assertEqual(self.browse(sortuj='opinie')[0], ['Delta', 'Gamma', 'Beta', 'Alfa'])
+        self.assertEqual(company_facets.version, version)
+
+    def test_sorted_once(self):
+        def sorts(sort):
+            return [call for call in sort.call_args_list if 'reverse' in call[1]]
+        self.create_items(Company.objects.get(name='Beta'), 1)
+        self.browse(sortuj='ocena')
+        with mock.patch('reviews.browse.sorted', create=True, wraps=sorted) as sort:
+            self.assertEqual(self.browse(sortuj='ocena')[0][0], 'Beta')
+        self.assertFalse(sorts(sort))
+        # sorted again after stats change
+        self.create_items(Company.objects.get(name='Gamma'), 1)
+        with mock.patch('reviews.browse.sorted', create=True, wraps=sorted) as sort:
+            self.browse(sortuj='ocena')
+        self.assertTrue(sorts(sort))
+
+    def test_new_company(self):
+        self.browse()
+        self.create_company('Omega')
+        self.assertIn('Omega', self.browse()[0])
+
+    def test_single_rebuilder(self):
+        self.browse()
+        self.create_company('Omega')
+        # another thread is rebuilding the index, the current one is used meanwhile
+        with company_facets.building:
+            with self.assertNumQueries(0):
+                company_facets.refresh()
+            self.assertNotIn('Omega', self.browse()[0])
+        self.assertIn('Omega', self.browse()[0])
+
+    def test_queries(self):
+        self.browse()
+        with self.assertNumQueries(1):
+            self.browse(miasto='Warszawa')
+
+
+@override_settings(EVENT_WRITER_SYNC=False)
+class EventWriterTest(CompanyDataMixin, TestCase):
+    """
+    Visits and AccessAttempts are saved in batches, not by the view.
+    Flushing thread is not started, events are flushed by the test.
+    """
+
+    def setUp(self):
+        self.company = self.create_company()
+        patcher = mock.patch.object(event_writer, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(event_writer.queue.clear)
+
+    def test_page_view(self):
+        self.login_contributor()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.company.get_absolute_url())
+        self.assertFalse([query for query in context.captured_queries
+                          if query['sql'].startswith('INSERT')])
+        self.assertFalse(Visit.objects.exists())
+        event_writer.flush()
+        self.assertEqual(Visit.objects.get().company, self.company)
+
+    def test_batches(self):
+        for i in range(150):
+            event_writer.record(AccessAttempt(path='/' + 'x' * 300, ip='127.0.0.1'))
+        event_writer.record(Visit(company=self.company, user=self.create_user().profile,
+                                  path='/'))
+        with CaptureQueriesContext(connection) as context:
+            event_writer.flush()
+        # AccessAttempts in two batches, one Visit and its VisitedCompany
+        self.assertEqual(len([query for query in context.captured_queries
+                              if query['sql'].startswith('INSERT')]), 4)
+        self.assertEqual(AccessAttempt.objects.count(), 150)
+        self.assertEqual(Visit.objects.count(), 1)
+
+    def test_invalid_rows(self):
+        with connection.cursor() as cursor:
+            # constraints of the test transaction are only checked at its end
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        user = self.create_user().profile
+        deleted = self.create_company('Usunieta')
+        event_writer.record(Visit(company=self.company, user=user, path='/'))
+        event_writer.record(Visit(company=deleted, user=user, path='/'))
+        event_writer.record(AccessAttempt(path='/', ip='192.0.2.1, 10.0.0.1'))
+        deleted.delete()
+        with self.assertLogs('reviews.events', 'WARNING') as logs:
+            event_writer.flush()
+        self.assertIn('1 of 2 Wizyty not saved', logs.output[-1])
+        self.assertEqual(Visit.objects.get().company, self.company)
+        self.assertIsNone(AccessAttempt.objects.get().ip)
+
+    @override_settings(EVENT_QUEUE_SIZE=5)
+    def test_queue_size(self):
+        for i in range(7):
+            event_writer.record(AccessAttempt(path='/{}'.format(i)))
+        event_writer.flush()
+        self.assertEqual(sorted(AccessAttempt.objects.values_list('path', flat=True)),
+                         ['/{}'.format(i) for i in range(2, 7)])
+
+    @override_settings(EVENT_WRITER_SYNC=True)
+    def test_sync(self):
+        self.client.get(reverse('please_contribute'))
+        self.assertTrue(AccessAttempt.objects.filter(path=reverse('please_contribute')).exists())
+
+
+class PartitionsTest(CompanyDataMixin, TestCase):
+    """
+    Visits and AccessAttempts are partitioned by month, rolled up by day
+    and dropped a partition at a time.
+    """
+
+    def setUp(self):
+        self.company = self.create_company()
+        self.profile = self.create_user().profile
+
+    def partitions(self, table):
+        with connection.cursor() as cursor:
+            return partitions.partitions(cursor, table)
+
+    def visit(self, when):
+        visit = Visit.objects.create(company=self.company, user=self.profile, path='/')
+        Visit.objects.filter(pk=visit.pk).update(timestamp=when)
+
+    def test_month_arithmetic(self):
+        self.assertEqual(partitions.add_months(datetime.date(2018, 11, 1), 3),
+                         datetime.date(2019, 2, 1))
+        self.assertEqual(partitions.add_months(datetime.date(2018, 1, 1), -13),
+                         datetime.date(2016, 12, 1))
+
+    def test_future_partitions(self):
+        current = partitions.current_month()
+        self.assertIn(current, self.partitions('users_visit'))
+        months_ahead = [partitions.add_months(current, months) for months in range(1, 7)]
+        created = partitions.ensure_partitions(6)
+        self.assertIn(partitions.partition_name('users_visit', months_ahead[-1]), created)
+        for table in partitions.TABLES:
+            self.assertTrue(set(months_ahead) <= set(self.partitions(table)))
+        self.assertEqual(partitions.ensure_partitions(6), [])
+
+    def test_rollup(self):
+        day = timezone.localdate() - datetime.timedelta(days=3)
+        noon = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        self.visit(noon)
+        self.visit(noon + datetime.timedelta(hours=1))
+        other = self.create_user().profile
+        Visit.objects.filter(pk=Visit.objects.create(
+            company=self.company, user=other, path='/').pk).update(timestamp=noon)
+        # next day
+        self.visit(noon + datetime.timedelta(hours=12))
+        AccessAttempt.objects.create(path='/firma/')
+        AccessAttempt.objects.create(path=None)
+
+        self.assertEqual(VisitDaily.objects.pending_days(day), (day, day))
+        for i in range(2):
+            VisitDaily.objects.rollup(day, day + datetime.timedelta(days=1))
+        self.assertEqual(list(VisitDaily.objects.order_by('day').values_list(
+            'day', 'visits', 'visitors')), [(day, 3, 2), (day + datetime.timedelta(days=1), 1, 1)])
+
+        AccessAttemptDaily.objects.rollup(timezone.localdate(), timezone.localdate())
+        self.assertEqual(sorted(AccessAttemptDaily.objects.values_list('path', 'attempts')),
+                         [('', 1), ('/firma/', 1)])
+
+    @override_settings(EVENT_RETENTION_MONTHS=13)
+    def test_retention(self):
+        old_month = partitions.add_months(partitions.current_month(), -20)
+        with connection.cursor() as cursor:
+            partitions.create_partition(cursor, 'users_visit', old_month)
+        old = timezone.make_aware(datetime.datetime.combine(
+            old_month + datetime.timedelta(days=10), datetime.time(12)))
+        self.visit(old)
+        self.visit(timezone.now() - datetime.timedelta(days=1))
+        with connection.cursor() as cursor:
+            # deferred foreign key checks would block DROP in the test transaction
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        out = StringIO()
+        call_command('maintain_partitions', stdout=out)
+        self.assertIn('Dropped partition users_visit_p{:%Y%m}'.format(old_month), out.getvalue())
+        self.assertNotIn(old_month, self.partitions('users_visit'))
+        self.assertEqual(Visit.objects.count(), 1)
+        self.assertEqual(VisitDaily.objects.get(day=timezone.localdate(old)).visits, 1)
+        self.assertEqual(VisitDaily.objects.aggregate(visits=Sum('visits'))['visits'], 2)
+
+
+class ContributionGateTest(CompanyDataMixin, TestCase):
+    """
+    Distinct Companies visited by a user are counted on Profile when Visits
+    are saved, so that the gate of item lists doesn't count Visits.
+    """
+
+    def setUp(self):
+        self.companies = [self.create_company('Firma{}'.format(i)) for i in range(3)]
+        self.user = self.create_user()
+
+    def visit(self, company):
+        return Visit(company=company, user=self.user.profile, path='/')
+
+    def visited_count(self):
+        return Profile.objects.get(pk=self.user.profile.pk).visited_count
+
+    def test_bulk_create(self):
+        Visit.objects.bulk_create([self.visit(self.companies[0]),
+                                   self.visit(self.companies[0]),
+                                   self.visit(self.companies[1])])
+        self.assertEqual(self.visited_count(), 2)
+        Visit.objects.bulk_create([self.visit(self.companies[1]),
+                                   self.visit(self.companies[2])])
+        self.assertEqual(self.visited_count(), 3)
+
+    def test_company_page(self):
+        self.client.force_login(self.user)
+        for company in self.companies[:2] + self.companies[:1]:
+            self.client.get(company.get_absolute_url())
+        self.assertEqual(self.visited_count(), 2)
+
+    def test_gate(self):
+        self.client.force_login(self.user)
+        url = reverse('review_items', kwargs={'pk': self.companies[0].pk,
+                                              'slug': self.companies[0].slug})
+        with mock.patch('reviews.views.ReviewItemsView.limit', 1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            Visit.objects.bulk_create([self.visit(self.companies[1])])
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertTrue(response.url.startswith(reverse('please_contribute')))
+        self.assertFalse([query for query in context.captured_queries
+                          if 'users_visit' in query['sql']])
+
+    @override_settings(EVENT_RETENTION_MONTHS=13)
+    def test_revisit_after_partition_drop(self):
+        old_month = partitions.add_months(partitions.current_month(), -20)
+        with connection.cursor() as cursor:
+            partitions.create_partition(cursor, 'users_visit', old_month)
+        Visit.objects.bulk_create([self.visit(self.companies[0])])
+        Visit.objects.update(timestamp=timezone.make_aware(datetime.datetime.combine(
+            old_month + datetime.timedelta(days=10), datetime.time(12))))
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        call_command('maintain_partitions', stdout=StringIO())
+        self.assertFalse(Visit.objects.exists())
+        Visit.objects.bulk_create([self.visit(self.companies[0])])
+        self.assertEqual(self.visited_count(), 1)
+        self.assertEqual(Profile.objects.reconcile_visited_counts(), 0)
+
+    def test_reconcile(self):
+        Visit.objects.create(company=self.companies[0], user=self.user.profile, path='/')
+        Profile.objects.filter(pk=self.user.profile.pk).update(visited_count=5)
+        out = StringIO()
+        call_command('reconcile_visited_counts', stdout=out)
+        self.assertIn('1 profiles', out.getvalue())
+        self.assertEqual(self.visited_count(), 1)
+        self.assertEqual(Profile.objects.reconcile_visited_counts(), 0)
+
+
+class FreeViewsTest(CompanyDataMixin, TestCase):
+    """
+    Companies viewed anonymously are counted in a signed cookie,
+    without creating sessions.
+    """
+
+    def setUp(self):
+        self.companies = [self.create_company('Firma{}'.format(i)) for i in range(5)]
+
+    def test_no_session(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.companies[0].get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in context.captured_queries
+                          if 'django_session' in query['sql']])
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertIn(settings.FREE_VIEWS_COOKIE, response.cookies)
+        # viewing the same Company again doesn't set the cookie
+        response = self.client.get(self.companies[0].get_absolute_url())
+        self.assertNotIn(settings.FREE_VIEWS_COOKIE, response.cookies)
+
+    def test_limit(self):
+        for company in self.companies[:4]:
+            self.assertEqual(self.client.get(company.get_absolute_url()).status_code, 200)
+        response = self.client.get(self.companies[4].get_absolute_url())
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Session.objects.count(), 0)
+
+    def test_tampered_cookie(self):
+        self.client.get(self.companies[0].get_absolute_url())
+        value = self.client.cookies[settings.FREE_VIEWS_COOKIE].value
+        self.client.cookies[settings.FREE_VIEWS_COOKIE] = value.replace(
+            str(self.companies[0].pk), '1.2.3.4.5', 1)
+        response = self.client.get(self.companies[1].get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+
+    def test_purge_sessions(self):
+        now = timezone.now()
+        for i in range(5):
+            Session.objects.create(session_key='expired{}'.format(i), session_data='',
+                                   expire_date=now - datetime.timedelta(days=1))
+        Session.objects.create(session_key='current', session_data='',
+                               expire_date=now + datetime.timedelta(days=1))
+        out = StringIO()
+        call_command('purge_sessions', batch=2, pause=0, stdout=out)
+        self.assertIn('Deleted 5', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)),
+                         ['current'])
+
+
+@override_settings(RATE_LIMITS=dict(settings.RATE_LIMITS, test=(3, 60, 'ip')))
+class RateLimitTest(CompanyDataMixin, TestCase):
+    """
+    Actions are counted in the cache, the database is only asked
+    when the cache knows nothing about the user.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1')
+
+    def test_sliding_window(self):
+        limit = RateLimit('test')
+        with mock.patch('reviews.ratelimit.time.time', return_value=600.0):
+            for i in range(3):
+                self.assertFalse(limit.exceeded(self.request))
+                limit.hit(self.request)
+            self.assertTrue(limit.exceeded(self.request))
+            other = RequestFactory().get('/', REMOTE_ADDR='10.0.0.2')
+            self.assertFalse(limit.exceeded(other))
+        # half of the previous window is still within the period
+        with mock.patch('reviews.ratelimit.time.time', return_value=690.0):
+            self.assertEqual(limit.usage(self.request), 1.5)
+            self.assertFalse(limit.exceeded(self.request))
+        with mock.patch('reviews.ratelimit.time.time', return_value=720.0):
+            self.assertEqual(limit.usage(self.request), 0)
+
+    def test_fallback(self):
+        fallback = mock.Mock(return_value=2)
+        limit = RateLimit('test', fallback)
+        self.assertEqual(limit.usage(self.request), 2)
+        limit.hit(self.request)
+        self.assertTrue(limit.exceeded(self.request))
+        self.assertEqual(fallback.call_count, 1)
+
+    def test_submissions(self):
+        company = self.create_company()
+        user = self.create_user()
+        for i in range(5):
+            position = Position.objects.create(user=user, company=company, position='Analityk',
+                                               start_date_month=1, start_date_year=2015)
+            Salary.objects.create(company=company, salary_input=5000, period='M',
+                                  position=position)
+        self.client.force_login(user)
+        url = reverse('salary', kwargs={'id': company.pk})
+        self.assertRedirects(self.client.get(url), company.get_absolute_url(),
+                             fetch_redirect_response=False)
+        # user's Salaries are counted once
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertFalse([query for query in context.captured_queries
+                          if 'reviews_salary' in query['sql']])
+
+    def test_scope(self):
+        limit = RateLimit('test', scope=1)
+        for i in range(3):
+            limit.hit(self.request)
+        self.assertTrue(limit.exceeded(self.request))
+        self.assertFalse(RateLimit('test', scope=2).exceeded(self.request))
+        self.assertFalse(RateLimit('test').exceeded(self.request))
+
+    def test_cooldown(self):
+        self.request.user = self.create_user()
+        limit = Cooldown('interview', scope=1)
+        with mock.patch('reviews.ratelimit.time.time', return_value=1000.0):
+            self.assertEqual(limit.remaining(self.request), 0)
+            limit.hit(self.request)
+        with mock.patch('reviews.ratelimit.time.time', return_value=1000.0 + 80 * 86400):
+            self.assertEqual(limit.remaining(self.request), 10 * 86400)
+            self.assertTrue(limit.exceeded(self.request))
+            self.assertFalse(Cooldown('interview', scope=2).exceeded(self.request))
+
+    def test_interview_per_company(self):
+        company, other = self.create_company(), self.create_company('Inna')
+        user = self.create_user()
+        interview = Interview.objects.create(company=company, user=user, position='Analityk',
+                                             how_got='A', difficulty=3, got_offer=True,
+                                             impressions='wrażenia', rating=3)
+        Interview.objects.filter(pk=interview.pk).update(
+            date=timezone.now() - datetime.timedelta(days=10, hours=1))
+        self.client.force_login(user)
+        url = reverse('interview', kwargs={'id': company.pk})
+        # the cache is empty, the last Interview is found in the database once
+        response = self.client.get(url)
+        self.assertRedirects(response, company.get_absolute_url(), fetch_redirect_response=False)
+        self.assertIn('za 80 dni', str(list(get_messages(response.wsgi_request))[0]))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.assertFalse([query for query in context.captured_queries
+                          if 'reviews_interview' in query['sql']])
+        self.assertEqual(self.client.get(reverse('interview', kwargs={'id': other.pk})).status_code,
+                         200)
+        # Interviews older than 90 days don't count
+        Interview.objects.filter(pk=interview.pk).update(
+            date=timezone.now() - datetime.timedelta(days=91))
+        clear_caches()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @override_settings(RATE_LIMIT_IP_HEADER='HTTP_X_FORWARDED_FOR')
+    def test_forwarded(self):
+        limit = RateLimit('test')
+        proxied = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1',
+                                       HTTP_X_FORWARDED_FOR='6.6.6.6, 192.0.2.1')
+        self.assertEqual(client_ip(proxied), '192.0.2.1')
+        for i in range(3):
+            limit.hit(proxied)
+        self.assertTrue(limit.exceeded(proxied))
+        # another client behind the same proxy
+        other = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1',
+                                     HTTP_X_FORWARDED_FOR='192.0.2.2')
+        self.assertFalse(limit.exceeded(other))
+        # without the header
+        self.assertEqual(client_ip(self.request), '10.0.0.1')
+        with override_settings(RATE_LIMIT_TRUSTED_PROXIES=2):
+            self.assertEqual(client_ip(proxied), '6.6.6.6')
+
+    @override_settings(RATE_LIMITS=dict(settings.RATE_LIMITS, contact=(2, 86400, 'ip')))
+    def test_contact(self):
+        data = {'your_email': 'a@pracor.pl', 'subject': 'Temat', 'message': 'Treść'}
+        for i in range(2):
+            self.client.post(reverse('contact'), data)
+        self.client.cookies.clear()
+        self.client.post(reverse('contact'), data)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class EligibilityTest(CompanyDataMixin, TestCase):
+    """
+    User's Position, its item and recent submissions are resolved in one query.
+    """
+
+    def setUp(self):
+        clear_caches()
+        self.company = self.create_company()
+        self.user = self.create_user()
+        self.url = reverse('salary', kwargs={'id': self.company.pk})
+        self.since = timezone.now() - datetime.timedelta(days=90)
+
+    def add_salary(self, days_ago=0):
+        position = Position.objects.create(user=self.user, company=self.company,
+                                           position='Analityk', start_date_month=1,
+                                           start_date_year=2015)
+        salary = Salary.objects.create(company=self.company, salary_input=5000, period='M',
+                                       position=position)
+        Salary.objects.filter(pk=salary.pk).update(
+            date=timezone.now() - datetime.timedelta(days=days_ago))
+        return position
+
+    def test_no_position(self):
+        with self.assertNumQueries(1):
+            eligibility = Eligibility(Salary, self.user, self.company, self.since)
+        self.assertEqual((eligibility.position_id, eligibility.item_date, eligibility.recent),
+                         (None, None, 0))
+        self.assertEqual(eligibility.days_until_next, 0)
+
+    def test_recent_item(self):
+        self.add_salary(days_ago=100)
+        position = self.add_salary(days_ago=10)
+        eligibility = Eligibility(Salary, self.user, self.company, self.since)
+        self.assertEqual(eligibility.position_id, position.pk)
+        self.assertEqual(eligibility.recent, 1)
+        self.assertEqual(eligibility.days_until_next, 80)
+        self.client.force_login(self.user)
+        self.assertRedirects(self.client.get(self.url), self.company.get_absolute_url(),
+                             fetch_redirect_response=False)
+
+    def test_one_query(self):
+        self.add_salary(days_ago=100)
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('position_form', response.context)
+        self.assertEqual(len([query for query in context.captured_queries
+                              if 'reviews_position' in query['sql']]), 1)
+
+
+class ProfanitiesTest(TestCase):
+    """
+    Profanities are found in normalized text and reported as the words
+    of the original text they're part of.
+    """
+
+    def find(self, text):
+        return profanities.automaton().find(text)
+
+    def test_clean_text(self):
+        ProfanitiesFilter()('Dobra atmosfera, ale dopiero po roku podwyżka.')
+
+    def test_broad_words(self):
+        self.assertEqual(self.find('Ale SPIERDOLIŁ projekt.'), ['spierdolił'])
+
+    def test_whole_words(self):
+        self.assertEqual(self.find('Szef to dupa, dupa!'), ['dupa'])
+        self.assertEqual(self.find('Dupatek nie ma.'), [])
+
+    def test_normalization(self):
+        self.assertEqual(self.find('Kierownik jest j3b4ny i DUP4.'), ['j3b4ny', 'dup4'])
+        self.assertEqual(self.find('Zajebisty szef'), ['zajebisty'])
+
+    def test_validation_error(self):
+        with self.assertRaisesMessage(ValidationError, 'Niedopuszczalne wyrażenia: dupa'):
+            ProfanitiesFilter()('Szef to dupa.')
+
+    def test_artifact(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFANITIES_CACHE_DIR=directory):
+                path = profanities.artifact_path()
+                profanities.build(path)
+                self.assertTrue(os.path.exists(path))
+                with mock.patch.object(profanities, '_automaton', None), \
+                        mock.patch.object(profanities, 'build') as build:
+                    automaton = profanities.automaton()
+                self.assertFalse(build.called)
+                self.assertEqual(automaton.find('dupa'), ['dupa'])
+
+    def test_artifact_writable_by_others_rebuilt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFANITIES_CACHE_DIR=directory):
+                path = profanities.artifact_path()
+                with open(path, 'w') as f:
+                    f.write('{"goto": [{}], "fail": [0], "outputs": [[]]}')
+                os.chmod(path, 0o666)
+                with mock.patch.object(profanities, '_automaton', None):
+                    automaton = profanities.automaton()
+                # a planted empty automaton would find nothing
+                self.assertEqual(automaton.find('dupa'), ['dupa'])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Website stub: '/' responds, '/nohead' rejects HEAD requests, '/moved'
+    redirects to another domain (localhost), '/slow' responds after a second.
+    """
+    requests = []
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def respond(self, head):
+        self.requests.append((self.command, self.path))
+        if self.path == '/slow':
+            time.sleep(1)
+        if self.path == '/nohead' and head:
+            self.send_response(405)
+        elif self.path == '/moved':
+            self.send_response(301)
+            self.send_header('Location', 'http://localhost:{}/'.format(self.server.server_port))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class WebsiteVerificationTest(CompanyDataMixin, TestCase):
+    """
+    Websites are probed against a local stub server, forms validate them
+    without any request.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = StubServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        clear_caches()
+        StubHandler.requests = []
+
+    def test_domain(self):
+        self.assertEqual(Company.domain('https://WWW.Firma.pl/kariera'), 'firma.pl')
+        self.assertEqual(Company.domain('firma.pl'), 'firma.pl')
+        self.assertEqual(self.create_company('Firma').website_domain, 'firma.pl')
+
+    def test_head_first(self):
+        self.assertEqual(websites.probe(self.url + '/'), (True, self.url + '/'))
+        self.assertEqual(StubHandler.requests, [('HEAD', '/')])
+
+    def test_get_when_head_rejected(self):
+        self.assertEqual(websites.probe(self.url + '/nohead'), (True, self.url + '/nohead'))
+        self.assertEqual(StubHandler.requests, [('HEAD', '/nohead'), ('GET', '/nohead')])
+
+    def test_redirect_resolved(self):
+        responds, final = websites.probe(self.url + '/moved')
+        self.assertTrue(responds)
+        self.assertEqual(Company.domain(final), 'localhost:{}'.format(self.server.server_port))
+
+    @override_settings(WEBSITE_READ_TIMEOUT=0.2)
+    def test_timeout(self):
+        start = time.perf_counter()
+        self.assertEqual(websites.probe(self.url + '/slow'), (False, self.url + '/slow'))
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_cached_per_domain(self):
+        websites.check(self.url + '/')
+        websites.check(self.url + '/nohead')
+        self.assertEqual(len(StubHandler.requests), 1)
+
+    def test_verify(self):
+        company = Company.objects.create(name='Stub', headquarters_city='Warszawa',
+                                         website=self.url)
+        self.assertEqual(company.website_status, Company.WEBSITE_UNVERIFIED)
+        websites.verify(company)
+        company.refresh_from_db()
+        self.assertEqual(company.website_status, Company.WEBSITE_VERIFIED)
+        self.assertIsNone(company.website_redirect)
+        self.assertIsNotNone(company.website_checked)
+
+    def test_verify_redirect_to_existing(self):
+        Company.objects.create(name='Docelowa', headquarters_city='Warszawa',
+                               website='http://localhost:{}'.format(self.server.server_port))
+        company = Company.objects.create(name='Stub', headquarters_city='Warszawa',
+                                         website=self.url + '/moved')
+        self.assertEqual(websites.verify(company), Company.WEBSITE_DUPLICATE)
+        company.refresh_from_db()
+        self.assertEqual(company.website_redirect, 'localhost:{}'.format(self.server.server_port))
+
+    @override_settings(WEBSITE_CONNECT_TIMEOUT=0.2)
+    def test_verify_failed(self):
+        company = Company.objects.create(name='Stub', headquarters_city='Warszawa',
+                                         website='http://127.0.0.1:1')
+        self.assertEqual(websites.verify(company), Company.WEBSITE_FAILED)
+
+    def form_errors(self, website):
+        form = CompanyCreateForm({'name': 'Nowa', 'headquarters_city': 'Warszawa',
+                                  'website': website})
+        with mock.patch.object(websites, 'probe') as probe:
+            form.is_valid()
+        self.assertFalse(probe.called)
+        return [error.code for error in form.errors.as_data().get('website', [])]
+
+    def test_form_known_domain(self):
+        self.create_company('Firma')
+        self.assertEqual(self.form_errors('https://firma.pl/'), ['redirected'])
+        self.assertEqual(self.form_errors('http://www.nowa.pl/'), [])
+
+    def test_form_cached_results(self):
+        company = self.create_company('Firma')
+        cache.set(websites.cache_key('http://www.stara.pl'), (True, company.website), 60)
+        self.assertEqual(self.form_errors('http://www.stara.pl/'), ['redirected'])
+        cache.set(websites.cache_key('http://www.martwa.pl'), (False, 'http://www.martwa.pl'), 60)
+        self.assertEqual(self.form_errors('http://www.martwa.pl/'), ['bounced'])
+
+    def test_create_view_verifies(self):
+        self.login_contributor()
+        with mock.patch.object(websites, 'probe', return_value=(True, 'http://www.nowa.pl/')):
+            self.client.post(reverse('company_create', kwargs={'company': 'nowa'}),
+                             {'name': 'Nowa', 'headquarters_city': 'Warszawa',
+                              'website': 'http://www.nowa.pl'})
+        self.assertEqual(Company.objects.get(name='Nowa').website_status,
+                         Company.WEBSITE_VERIFIED)
+
+    def test_command(self):
+        company = self.create_company('Firma')
+        out = StringIO()
+        with mock.patch.object(websites, 'probe', return_value=(False, company.website)):
+            call_command('verify_websites', stdout=out)
+        self.assertIn('1 nie odpowiada', out.getvalue())
+        company.refresh_from_db()
+        self.assertEqual(company.website_status, Company.WEBSITE_FAILED)
+        # not rechecked until WEBSITE_RECHECK_DAYS pass
+        call_command('verify_websites', stdout=out)
+        self.assertIn('Verified 0 websites', out.getvalue())
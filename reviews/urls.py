@@ -21,6 +21,15 @@ urlpatterns = [
     url(r'^search/(?P<searchterm>.*)?$',
         CompanySearchView.as_view(), name='company_search'),
 
+    url(r'^firmy/$',
+        CompanyBrowseView.as_view(), name='company_browse'),
+
+    url(r'^szukaj/$',
+        ContentSearchView.as_view(), name='content_search'),
+
+    url(r'^szukaj/json/$',
+        ContentSearchView.as_view(as_json=True), name='content_search_json'),
+
     url(r'^(?P<pk>\d+)/opinie/(?P<slug>[-\w\d]+)?$',
         ReviewItemsView.as_view(), name='review_items'),
 
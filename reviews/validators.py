@@ -1,56 +1,23 @@
-import csv
-import re
-import os
-import requests
-from urllib.parse import urlsplit
-
 from django import forms
 from django.core.exceptions import ValidationError
 from django.conf import settings
 from .models import Company
+from . import profanities, websites
 
 
 class ProfanitiesFilter():
     """
     Custom validator to filter out swear words.
-    First file has words that are matched inside other words.
-    Second file has words that are matched only as full words.
+    Words of the first file are matched inside other words, words of the second
+    file only as full words, by the automaton of profanities.py (built or
+    loaded once per process).
     """
-    # makeing those class variables ensures this code is called only once - after
-    # starting server
-    words = ''
-    with open(os.path.join(settings.BASE_DIR, 'reviews/profanities_filter/prof_fil_broad.txt'), encoding='utf-8') as f:
-        i = csv.reader(f, delimiter='\n')
-        for item in i:
-            words += item[0]
-            words += '|'
-
-    more_words = ''
-    with open(os.path.join(settings.BASE_DIR, 'reviews/profanities_filter/prof_fil.txt'), encoding='utf-8') as f:
-        i = csv.reader(f, delimiter='\n')
-        for item in i:
-            text_item = '\\b{}\\b|'.format(item[0])
-            more_words += text_item
-
-    words += more_words
-    pattern = re.compile(words, re.IGNORECASE)
 
     def __call__(self, value):
-        matches = self.pattern.findall(value)
-        matches = [match for match in matches if match != '']
-        full_words = value.split(' ')
-        full_matched_words = []
-        for word in full_words:
-            for match in matches:
-                if match in word:
-                    full_matched_words.append(word.lower().rstrip(',!?:;.'))
-        matches = set(full_matched_words)
-        # if partial words matched, get the full words, of which they are part
+        matches = profanities.automaton().find(value)
+        # report the full words, of which matched words are part
         if matches:
-            if len(matches) == 1:
-                value = ''.join(matches)
-            else:
-                value = ', '.join(matches)
+            value = ', '.join(matches)
             raise forms.ValidationError('Niedopuszczalne wyrażenia: {}'.format(value),
                                         params={'value': value},
                                         )
@@ -80,30 +47,32 @@ class TextLengthValidator():
 class WWWValidator:
     """
     Used for validating new Company urls input by users.
-    Check if website with given url exists. Don't allow:
-    a). non-exising url (or url which doesn't work for some reason)
+    Don't allow:
+    a). url in the domain of an existing Company (or a domain it redirects to)
     b). url, which redirects to a url for which a Company already exists
+    c). url, which didn't respond lately
+    The website isn't requested here: only the database and probe results
+    cached by reviews/websites.py are consulted, new websites are verified
+    in the background after the Company is created.
     """
 
     def __call__(self, www):
-        try:
-            r = requests.get(www)
-            if r.history:
-                url = urlsplit(r.url)
-                url_domain = 'http://{}'.format(url.netloc)
-                try:
-                    existing = Company.objects.get(website=url_domain)
-                except:
-                    existing = None
-                if existing:
-                    raise ValidationError(
-                        'Ten www zarejestrowano dla: {}. Adresy www nie mogą się powtarzać'.format(
-                            existing.name),
-                        code='redirected',  params={'existing': existing, 'url': url_domain})
-        except requests.exceptions.RequestException as e:
+        url = www
+        existing = websites.registered(www)
+        result = websites.cached(www) if existing is None else None
+        if result is not None:
+            responds, url = result
+            if not responds:
+                raise ValidationError(
+                    'Podany adres www nie odpowiada. Popraw adres www',
+                    code='bounced')
+            existing = websites.registered(url)
+        if existing:
             raise ValidationError(
-                'Podany adres www nie odpowiada. Popraw adres www',
-                code='bounced')
+                'Ten www zarejestrowano dla: {}. Adresy www nie mogą się powtarzać'.format(
+                    existing.name),
+                code='redirected', params={'existing': existing,
+                                           'url': 'http://{}'.format(Company.domain(url))})
 
 
 class ContactValidator:
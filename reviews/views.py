@@ -1,6 +1,9 @@
 import hashlib
 import datetime
+import json
 import logging
+import math
+from collections import OrderedDict
 
 from django.conf import settings
 from django.core.mail import send_mail
@@ -10,14 +13,19 @@ from django.contrib.auth.mixins import (AccessMixin,
                                         UserPassesTestMixin)
 from django.contrib import messages
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy, resolve
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.functional import cached_property
+from django.utils.http import quote_etag
 from django.views import View
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
                                   TemplateView, UpdateView, RedirectView, FormView)
 from django.views.generic.detail import SingleObjectMixin
-from django.db.models import Q, Count
+from django.db.models import Max, Q
 from django.utils import timezone
 from django import forms
 
@@ -27,17 +35,23 @@ from users.models import Visit
 from .forms import (CompanyCreateForm, CompanySearchForm, CreateItemSearchForm,
                     CompanySelectForm, InterviewForm, PositionForm, ReviewForm,
                     SalaryForm, ContactForm)
-from .models import Company, Interview, Position, Review, Salary, AccessAttempt
+from .models import (Company, CompanyStats, Interview, Position, Review, Salary,
+                     Vocabulary, AccessAttempt)
+from .autocomplete import company_index, normalize_term
+from .browse import FACETS, ORDERINGS, company_facets
+from .caching import catalog_version
+from .eligibility import Eligibility
+from .events import event_writer
+from .free_views import FreeViews
+from .pages import CompanyPage
+from .pagination import KeysetPage
+from .ratelimit import Cooldown, RateLimitMixin, client_ip
+from .search import snippet
+from .websites import website_verifier
 
 
 logger = logging.getLogger(__name__)
 
-#next two variables determine
-#max number of submissions users are allowed within given time-period
-#robo spam prevention
-SUBMISSIONS_LIMIT = 5
-SUBMISSIONS_LIMIT_DAYS = 90
-
 def success_message(request):
     """
     Display flash message after succesful submission of a form.
@@ -51,15 +65,15 @@ def failure_message(request, item, days):
     messages.add_message(request, messages.WARNING,
                          'Już mamy Twoje dane! {} dla tej firmy możesz ponownie dodać za {} dni.'.format(item, days))
 
-def too_many_submissions_message(request, item):
+def too_many_submissions_message(request, item, rate_limit):
     """
     Display flash message informing user that they cannot submit data.
     """
     messages.add_message(request, messages.WARNING,
                          '{}: obowiązuje limit {} wpisów w ciągu {} dni!'.format(
                              item,
-                             SUBMISSIONS_LIMIT,
-                             SUBMISSIONS_LIMIT_DAYS))
+                             rate_limit.limit,
+                             rate_limit.days))
 
     
 class AccessBlocker(UserPassesTestMixin):
@@ -82,11 +96,9 @@ class AccessBlocker(UserPassesTestMixin):
     def below_limit(self):
         """
         Test if the number of distinct company profiles visited by the user is below given limit.
+        The number is kept on Profile (see VisitManager), so no Visits are counted here.
         """
-        viewed_profiles = Visit.objects.filter(
-            user=self.request.user.profile).aggregate(count=Count('company', distinct=True))
-        value = (viewed_profiles.get('count') < self.limit)
-        return value
+        return self.request.user.profile.visited_count < self.limit
 
 class LoginRequiredMixin(AccessMixin):
     """
@@ -103,16 +115,12 @@ class LoginRequiredMixin(AccessMixin):
         referer = self.request.META.get('HTTP_REFERER')
         user_agent = self.request.META.get('HTTP_USER_AGENT')
         path = self.request.get_full_path()
-        ip = self.request.META.get('REMOTE_ADDR')
-        if not ip:
-            ip = self.request.META.get('HTTP_X_FORWARDED_FOR')
-        if not ip:
-            ip = self.request.META.get('HTTP_X_REAL_IP')
-        AccessAttempt.objects.create(referer=referer,
-                               ip=ip,
-                               user_agent=user_agent,
-                               path=path,
-                               )
+        ip = client_ip(self.request)
+        event_writer.record(AccessAttempt(referer=referer,
+                                          ip=ip,
+                                          user_agent=user_agent,
+                                          path=path,
+                                          ))
 
         
 class ConditionalLoginRequiredMixin(LoginRequiredMixin):
@@ -121,26 +129,24 @@ class ConditionalLoginRequiredMixin(LoginRequiredMixin):
     The number of 'free' views set by 'limit'.
     To be used interchangeably with LoginRequiredMixin depending whether 'free'
     logins are allowed.
+    Viewed companies are kept in a signed cookie (see free_views.py), anonymous
+    users don't get a session.
     """
     limit = 3
     
     def allowed_free_access(self):
-        session = self.request.session
-        if not session.get('visits'):
-            session['visits'] = []
-            return True
-        logger.debug('Anonymous user used up {} free company profile(s) so far'.format(len(session['visits'])))
-        if len(session['visits']) > self.limit:
-            return False
-        else:
-            return True
+        logger.debug('Anonymous user used up {} free company profile(s) so far'.format(len(self.free_views)))
+        return len(self.free_views) <= self.limit
     
     def dispatch(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
-            self.request.session.set_expiry(7905600) #3months
+            self.free_views = FreeViews(request)
             if not self.allowed_free_access():
                 messages.add_message(request, messages.WARNING, 'Dalsze używanie serwisu wymaga rejestracji.')
                 return self.handle_no_permission()
+            response = super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+            self.free_views.save(response)
+            return response
         #note! this is calling superclass of the superclass (otherwise LoginRequiredMixin
         #overrides any changes made in this method)
         return super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
@@ -191,7 +197,12 @@ class AjaxViewMixin:
     Return json data to forms, which use jQuery UI autocomplete widget.
     Views that inherit must imiplement get_results method,
     which returns data to be presented in the form.
+    Responses carry ETag and Cache-Control, so that browsers can reuse them.
     """
+    # options don't depend on the user, so responses can be cached by proxies
+    autocomplete_public = False
+    # set by get_options to False if options are not to be stored in the cache
+    options_cacheable = True
 
     def get(self, request, *args, **kwargs):
         """
@@ -199,24 +210,65 @@ class AjaxViewMixin:
         """
         if request.is_ajax():
             field = request.GET.get('field', 'id_').replace('id_', '')
-            results = self.get_results(
-                request.GET.get('term', ''), field
-            ).values()
-            if field:
-                results = results.values(field).distinct()
-            if not field:
-                field = "name"
-            options = []
-            for item in results:
-                item = {'id': item.get('id'),
-                        'label': item.get(field),
-                        'value': item.get(field),
-                        'slug': item.get('slug')}
-                options.append(item)
-            return JsonResponse(options, safe=False)
+            term = request.GET.get('term', '').strip()
+            if len(term) < settings.AUTOCOMPLETE_MIN_LENGTH:
+                options = []
+            else:
+                options = self.get_cached_options(term, field)
+            return self.autocomplete_response(request, options)
         else:
             return super().get(request, *args, **kwargs)
 
+    def get_cache_key(self, term, field):
+        """
+        Return key of options in shared cache, None if they are not to be cached.
+        """
+        return None
+
+    def get_cached_options(self, term, field):
+        key = self.get_cache_key(term, field)
+        if key is None:
+            return self.get_options(term, field)
+        options = cache.get(key)
+        if options is None:
+            options = self.get_options(term, field)
+            if self.options_cacheable:
+                cache.set(key, options, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+        return options
+
+    def autocomplete_response(self, request, options):
+        content = json.dumps(options)
+        etag = quote_etag(hashlib.md5(content.encode('utf-8')).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        if self.autocomplete_public:
+            patch_cache_control(response, public=True, max_age=settings.AUTOCOMPLETE_MAX_AGE)
+        else:
+            patch_cache_control(response, private=True, max_age=settings.AUTOCOMPLETE_MAX_AGE)
+        # html and json are served under the same url
+        patch_vary_headers(response, ['X-Requested-With'])
+        return response
+
+    def get_options(self, term, field):
+        """
+        Return list of autocomplete options from database query.
+        """
+        results = self.get_results(term, field).values()
+        if field:
+            results = results.values(field).distinct()
+        if not field:
+            field = "name"
+        options = []
+        for item in results[:settings.AUTOCOMPLETE_LIMIT]:
+            item = {'id': item.get('id'),
+                    'label': item.get(field),
+                    'value': item.get(field),
+                    'slug': item.get('slug')}
+            options.append(item)
+        return options
+
 
 class CompanySearchBase(View):
     """
@@ -265,10 +317,9 @@ class CompanySearchBase(View):
     def get_results(self, searchterm, *args, **kwargs):
         """
         Fire database query and return matching Company objects.
-        Works only with postgres and requires django.contrib.postgres app.
+        Works only with postgres and requires pg_trgm and unaccent extensions.
         """
-        return Company.objects.filter(Q(name__unaccent__icontains=searchterm) |
-                                      Q(website__unaccent__icontains=searchterm))
+        return Company.objects.search(searchterm)
 
     def post(self, request, *args, **kwargs):
         form = self.form_class(request.POST)
@@ -290,7 +341,30 @@ class CompanySearchView(AjaxViewMixin, CompanySearchBase):
     """
     Handles searchbar including ajax calls for jQuery UI autocomplete.
     """
-    pass
+    autocomplete_public = True
+
+    def get_cache_key(self, term, field):
+        """
+        Options are cached by normalized term until list of Companies changes.
+        """
+        if field:
+            return None
+        term = hashlib.md5(normalize_term(term).encode('utf-8')).hexdigest()
+        return 'autocomplete:company:{}:{}'.format(catalog_version(), term)
+
+    def get_options(self, term, field):
+        """
+        Answer autocomplete from in-process index, database is a fallback.
+        """
+        if not field:
+            try:
+                if not company_index.refresh():
+                    # old index used while another request rebuilds it
+                    self.options_cacheable = False
+                return company_index.search(term)
+            except Exception:
+                logger.exception('Company autocomplete index failed')
+        return super().get_options(term, field)
 
 class CreateItemSearchView(LoginRequiredMixin, CompanySearchView):
     """
@@ -301,6 +375,8 @@ class CreateItemSearchView(LoginRequiredMixin, CompanySearchView):
     #this is set by get_redirect_template
     template_name = 'reviews/search_results.html'    
     redirect_view = 'create_item_search'
+    # only logged in users get responses, proxies mustn't serve them to others
+    autocomplete_public = False
 
     def get_kwargs(self, **kwargs):
         self.item = kwargs.get('item')
@@ -371,19 +447,27 @@ class CompanyDetailView(ConditionalLoginRequiredMixin,
         """
         self.object = self.get_object()
         return self.no_slug(request, *args, **kwargs)
+
+    def get_object(self, queryset=None):
+        """
+        Fetch CompanyStats together with Company, templates use it instead of aggregates.
+        DetailView.get (called by NoSlugRedirectMixin) asks for the object again,
+        so don't repeat the query.
+        """
+        if getattr(self, 'object', None) is not None:
+            return self.object
+        company = super().get_object(queryset=Company.objects.select_related('stats'))
+        CompanyStats.objects.for_company(company)
+        return company
     
     def get_context_data(self, **kwargs):
         """
-        Record visit and
-        add items that will  help looping in templates.
+        Record visit and add CompanyPage, which provides templates with
+        counts and first items without repeating queries.
         """
         self.record_visit()
         context = super().get_context_data(**kwargs)
-        context['items'] = {
-            'review': self.object.reviews,
-            'salary': self.object.salaries,
-            'interview': self.object.interviews,
-        }
+        context['page'] = CompanyPage(self.object)
         return context
 
     def record_visit(self):
@@ -391,25 +475,20 @@ class CompanyDetailView(ConditionalLoginRequiredMixin,
         Record user who visited the Company (date
         of the visit added by model) for logged in users.
 
-        For AnonymusUser store visited company id in session
+        For AnonymusUser store visited company id in a cookie
         to allow for limiting the number of company profiles 
         visited before creating account.
         """
         if self.request.user.is_authenticated:
             path = self.request.get_full_path()
-            ip = self.request.META.get('REMOTE_ADDR')
-            if not ip:
-                ip = self.request.META.get('HTTP_X_FORWARDED_FOR')
-            if not ip:
-                ip = self.request.META.get('HTTP_X_REAL_IP')
-            Visit.objects.create(company=self.object,
-                                 user=self.request.user.profile,
-                                 path=path,
-                                 ip=ip)
+            ip = client_ip(self.request)
+            event_writer.record(Visit(company=self.object,
+                                      user=self.request.user.profile,
+                                      path=path,
+                                      ip=ip))
         else:
-            if self.object.id not in self.request.session['visits']:
-                self.request.session['visits'].append(self.object.id)
-                logger.debug('Anonymous user using free company number {}'.format(len(self.request.session['visits'])))
+            self.free_views.add(self.object.id, self.limit)
+            logger.debug('Anonymous user using free company number {}'.format(len(self.free_views)))
 
 
 
@@ -429,13 +508,16 @@ class CompanyItemsAbstract(ConditionalLoginRequiredMixin, AccessBlocker, NoSlugR
     """
     template_name = 'reviews/company_items_view.html'
     paginate_by = 5
+    # items are paginated by (keyset, id), see KeysetPage
+    keyset = 'date'
 
     def get(self, request, *args, **kwargs):
         """
         Provide Company object for SingleObjectMixin. Redirect if called
         without slug (implemented by NoSlugRedirectMixin).
         """
-        self.object = self.get_object(queryset=Company.objects.all())
+        self.object = self.get_object(queryset=Company.objects.select_related('stats'))
+        CompanyStats.objects.for_company(self.object)
         return self.no_slug(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
@@ -453,6 +535,29 @@ class CompanyItemsAbstract(ConditionalLoginRequiredMixin, AccessBlocker, NoSlugR
                       Interview: self.object.interviews, }
         return dictionary[self.model]
 
+    def get_count(self):
+        dictionary = {Review: lambda: self.object.stats.review_count,
+                      Salary: lambda: self.object.salaries_count,
+                      Interview: lambda: self.object.stats.interview_count, }
+        return dictionary[self.model]()
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Replace Paginator (COUNT + OFFSET) with keyset pagination.
+        """
+        cursors = {}
+        for name, param in (('after', KeysetPage.after_param),
+                            ('before', KeysetPage.before_param)):
+            value = self.request.GET.get(param)
+            if value is not None:
+                if not value.isdigit():
+                    raise Http404
+                cursors[name] = int(value)
+        page = KeysetPage(queryset, self.keyset, page_size, count=self.get_count(), **cursors)
+        if cursors and not page.object_list:
+            raise Http404
+        return (None, page, page.object_list, page.has_other_pages())
+
    
 class ReviewItemsView(CompanyItemsAbstract):
     """Display list of reviews for a given Company."""
@@ -462,6 +567,7 @@ class ReviewItemsView(CompanyItemsAbstract):
 class SalaryItemsView(CompanyItemsAbstract):
     """Display list of salaries for a given Company."""
     model = Salary
+    keyset = 'salary_count'
 
 
 class InterviewItemsView(CompanyItemsAbstract):
@@ -469,6 +575,130 @@ class InterviewItemsView(CompanyItemsAbstract):
     model = Interview
 
 
+class ContentSearchView(ConditionalLoginRequiredMixin, AccessBlocker, RateLimitMixin, View):
+    """
+    Full-text search of Reviews and Interviews (query in 'q' parameter,
+    optionally limited to one Company by 'firma' parameter).
+    Renders a page or, if as_json is set, returns results as json.
+    Searches are rate limited, they're the most expensive queries of the site.
+    """
+    rate_limit = 'content_search'
+    template_name = 'reviews/content_search.html'
+    as_json = False
+    # url name of company items view by model
+    item_views = {Review: 'review_items', Interview: 'interview_items'}
+
+    def get(self, request, *args, **kwargs):
+        text = request.GET.get('q', '').strip()
+        if text and self.rate_limit_exceeded():
+            if self.as_json:
+                return JsonResponse({'q': text, 'error': 'Zbyt wiele wyszukiwań.'}, status=429)
+            messages.add_message(request, messages.WARNING,
+                                 'Zbyt wiele wyszukiwań, spróbuj ponownie za chwilę.')
+            return render(request, self.template_name, {'q': text, 'results': []}, status=429)
+        if text:
+            self.count_rate_limit()
+        results = self.get_results(text) if text else []
+        if self.as_json:
+            for result in results:
+                result['date'] = result['date'].isoformat()
+            return JsonResponse({'q': text, 'results': results})
+        return render(request, self.template_name, {'q': text, 'results': results})
+
+    def get_results(self, text):
+        """
+        Return best matching Reviews and Interviews together, best first.
+        """
+        company = self.request.GET.get('firma', '')
+        results = []
+        for model, view in self.item_views.items():
+            items = model.objects.search(text)
+            if company.isdigit():
+                items = items.filter(company=company)
+            heading = model.SEARCH_FIELDS[0][0]
+            items = items.values('id', 'date', 'rank', 'headline', heading,
+                                 'company', 'company__name', 'company__slug')
+            for item in items[:settings.CONTENT_SEARCH_LIMIT]:
+                results.append({
+                    'type': model._meta.model_name,
+                    'id': item['id'],
+                    'heading': item[heading],
+                    'snippet': snippet(item['headline']),
+                    'rank': item['rank'],
+                    'date': item['date'],
+                    'company': item['company__name'],
+                    'url': reverse(view, kwargs={'pk': item['company'],
+                                                 'slug': item['company__slug']}),
+                    })
+        results.sort(key=lambda result: (result['rank'], result['date']), reverse=True)
+        return results[:settings.CONTENT_SEARCH_LIMIT]
+
+
+class CompanyBrowseView(View):
+    """
+    List of Companies filtered by their attributes with numbers of Companies
+    for every value of each attribute (facets), served from in-process index.
+    """
+    template_name = 'reviews/company_browse.html'
+
+    def get(self, request, *args, **kwargs):
+        company_facets.refresh()
+        filters = OrderedDict()
+        for field, (param, label) in FACETS.items():
+            value = request.GET.get(param)
+            if value:
+                filters[field] = value
+        ordering = request.GET.get('sortuj')
+        if ordering not in ORDERINGS:
+            ordering = 'nazwa'
+        paginator = Paginator(company_facets.companies(filters, ordering),
+                              settings.COMPANY_BROWSE_PER_PAGE)
+        try:
+            page = paginator.page(request.GET.get('strona', 1))
+        except (EmptyPage, PageNotAnInteger):
+            raise Http404
+        return render(request, self.template_name, {
+            'facets': self.get_facets(filters),
+            'page_obj': page,
+            'orderings': [(value, self.query(sortuj=value), value == ordering)
+                          for value in ORDERINGS],
+            'previous_query': self.query(strona=page.number - 1),
+            'next_query': self.query(strona=page.number + 1),
+            })
+
+    def get_facets(self, filters):
+        """
+        Return facets for the template: values with counts and links
+        adding (or removing if selected) the value to the filters.
+        """
+        labels = {'employment': dict(Company.EMPLOYMENT)}
+        facets = []
+        for field, values in company_facets.counts(filters).items():
+            param, label = FACETS[field]
+            facets.append({
+                'label': label,
+                'values': [{
+                    'label': labels.get(field, {}).get(value, value),
+                    'count': count,
+                    'selected': filters.get(field) == value,
+                    'query': self.query(**{param: None if filters.get(field) == value
+                                           else value, 'strona': None}),
+                    } for value, count in values[:settings.COMPANY_BROWSE_FACET_VALUES]],
+                })
+        return facets
+
+    def query(self, **params):
+        """
+        Return query string of the request with params replaced (removed if None).
+        """
+        query = self.request.GET.copy()
+        for param, value in params.items():
+            query.pop(param, None)
+            if value is not None:
+                query[param] = value
+        return '?' + query.urlencode()
+
+
 class CompanyCreate(LoginRequiredMixin, CreateView):
     model = Company
     form_class = CompanyCreateForm
@@ -485,6 +715,7 @@ class CompanyCreate(LoginRequiredMixin, CreateView):
         # this is typically done in superclass, doing it here gives access to
         # newly created object
         self.object = form.save()
+        website_verifier.verify_later(self.object)
         # this is used if sent here by LinkedInAssociateView
         new_names = self.request.session.get('new_names')
         if new_names:
@@ -625,26 +856,31 @@ class TokenVerifyMixin:
         return super().form_valid(*args, **kwargs)
 
 
-class ContentCreateAbstract(LoginRequiredMixin, AjaxViewMixin, CreateView):
+class VocabularyAutocompleteMixin(AjaxViewMixin):
+    """
+    Autocomplete of position, department and location fields of item forms
+    with terms already used at the Company, most used first.
+    """
+
+    def get_options(self, term, field):
+        terms = []
+        if field in dict(Vocabulary.FIELDS):
+            terms = Vocabulary.objects.suggest(self.kwargs['id'], field, term)
+        return [{'id': None, 'label': term, 'value': term, 'slug': None}
+                for term in terms]
+
+
+class ContentCreateAbstract(LoginRequiredMixin, RateLimitMixin, VocabularyAutocompleteMixin,
+                            CreateView):
     """
     Custom CreateView class to be inherited by views creating
     Reviews and Salaries. On top of standard CreateView functionality
     allows for rendering and processing of an additional form,
     which creates or recalls correct Position object.
+    Number of submissions is limited by rate_limit (robo spam prevention).
     """
     position_form_class = PositionForm
 
-    def get_results(self, searchterm, field):
-        """
-        Return results for jQuery autocomplete. Used by AjaxViewMixin.
-        """
-        field = field + '__unaccent__icontains'
-        results = Position.objects.filter(
-            company=self.kwargs['id'],
-            **{field: searchterm},
-        )
-        return results
-
 
     def get_context_data(self, **kwargs):
         """
@@ -660,31 +896,21 @@ class ContentCreateAbstract(LoginRequiredMixin, AjaxViewMixin, CreateView):
             context['position_form'] = position_form
         return context
 
-    def get_position_instance(self):
+    @cached_property
+    def eligibility(self):
         """
-        If user has a position associated with the Company they're trying to review,
-        this Position instance should be associated with the review.
+        User's latest Position at the Company, its item and number of user's
+        items within the submissions rate limit period, in one query per request.
         """
-        position_instance = Position.objects.filter(company=self.company,
-                                                    user=self.request.user)
-        if position_instance:
-            return position_instance[position_instance.count() - 1]
+        since = timezone.now() - datetime.timedelta(seconds=self.get_rate_limit().period)
+        return Eligibility(self.form_class.Meta.model, self.request.user, self.company, since)
 
     def test_position(self):
         """
         Test if there exists a valid (less than 90 days old) item (Salary or Review) 
         for the existing position.
         """
-        if self.position:
-            #get the position and check how old it is
-            item = self.form_class.Meta.model.objects.filter(position=self.position)
-            if item:
-                item=item[0]
-                days = timezone.now() - item.date - datetime.timedelta(days=90)
-                if days.days < 0:
-                    self.days_until_next = -days.days
-                    return False
-        return True
+        return not self.eligibility.days_until_next
                 
     def two_forms(self):
         """
@@ -693,12 +919,7 @@ class ContentCreateAbstract(LoginRequiredMixin, AjaxViewMixin, CreateView):
         - they have a position but haven't submitted this type of item (salary, review)
         - they have a position, submitted item, but this item is more than 90days old
         """
-        if self.position:
-            if self.test_position:
-                return True
-            return False
-        else:
-            return True
+        return self.test_position()
 
     def get_position_form(self):
         """
@@ -707,39 +928,42 @@ class ContentCreateAbstract(LoginRequiredMixin, AjaxViewMixin, CreateView):
         """
         return self.position_form_class(**self.get_form_kwargs())
 
+    def rate_limit_fallback(self, request, since):
+        # counted over the same period by the eligibility query,
+        # before the item (self.object) of this request was saved
+        return self.eligibility.recent + (getattr(self, 'object', None) is not None)
+
     @property
     def user_can_post(self):
         """
         Return False if user already sumitted the number of items (Review or Salary)
         at the limit.
         """
-        item = self.form_class.Meta.model
-        cutoff_date = timezone.now() - datetime.timedelta(days=SUBMISSIONS_LIMIT_DAYS)
-        items_posted = item.objects.filter(position__user=self.request.user,
-                                           date__gt=cutoff_date)
-        if items_posted.count() > SUBMISSIONS_LIMIT:
+        if self.rate_limit_exceeded():
             too_many_submissions_message(self.request,
-                             self.form_class.Meta.model._meta.verbose_name_plural)
+                             self.form_class.Meta.model._meta.verbose_name_plural,
+                             self.get_rate_limit())
             return False
         return True
 
-    def get(self, request, *args, **kwargs):
+    def refusal(self):
         """
-        Check if user is allowed to post this content, ie there should
-        be only one Salary or Review for every Position.
+        Return redirect to the Company if user is not allowed to post this content,
+        ie there should be only one Salary or Review for every Position.
         """
-        self.company = get_object_or_404(Company, pk=self.kwargs['id'])
         if not self.user_can_post:
             return redirect(self.company)
-        self.position = self.get_position_instance()
         #if a content item (salary or review) already exists for this position
         #and its newer than 90 days don't allow to proceed
-        if self.position and not self.test_position():
+        if not self.test_position():
             failure_message(self.request,
                             self.form_class.Meta.model._meta.verbose_name_plural,
-                            self.days_until_next)
+                            self.eligibility.days_until_next)
             return redirect(self.company)
-        return super().get(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        self.company = get_object_or_404(Company, pk=self.kwargs['id'])
+        return self.refusal() or super().get(request, *args, **kwargs)
     
     def post(self, request, *args, **kwargs):
         """
@@ -748,7 +972,9 @@ class ContentCreateAbstract(LoginRequiredMixin, AjaxViewMixin, CreateView):
         """
         self.object = None
         self.company = get_object_or_404(Company, pk=self.kwargs['id'])
-        self.position = self.get_position_instance()
+        refusal = self.refusal()
+        if refusal:
+            return refusal
         form = self.get_form()
         # returns True if the second form is required.
         if self.two_forms():
@@ -779,10 +1005,11 @@ class ContentCreateAbstract(LoginRequiredMixin, AjaxViewMixin, CreateView):
             position = position_form.save()
             form.instance.position = position
         else:
-            form.instance.position = self.get_position_instance()
+            form.instance.position_id = self.eligibility.position_id
         # last two items are direct quotes from super(),
         # broght here only for more explicity
         self.object = form.save()
+        self.count_rate_limit()
         # give user full access to views that require contribution to the site
         self.request.user.profile.contributed = True
         self.request.user.profile.save(update_fields=['contributed'])
@@ -803,11 +1030,13 @@ class ContentCreateAbstract(LoginRequiredMixin, AjaxViewMixin, CreateView):
 
 class ReviewCreate(TokenVerifyMixin, ContentCreateAbstract):
     form_class = ReviewForm
+    rate_limit = 'review'
     template_name = "reviews/review_form.html"
 
 
 class SalaryCreate(TokenVerifyMixin, ContentCreateAbstract):
     form_class = SalaryForm
+    rate_limit = 'salary'
     template_name = "reviews/salary_form.html"
 
     def get_form_kwargs(self):
@@ -822,34 +1051,40 @@ class SalaryCreate(TokenVerifyMixin, ContentCreateAbstract):
             })
         return kwargs
 
-class InterviewCreate(LoginRequiredMixin, TokenVerifyMixin, CreateView):
+class InterviewCreate(LoginRequiredMixin, RateLimitMixin, TokenVerifyMixin,
+                      VocabularyAutocompleteMixin, CreateView):
     form_class = InterviewForm
     model = Interview
+    rate_limit = 'interview'
+    rate_limit_class = Cooldown
 
-    def get(self, request, *args, **kwargs):
+    def get_rate_limit_scope(self):
+        return self.kwargs['id']
+
+    def rate_limit_fallback(self, request, since):
+        return Interview.objects.filter(user=request.user, company_id=self.kwargs['id'],
+                                        date__gt=since).aggregate(last=Max('date'))['last']
+
+    def dispatch(self, request, *args, **kwargs):
         """
         Check if user is allowed to post, ie. has not posted Interview
         for this Company in the last 90 days.
         """
-        company = get_object_or_404(Company, pk=self.kwargs['id'])
-        item = Interview.objects.filter(company=company,
-                                        user=request.user)
-        if item:
-            item=item[0]
-            days = timezone.now() - item.date - datetime.timedelta(days=90)
-            if days.days < 0:
-                days_until_next = -days.days
-                failure_message(self.request, 'Raport z rozmowy',
-                                days_until_next)
-                return redirect(company)
-        return super().get(request, *args, **kwargs)
-        
+        if request.user.is_authenticated:
+            remaining = self.get_rate_limit().remaining(request)
+            if remaining:
+                failure_message(request, 'Raport z rozmowy', math.ceil(remaining / 86400))
+                return redirect(get_object_or_404(Company, pk=self.kwargs['id']))
+        return super().dispatch(request, *args, **kwargs)
+
     def form_valid(self, form):
         form.instance.company = get_object_or_404(
             Company, pk=self.kwargs['id'])
         form.instance.user = self.request.user
         success_message(self.request)
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        self.count_rate_limit()
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -878,23 +1113,30 @@ class LinkedinCreateProfile(LoginRequiredMixin, View):
         # companies is a list of tuples of (position.id, company_name)
         companies = request.session['companies']
         names = [name[1] for name in companies]
+        matches = Company.objects.match(names)
         candidates = {}
         new_names = []
+        associated = []
         for company in companies:
-            company_db = CompanySearchBase.get_results(self, company[1])
-            # company_db = Company.objects.filter(name__icontains=company[1])
-            if company_db.count() > 0:
+            found = matches.get(company[1])
+            if self.is_certain(found):
+                # the same company under its own name, no need to ask the user
+                position = Position.objects.get(pk=company[0])
+                position.company = found[0][0]
+                position.save(update_fields=['company'])
+                associated.append((company[1], found[0][0]))
+            elif found:
                 # candidates are companies that have database entries similar
                 # to their names, user is suggested to chose an association
                 # candidates[company_name] = (position_id, company_name,
-                # company_db)
-                candidates[company[1]] = (company[0], company[1], company_db)
+                # companies)
+                candidates[company[1]] = (company[0], company[1],
+                                          [candidate for candidate, confidence in found])
             else:
                 # new names are names that haven't been found in the database
                 # so potentially they have to be appended, user will be given
                 # an option to get redirected to a form creating new company
                 new_names.append(company)
-                pass
         request.session['new_names'] = new_names
         forms = {}
         if candidates:
@@ -910,10 +1152,22 @@ class LinkedinCreateProfile(LoginRequiredMixin, View):
             request.session['form_choices'] = form_choices
         return render(request, self.template_name,
                       {'companies': names,
+                       'associated': associated,
                        'candidates': candidates,
                        'new_names': new_names,
                        'forms': forms})
 
+    @staticmethod
+    def is_certain(found):
+        """
+        Test if the best match is confident enough and clearly better than the rest.
+        """
+        if not found:
+            return False
+        best = found[0][1]
+        return (best >= settings.COMPANY_MATCH_CONFIDENCE and
+                all(confidence < best for company, confidence in found[1:]))
+
     def post(self, request, *args, **kwargs):
         form_choices = request.session['form_choices']
         forms = {}
@@ -953,13 +1207,14 @@ class LinkedinCreateProfile(LoginRequiredMixin, View):
                           {'forms': forms})
 
 
-class ContactView(FormView):
+class ContactView(RateLimitMixin, FormView):
     """
     Display form that allows user to send a pre-formatted email to admins. If user is 
     logged-in, don't allow to edit 'from' field. To provide robo-spamming limit number 
     of sent messages to three per day.
     """
     form_class = ContactForm
+    rate_limit = 'contact'
     success_url = '/'
     template_name = 'reviews/contact.html'
 
@@ -968,6 +1223,8 @@ class ContactView(FormView):
         """
         Send user message to admins.
         """
+        if not self.check_if_can_send():
+            return redirect(self.get_success_url())
         sender = form.cleaned_data['your_email']
         if self.request.user.is_authenticated:
             #override to make sure the readonly form field hasn't been tampered with
@@ -1014,14 +1271,13 @@ class ContactView(FormView):
         return super().get_context_data(**kwargs)
 
     def record_send(self):
-        no_messages = self.request.session.get('sent_emails', 0)
-        no_messages += 1
-        self.request.session['sent_emails'] = no_messages
+        self.count_rate_limit()
 
     def check_if_can_send(self):
-        if self.request.session.get('sent_emails', 0) > 2:
+        if self.rate_limit_exceeded():
             messages.add_message(self.request, messages.INFO,
-                                 'Dostaliśmy już 3 Twoje wiadomości. Daj nam je przeczytać -:)')
+                                 'Dostaliśmy już {} Twoje wiadomości. Daj nam je przeczytać -:)'.format(
+                                     self.get_rate_limit().limit))
             return False
         return True
         
@@ -0,0 +1,156 @@
+"""
+Verification of Company websites, kept off the request path.
+
+CompanyCreateForm only compares the domain of a new website with domains
+already known (websites of Companies and domains they redirect to) and with
+cached probe results, which takes one query. The website of a created Company
+is probed by a background thread of the worker: HEAD first, GET (without
+reading the body) if the server rejects HEAD, with strict connect and read
+timeouts, following redirects. The result, cached per domain for
+WEBSITE_CHECK_CACHE_TIMEOUT, is stored on the Company: its status and the
+domain it redirects to. Companies not verified yet, or whose websites didn't
+respond, are rechecked by the verify_websites command.
+With settings.WEBSITE_VERIFY_SYNC (tests) websites are probed right away.
+"""
+import logging
+import os
+import queue
+import threading
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Company
+
+logger = logging.getLogger(__name__)
+
+# status codes of servers not supporting HEAD requests (or refusing them)
+HEAD_REJECTED = {403, 405, 501}
+
+
+def probe(url):
+    """
+    Return (whether the website responds, url after redirects).
+    """
+    timeout = (settings.WEBSITE_CONNECT_TIMEOUT, settings.WEBSITE_READ_TIMEOUT)
+    with requests.Session() as session:
+        session.max_redirects = settings.WEBSITE_MAX_REDIRECTS
+        try:
+            response = session.head(url, timeout=timeout, allow_redirects=True)
+            if response.status_code in HEAD_REJECTED:
+                response = session.get(url, timeout=timeout, allow_redirects=True, stream=True)
+                response.close()
+        except requests.exceptions.RequestException:
+            return False, url
+    return True, response.url
+
+
+def cache_key(url):
+    return 'website:{}'.format(Company.domain(url))
+
+
+def cached(url):
+    """
+    Return cached probe result of the domain of the url, None if not probed lately.
+    """
+    return cache.get(cache_key(url))
+
+
+def check(url):
+    """
+    Return probe result of the url, probed only if its domain isn't cached.
+    """
+    result = cached(url)
+    if result is None:
+        result = probe(url)
+        cache.set(cache_key(url), result, settings.WEBSITE_CHECK_CACHE_TIMEOUT)
+    return result
+
+
+def registered(url, exclude=None):
+    """
+    Return Company with website in the domain of the url, or redirecting to it.
+    """
+    name = Company.domain(url)
+    companies = Company.objects.filter(Q(website_domain=name) | Q(website_redirect=name))
+    if exclude is not None:
+        companies = companies.exclude(pk=exclude)
+    return companies.first()
+
+
+def verify(company):
+    """
+    Probe website of the Company and save the result.
+    """
+    responds, final = check(company.website)
+    final_domain = Company.domain(final)
+    company.website_redirect = final_domain if final_domain != company.website_domain else None
+    if not responds:
+        company.website_status = Company.WEBSITE_FAILED
+    elif company.website_redirect and registered(final, exclude=company.pk):
+        company.website_status = Company.WEBSITE_DUPLICATE
+    else:
+        company.website_status = Company.WEBSITE_VERIFIED
+    company.website_checked = timezone.now()
+    Company.objects.filter(pk=company.pk).update(
+        website_status=company.website_status, website_redirect=company.website_redirect,
+        website_checked=company.website_checked)
+    return company.website_status
+
+
+class WebsiteVerifier:
+    """
+    Queue of Companies whose websites are probed by a background thread.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=settings.WEBSITE_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def verify_later(self, company):
+        """
+        Probe website of the Company once the transaction saving it commits.
+        """
+        if settings.WEBSITE_VERIFY_SYNC:
+            verify(company)
+            return
+        transaction.on_commit(lambda: self.put(company.pk))
+
+    def put(self, pk):
+        with self.lock:
+            self.start()
+        try:
+            self.queue.put_nowait(pk)
+        except queue.Full:
+            # left for the verify_websites command
+            logger.warning('Website queue full, Company {} not verified'.format(pk))
+
+    def start(self):
+        """
+        Start probing thread, also in a process forked after it had been started.
+        """
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self.run, name='website-verifier', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            pk = self.queue.get()
+            try:
+                close_old_connections()
+                company = Company.objects.filter(pk=pk).first()
+                if company is not None:
+                    verify(company)
+            except Exception:
+                logger.exception('Verifying website of Company {} failed'.format(pk))
+
+
+website_verifier = WebsiteVerifier()
@@ -8,7 +8,7 @@ from social_django.models import UserSocialAuth
 
 from reviews.models import Interview, Position, Review, Salary
 
-from .models import Profile, User, Visit
+from .models import Profile, User, Visit, VisitDaily
 
 
 class SocialDjangoInline(admin.StackedInline):
@@ -141,8 +141,8 @@ class ProfileAdmin(admin.ModelAdmin):
     """
     For benefit of editors who do not have permission to edit users.
     """
-    readonly_fields = ('user', 'date_joined',
-                       'last_login', 'show_visits', 'show_unique_visits')
+    readonly_fields = ('user', 'date_joined', 'last_login', 'visited_count',
+                       'show_visits', 'show_unique_visits')
     list_display = ('user', 'sex', 'date_joined', 'last_login', 'contributed',)
     radio_fields = {'sex': admin.HORIZONTAL}
     
@@ -160,7 +160,7 @@ class ProfileAdmin(admin.ModelAdmin):
         }),
         ('Wizyty', {
             'classes': ('collapse',),
-            'fields': ('show_visits',),
+            'fields': ('visited_count', 'show_visits',),
         }),
         ('Odwiedzone firmy', {
             'classes': ('collapse',),
@@ -176,9 +176,13 @@ class ProfileAdmin(admin.ModelAdmin):
         return obj.user.last_login
     last_login.short_description = "ostatnie logowanie"
 
+    # number of latest visits listed
+    visits_shown = 100
+
     def show_visits(self, obj):
         """
         Provide visit information in no more than 2 queries (inlines suffer from n+1 issue).
+        Only latest visits are listed, read from the newest partitions.
         """
         visits = obj.visited_companies.through.objects.filter(
             user=obj).order_by(
@@ -192,9 +196,9 @@ class ProfileAdmin(admin.ModelAdmin):
                     item['company__name'],
                     item['path'],
                     str(item['ip'] or " ")]
-                   for item in visits]
+                   for item in visits[:self.visits_shown]]
         display = '\n'.join('\t'.join(i) for i in display)
-        display = 'Liczba wizyt: {}\n'.format(count) + display
+        display = 'Liczba wizyt: {} (ostatnie {})\n'.format(count, self.visits_shown) + display
         return display
     show_visits.short_description = "wizyty"
 
@@ -215,5 +219,18 @@ class VisitAdmin(admin.ModelAdmin):
     readonly_fields = ('company', 'user', 'timestamp', 'ip', 'path')
     list_display =  ( 'timestamp', 'company', 'user', 'path', 'ip')
     search_fields = ('company__name', 'company__slug', 'company__website', 'user__user__email', )
-    list_filter = ('timestamp', 'ip')
-    
+    list_select_related = ('company', 'user__user')
+    # filtering by date limits the query to partitions of the period;
+    # counting all rows would scan all of them
+    date_hierarchy = 'timestamp'
+    show_full_result_count = False
+
+
+@admin.register(VisitDaily)
+class VisitDailyAdmin(admin.ModelAdmin):
+    readonly_fields = ('company', 'day', 'visits', 'visitors')
+    list_display = ('day', 'company', 'visits', 'visitors')
+    search_fields = ('company__name',)
+    list_select_related = ('company',)
+    date_hierarchy = 'day'
+
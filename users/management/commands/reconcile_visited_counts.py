@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = ('Save visited Companies of Visits not saved by the event writer and '
+            'correct numbers of visited Companies kept on Profiles for the '
+            'contribution gate. Run daily.')
+
+    def handle(self, *args, **options):
+        corrected = Profile.objects.reconcile_visited_counts()
+        self.stdout.write('Corrected visited counts of {} profiles.'.format(corrected))
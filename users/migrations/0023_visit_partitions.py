@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 16:04
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from reviews.partitions import partition_table, unpartition_table
+
+
+FOREIGN_KEYS = [('company_id', 'reviews_company'), ('user_id', 'users_profile')]
+INDEXES = [('company_id',), ('user_id', 'timestamp')]
+
+
+def partition(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        partition_table(cursor, 'users_visit', 'timestamp', FOREIGN_KEYS, INDEXES)
+
+
+def unpartition(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        unpartition_table(cursor, 'users_visit', FOREIGN_KEYS, INDEXES)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0089_accessattempt_partitions'),
+        ('users', '0022_auto_20180416_2034'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('visits', models.PositiveIntegerField(default=0)),
+                ('visitors', models.PositiveIntegerField(default=0)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_visits', to='reviews.Company')),
+            ],
+            options={
+                'verbose_name': 'Wizyty dziennie',
+                'verbose_name_plural': 'Wizyty dziennie',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='visitdaily',
+            unique_together=set([('company', 'day')]),
+        ),
+        # monthly partitions by timestamp, requires PostgreSQL 11+
+        migrations.RunPython(partition, unpartition),
+    ]
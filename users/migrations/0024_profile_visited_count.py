@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 16:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0023_visit_partitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='visited_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Odwiedzone firmy'),
+        ),
+            # same as ProfileManager.reconcile_visited_counts
+        migrations.RunSQL(
+            'UPDATE users_profile SET visited_count = counts.visited '
+            'FROM (SELECT user_id, count(DISTINCT company_id) AS visited '
+            '      FROM users_visit GROUP BY user_id) counts '
+            'WHERE counts.user_id = users_profile.id',
+            migrations.RunSQL.noop),
+    ]
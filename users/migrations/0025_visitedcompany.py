@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.2 on 2026-10-18 17:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0090_company_website_verification'),
+        ('users', '0024_profile_visited_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitedCompany',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_visit', models.DateTimeField(editable=False)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='reviews.Company')),
+            ],
+            options={
+                'verbose_name': 'Odwiedzona firma',
+                'verbose_name_plural': 'Odwiedzone firmy',
+            },
+        ),
+        migrations.AddField(
+            model_name='visitedcompany',
+            name='profile',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visited', to='users.Profile'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='visitedcompany',
+            unique_together=set([('profile', 'company')]),
+        ),
+        # same as ProfileManager.reconcile_visited_counts
+        migrations.RunSQL(
+            'INSERT INTO users_visitedcompany (profile_id, company_id, first_visit) '
+            'SELECT user_id, company_id, min(timestamp) FROM users_visit '
+            'GROUP BY user_id, company_id',
+            migrations.RunSQL.noop),
+    ]
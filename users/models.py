@@ -1,11 +1,15 @@
 import logging
+from collections import Counter, OrderedDict
+
 from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import AbstractUser, PermissionsMixin
-from django.db import models
+from django.db import connection, models
+from django.db.models import F
 from django.utils import six, timezone
 from django.utils.translation import ugettext_lazy as _
 
+from reviews.managers import DailyRollupManager
 from reviews.models import Company
 
 
@@ -64,6 +68,31 @@ class User(AbstractUser):
     objects = UserManager()
 
 
+class ProfileManager(models.Manager):
+
+    def reconcile_visited_counts(self):
+        """
+        Save VisitedCompanies of Visits saved one by one (not by bulk_create),
+        set visited_count of Profiles to the number of their VisitedCompanies
+        where it differs. Return number of Profiles corrected.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO users_visitedcompany (profile_id, company_id, first_visit) '
+                'SELECT user_id, company_id, min(timestamp) FROM users_visit '
+                'GROUP BY user_id, company_id '
+                'ON CONFLICT (profile_id, company_id) DO NOTHING')
+            cursor.execute(
+                'UPDATE users_profile SET visited_count = counts.visited '
+                'FROM (SELECT profile.id, count(visited.id) AS visited '
+                '      FROM users_profile profile '
+                '      LEFT JOIN users_visitedcompany visited ON visited.profile_id = profile.id '
+                '      GROUP BY profile.id) counts '
+                'WHERE counts.id = users_profile.id '
+                'AND users_profile.visited_count <> counts.visited')
+            return cursor.rowcount
+
+
 class Profile(models.Model):
     year = timezone.now().year
     SEX = [('K', 'Kobieta'), ('M', 'Mężczyzna')]
@@ -97,6 +126,13 @@ class Profile(models.Model):
     linkedin_id = models.CharField(max_length= 10, null=True, blank=True)
     linkedin_url = models.URLField(null=True, blank=True)
     visited_companies = models.ManyToManyField(Company, through='Visit')
+    # number of VisitedCompanies, for the contribution gate (AccessBlocker);
+    # counted by VisitManager.bulk_create, reconciled by
+    # 'reconcile_visited_counts' command
+    visited_count = models.PositiveIntegerField('Odwiedzone firmy', default=0,
+                                                editable=False)
+
+    objects = ProfileManager()
 
     class Meta:
         verbose_name = "Profil"
@@ -106,6 +142,68 @@ class Profile(models.Model):
         return self.user.email
 
 
+class VisitedCompanyManager(models.Manager):
+
+    def add(self, pairs):
+        """
+        Save VisitedCompanies of (Profile pk, Company pk) pairs and count those
+        new to their Profiles in visited_count. Pairs already saved, also by
+        concurrent transactions, are skipped by the insert, so every Company
+        is counted once.
+        """
+        pairs = sorted(set(pairs))
+        if not pairs:
+            return
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO users_visitedcompany (profile_id, company_id, first_visit) '
+                'VALUES {} ON CONFLICT (profile_id, company_id) DO NOTHING '
+                'RETURNING profile_id'.format(', '.join(['(%s, %s, %s)'] * len(pairs))),
+                [value for pair in pairs for value in pair + (now,)])
+            new = Counter(profile for profile, in cursor.fetchall())
+        by_number = {}
+        for profile, number in sorted(new.items()):
+            by_number.setdefault(number, []).append(profile)
+        for number, profiles in by_number.items():
+            Profile.objects.filter(pk__in=profiles).update(
+                visited_count=F('visited_count') + number)
+
+
+class VisitedCompany(models.Model):
+    """
+    Company visited by a user. Unlike Visits, kept when partitions are dropped
+    (see reviews/partitions.py), so Companies visited again aren't counted
+    again in visited_count of Profile.
+    """
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE,
+                                related_name='visited')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='+')
+    first_visit = models.DateTimeField(editable=False)
+
+    objects = VisitedCompanyManager()
+
+    class Meta:
+        verbose_name = 'Odwiedzona firma'
+        verbose_name_plural = 'Odwiedzone firmy'
+        unique_together = ('profile', 'company')
+
+    def __str__(self):
+        return '{} {}'.format(self.profile_id, self.company_id)
+
+
+class VisitManager(models.Manager):
+
+    def bulk_create(self, objs, batch_size=None):
+        """
+        Save Visits and their VisitedCompanies.
+        """
+        objs = super().bulk_create(objs, batch_size=batch_size)
+        VisitedCompany.objects.add((visit.user_id, visit.company_id) for visit in objs)
+        return objs
+
+
 class Visit(models.Model):
     company = models.ForeignKey(Company)
     user = models.ForeignKey(Profile)
@@ -114,9 +212,40 @@ class Visit(models.Model):
                                       editable=False, blank=True, null=True)
     path = models.CharField(max_length=200, editable=False)
 
+    objects = VisitManager()
+
     class Meta:
         verbose_name = 'Wizyta'
         verbose_name_plural = 'Wizyty'
     
     def __str__(self):
         return self.company.name
+
+
+class VisitDaily(models.Model):
+    """
+    Number of Visits and of distinct visiting users of a Company per day,
+    kept after partitions of Visit are dropped (see reviews/partitions.py).
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='daily_visits')
+    day = models.DateField(db_index=True)
+    visits = models.PositiveIntegerField(default=0)
+    visitors = models.PositiveIntegerField(default=0)
+
+    ROLLUP_SOURCE = Visit
+    ROLLUP_KEYS = OrderedDict([('company_id', 'company_id')])
+    ROLLUP_TOTALS = OrderedDict([
+        ('visits', 'count(*)'),
+        ('visitors', 'count(DISTINCT user_id)'),
+        ])
+
+    objects = DailyRollupManager()
+
+    class Meta:
+        verbose_name = 'Wizyty dziennie'
+        verbose_name_plural = 'Wizyty dziennie'
+        unique_together = ('company', 'day')
+
+    def __str__(self):
+        return '{:%Y-%m-%d} {}: {}'.format(self.day, self.company_id, self.visits)